@@ -0,0 +1,84 @@
+# зависимости для эндпоинтов (FastAPI Depends)
+from functools import lru_cache
+from typing import Optional
+from app.repositories.backends import make_wallet_repo
+from app.repositories.topup_coalescer import TopupCoalescer
+from app.repositories.transaction_repository import TransactionRepo
+from app.repositories.wallet_repository import WalletRepo
+from app.slow_queries import SlowQuerySampler
+from database.database import get_engine
+from fastapi import Depends, Request
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+def get_db_engine() -> AsyncEngine:
+    """
+    Отдаёт общий AsyncEngine приложения.
+
+    Returns:
+        Закэшированный engine с пулом соединений.
+    """
+    return get_engine()
+
+
+def get_wallet_repo(engine: AsyncEngine = Depends(get_db_engine)) -> WalletRepo:
+    """
+    Создаёт репозиторий кошельков поверх общего engine.
+
+    Реализация (SQLAlchemy Core или asyncpg) выбирается настройкой
+    WALLET_REPO_BACKEND. Репозиторий один на процесс, чтобы кэш кошельков
+    (WALLET_CACHE_SIZE) переживал отдельные запросы.
+
+    Args:
+        engine: AsyncEngine из get_db_engine.
+
+    Returns:
+        Общий WalletRepo процесса.
+    """
+    return _shared_wallet_repo(engine)
+
+
+@lru_cache(maxsize=None)
+def _shared_wallet_repo(engine: AsyncEngine) -> WalletRepo:
+    return make_wallet_repo(engine)
+
+
+def get_topup_coalescer(request: Request) -> Optional[TopupCoalescer]:
+    """
+    Отдаёт групповой коммит пополнений, запущенный в lifespan приложения.
+
+    Args:
+        request: Текущий запрос (из него берётся app.state).
+
+    Returns:
+        TopupCoalescer или None, если групповой коммит выключен.
+    """
+    return getattr(request.app.state, "topup_coalescer", None)
+
+
+def get_slow_query_sampler(request: Request) -> Optional[SlowQuerySampler]:
+    """
+    Отдаёт сэмплер медленных запросов, подключённый в lifespan приложения.
+
+    Args:
+        request: Текущий запрос (из него берётся app.state).
+
+    Returns:
+        SlowQuerySampler или None, если сэмплер выключен.
+    """
+    return getattr(request.app.state, "slow_query_sampler", None)
+
+
+def get_transaction_repo(
+    engine: AsyncEngine = Depends(get_db_engine),
+) -> TransactionRepo:
+    """
+    Создаёт репозиторий операций поверх общего engine.
+
+    Args:
+        engine: AsyncEngine из get_db_engine.
+
+    Returns:
+        TransactionRepo для текущего запроса.
+    """
+    return TransactionRepo(engine)
@@ -10,11 +10,18 @@ uvicorn app.main:app --reload
 либо так:
 uvicorn app.main:app --reload
 """
-from typing import Optional
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
+from app.dependencies import get_db_engine, get_wallet_repo
+from app.metrics import MetricsMiddleware, instrument_engine, render
+from app.repositories.backends import make_topup_coalescer
+from app.routes.admin import router as admin_router
 from app.routes.wallets import router as wallets_router
 from app.schemas import WalletCreate, WalletResponse, WalletUpdate
-from fastapi import FastAPI, HTTPException
+from app.slow_queries import install_sampler
+from database.database import dispose_engine
+from fastapi import FastAPI, HTTPException, Response
 
 # импортируем типизацию
 # импортируем библиотеку fastapi
@@ -22,9 +29,34 @@ from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from starlette import status
 
+
+
+# жизненный цикл приложения: групповой коммит пополнений и сэмплер медленных запросов
+# (если включены) запускаются при старте; при остановке воркера дописываем накопленные
+# пополнения и закрываем пул
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    instrument_engine(get_db_engine())
+    sampler = install_sampler(get_db_engine())
+    app.state.slow_query_sampler = sampler
+    coalescer = make_topup_coalescer(get_wallet_repo(get_db_engine()))
+    app.state.topup_coalescer = coalescer
+    if coalescer is not None:
+        coalescer.start()
+    try:
+        yield
+    finally:
+        if coalescer is not None:
+            await coalescer.close()
+        if sampler is not None:
+            await sampler.close()
+        await dispose_engine()
+
+
 # импортируем наши модели из schemas
 # создаем обьект приложения
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 # создаем первый эндпоинт (домашняя страница), и даем ему логику
 # этот эндпоинт оказывается нам не нужен поэтому мы его спрячем
 # @app.get("/")
@@ -39,6 +71,20 @@ app = FastAPI()
 
 
 app.include_router(wallets_router)
+app.include_router(admin_router)
+
+
+# метрики Prometheus (SQL, пул соединений, HTTP); в Swagger не показываем
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """
+    Отдаёт метрики приложения в текстовом формате Prometheus.
+
+    Returns:
+        Response с метриками запросов SQL, пула соединений и HTTP-маршрутов.
+    """
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
 # # фейк база данных для локального хранения
 # fake_db: dict[int, WalletResponse] = {}
 
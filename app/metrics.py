@@ -0,0 +1,252 @@
+# метрики Prometheus: запросы SQL, пул соединений и HTTP-маршруты.
+# SQL - через события engine SQLAlchemy, HTTP - через ASGI middleware,
+# отдаются эндпоинтом /metrics в текстовом формате Prometheus
+from __future__ import annotations
+import hashlib
+import os
+import re
+import time
+from functools import lru_cache
+from typing import Any, Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, ExecutionContext
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import ConnectionPoolEntry, PoolProxiedConnection
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# разных шаблонов запросов в метках не больше этого числа, остальные - "other":
+# иначе динамический SQL раздул бы число временных рядов
+MAX_STATEMENT_LABELS = 500
+# шаблон длиннее обрезается и получает хэш полного текста
+MAX_STATEMENT_LENGTH = 160
+
+_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_ROWS_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+DB_STATEMENT_SECONDS = Histogram(
+    "db_statement_duration_seconds",
+    "Время выполнения SQL-запроса по шаблону",
+    ["statement"],
+    buckets=_LATENCY_BUCKETS,
+)
+DB_STATEMENT_ROWS = Histogram(
+    "db_statement_rows",
+    "Строк, затронутых или возвращённых запросом, по шаблону",
+    ["statement"],
+    buckets=_ROWS_BUCKETS,
+)
+DB_STATEMENT_ERRORS = Counter(
+    "db_statement_errors_total",
+    "SQL-запросы, завершившиеся ошибкой, по шаблону",
+    ["statement"],
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Ожидание соединения из пула (включая открытие нового соединения)",
+    buckets=_LATENCY_BUCKETS,
+)
+DB_POOL_IN_USE = Gauge(
+    "db_pool_connections_in_use",
+    "Соединения, выданные из пула",
+    multiprocess_mode="livesum",
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса по шаблону маршрута",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+
+# $1::NUMERIC(12, 2) -> ?; из типов с пробелом SQLAlchemy пишет только эти два
+_PARAM = re.compile(
+    r"\$\d+(?:::(?:TIMESTAMP WITH(?:OUT)? TIME ZONE|DOUBLE PRECISION|\w+)(?:\(\d+(?:, \d+)?\))?(?:\[\])?)?"
+)
+# VALUES (?, ?), (?, ?), ... -> VALUES (...)
+_VALUES = re.compile(r"VALUES \(\?(?:, \?)*\)(?:, \(\?(?:, \?)*\))*")
+# IN (?, ?, ?) -> IN (...)
+_IN_LIST = re.compile(r"IN \(\?(?:, \?)*\)")
+_SPACES = re.compile(r"\s+")
+
+_statement_labels: set[str] = set()
+
+
+@lru_cache(maxsize=4096)
+def normalize_statement(statement: str) -> str:
+    """
+    Превращает текст SQL в шаблон запроса.
+
+    Параметры заменяются на ?, списки VALUES и IN любой длины сворачиваются,
+    поэтому пачки разного размера попадают в один шаблон.
+
+    :param statement: Текст запроса, как его отправляет драйвер.
+    :return: Шаблон запроса.
+    """
+    text = _SPACES.sub(" ", statement).strip()
+    text = _PARAM.sub("?", text)
+    text = _VALUES.sub("VALUES (...)", text)
+    return _IN_LIST.sub("IN (...)", text)
+
+
+@lru_cache(maxsize=4096)
+def statement_label(statement: str) -> str:
+    """
+    Превращает текст SQL в метку шаблона запроса (см. normalize_statement).
+
+    :param statement: Текст запроса, как его отправляет драйвер.
+    :return: Метка для метрик (не длиннее MAX_STATEMENT_LENGTH + 9 символов) или "other".
+    """
+    text = normalize_statement(statement)
+    if len(text) > MAX_STATEMENT_LENGTH:
+        digest = hashlib.sha1(text.encode()).hexdigest()[:8]
+        text = f"{text[:MAX_STATEMENT_LENGTH]}… #{digest}"
+    if text not in _statement_labels:
+        if len(_statement_labels) >= MAX_STATEMENT_LABELS:
+            return "other"
+        _statement_labels.add(text)
+    return text
+
+
+def observe_statement(statement: str, seconds: float, rows: Optional[int]) -> None:
+    # общая точка для запросов через SQLAlchemy и через asyncpg напрямую
+    label = statement_label(statement)
+    DB_STATEMENT_SECONDS.labels(label).observe(seconds)
+    if rows is not None and rows >= 0:
+        DB_STATEMENT_ROWS.labels(label).observe(rows)
+
+
+def _before_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Optional[ExecutionContext],
+    executemany: bool,
+) -> None:
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+
+def _after_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Optional[ExecutionContext],
+    executemany: bool,
+) -> None:
+    started = conn.info["metrics_started"].pop()
+    rows = getattr(cursor, "rowcount", None)
+    observe_statement(statement, time.perf_counter() - started, rows)
+
+
+def _on_error(context: Any) -> None:
+    # ExceptionContext: after_cursor_execute при ошибке не вызывается - снимаем отметку здесь
+    conn = context.connection
+    if conn is not None:
+        stack = conn.info.get("metrics_started")
+        if stack:
+            stack.pop()
+    if context.statement is not None:
+        DB_STATEMENT_ERRORS.labels(statement_label(context.statement)).inc()
+
+
+def _on_checkout(
+    dbapi_connection: Any,
+    connection_record: ConnectionPoolEntry,
+    connection_proxy: PoolProxiedConnection,
+) -> None:
+    DB_POOL_IN_USE.inc()
+
+
+def _on_checkin(dbapi_connection: Any, connection_record: ConnectionPoolEntry) -> None:
+    DB_POOL_IN_USE.dec()
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """
+    Подключает метрики SQL и пула к engine.
+
+    Повторный вызов для того же engine ничего не делает.
+
+    :param engine: AsyncEngine приложения.
+    """
+    sync_engine = engine.sync_engine
+    if event.contains(sync_engine, "before_cursor_execute", _before_execute):
+        return
+
+    event.listen(sync_engine, "before_cursor_execute", _before_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_execute)
+    event.listen(sync_engine, "handle_error", _on_error)
+    event.listen(sync_engine, "checkout", _on_checkout)
+    event.listen(sync_engine, "checkin", _on_checkin)
+
+    # у пула нет события "начали ждать соединение", поэтому замеряем сам вызов выдачи.
+    # пул пересоздаётся только в engine.dispose() при остановке приложения
+    pool: Any = sync_engine.pool
+    do_get = pool._do_get
+
+    def timed_do_get() -> Any:
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+
+
+class MetricsMiddleware:
+    # ASGI middleware: время обработки запроса по шаблону маршрута (/wallets/{wallet_id}),
+    # а не по фактическому пути - иначе каждый id стал бы отдельным рядом
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # маршрут роутер кладёт в тот же scope; не нашёлся - один общий ряд
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path, str(status)).observe(
+                time.perf_counter() - started
+            )
+
+
+def render() -> tuple[bytes, str]:
+    """
+    Собирает метрики в текстовом формате Prometheus.
+
+    С PROMETHEUS_MULTIPROC_DIR (несколько воркеров uvicorn) метрики всех
+    воркеров суммируются из файлов в этом каталоге.
+
+    :return: Тело ответа и его Content-Type.
+    """
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,260 @@
+# архивация soft-deleted строк: кошельки и операции, удалённые раньше срока хранения,
+# переносятся из wallets/transactions в wallets_archive/transactions_archive.
+# перенос идёт небольшими порциями, каждая - отдельной короткой транзакцией: строки
+# порции выбираются FOR UPDATE SKIP LOCKED, поэтому архиватор не ждёт рабочие запросы
+# и не мешает им, а несколько архиваторов делят работу без пересечений. между
+# порциями архиватор спит сам, ограничивая долю времени, которую он нагружает базу.
+# восстановление кошелька (WalletRepo.restore) возвращает его и его операции из архива
+from __future__ import annotations
+import asyncio
+import datetime
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+from sqlalchemy import text
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from app.repositories import transaction_rollups as rollups
+
+# сколько хранить удалённое в рабочих таблицах
+ARCHIVE_RETENTION = datetime.timedelta(days=30)
+# операций в одной порции (и в одной транзакции)
+ARCHIVE_BATCH_SIZE = 1000
+# кошельков, операции которых переносятся в одной порции
+ARCHIVE_WALLET_BATCH_SIZE = 100
+# какую долю времени архиватор выполняет порции; остальное время спит
+ARCHIVE_MAX_DUTY = 0.5
+# пауза между порциями не короче этой, секунды
+ARCHIVE_MIN_PAUSE = 0.05
+
+_TX_COLUMNS = "id, wallet_id, amount, description, created_at, deleted_at"
+
+# операции, удалённые по одной (кошелёк может быть и не удалён)
+_PICK_TRANSACTIONS_SQL = """
+SELECT id FROM transactions
+WHERE deleted_at < now() - CAST(:retention AS interval)
+ORDER BY deleted_at
+LIMIT :limit
+FOR UPDATE SKIP LOCKED
+"""
+
+_PICK_WALLETS_SQL = """
+SELECT id FROM wallets
+WHERE deleted_at < now() - CAST(:retention AS interval)
+ORDER BY deleted_at, id
+LIMIT :limit
+FOR UPDATE SKIP LOCKED
+"""
+
+# все операции выбранных кошельков, удалённые и нет. OR по deleted_at даёт планировщику
+# объединить два частичных индекса по wallet_id вместо чтения всех операций кошельков
+_PICK_WALLET_TRANSACTIONS_SQL = """
+SELECT id FROM transactions
+WHERE wallet_id = ANY(:wallet_ids) AND (deleted_at IS NULL OR deleted_at IS NOT NULL)
+ORDER BY id
+LIMIT :limit
+FOR UPDATE SKIP LOCKED
+"""
+
+_MOVE_TRANSACTIONS_SQL = f"""
+WITH moved AS (
+    DELETE FROM transactions WHERE id = ANY(:ids)
+    RETURNING {_TX_COLUMNS}
+)
+INSERT INTO transactions_archive ({_TX_COLUMNS})
+SELECT {_TX_COLUMNS} FROM moved
+"""
+
+# кошелёк уходит в архив, когда в transactions не осталось его операций (внешний ключ).
+# баланс сохраняется вместе с несвёрнутыми шардами, строки hot_wallets и шардов
+# удаляются каскадом
+_MOVE_WALLETS_SQL = """
+WITH picked AS (
+    SELECT w.id, w.balance + COALESCE(
+        (SELECT sum(s.delta) FROM wallet_balance_shards s WHERE s.wallet_id = w.id), 0
+    ) AS balance
+    FROM wallets w
+    WHERE w.id = ANY(:wallet_ids)
+        AND NOT EXISTS (SELECT 1 FROM transactions t WHERE t.wallet_id = w.id)
+),
+moved AS (
+    DELETE FROM wallets w USING picked p WHERE w.id = p.id
+    RETURNING w.id, w.name, p.balance, w.created_at, w.deleted_at
+)
+INSERT INTO wallets_archive (id, name, balance, created_at, deleted_at)
+SELECT id, name, balance, created_at, deleted_at FROM moved
+"""
+
+# кошелёк возвращается с прежним id и снятой пометкой об удалении
+_RESTORE_WALLET_SQL = """
+WITH moved AS (
+    DELETE FROM wallets_archive WHERE id = :wallet_id
+    RETURNING id, name, balance, created_at
+)
+INSERT INTO wallets (id, name, balance, created_at)
+SELECT id, name, balance, created_at FROM moved
+RETURNING id, balance
+"""
+
+# возвращаются только операции, ушедшие вместе с кошельком; удалённые по одной
+# остаются в архиве
+_RESTORE_TRANSACTIONS_SQL = f"""
+WITH moved AS (
+    DELETE FROM transactions_archive WHERE wallet_id = :wallet_id AND deleted_at IS NULL
+    RETURNING {_TX_COLUMNS}
+)
+INSERT INTO transactions ({_TX_COLUMNS})
+SELECT {_TX_COLUMNS} FROM moved
+RETURNING id
+"""
+
+
+@dataclass
+class ArchiveSummary:
+    transactions: int = 0
+    wallets: int = 0
+    batches: int = 0
+
+
+async def _ids(conn: AsyncConnection, sql: str, params: dict[str, Any]) -> list[int]:
+    return [int(v) for v in (await conn.execute(text(sql), params)).scalars()]
+
+
+async def archive_transactions_batch(
+    conn: AsyncConnection,
+    retention: datetime.timedelta = ARCHIVE_RETENTION,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+) -> int:
+    """
+    Переносит в архив порцию операций, удалённых раньше срока хранения.
+
+    Удалённые операции уже вычтены из свёртки, её трогать не нужно.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param retention: Срок хранения удалённых операций.
+    :param batch_size: Сколько операций перенести.
+    :return: Сколько операций перенесено.
+    """
+    ids = await _ids(conn, _PICK_TRANSACTIONS_SQL, {"retention": retention, "limit": batch_size})
+    if ids:
+        await conn.execute(text(_MOVE_TRANSACTIONS_SQL), {"ids": ids})
+    return len(ids)
+
+
+async def archive_wallets_batch(
+    conn: AsyncConnection,
+    retention: datetime.timedelta = ARCHIVE_RETENTION,
+    wallet_batch_size: int = ARCHIVE_WALLET_BATCH_SIZE,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+) -> tuple[int, int]:
+    """
+    Переносит в архив порцию кошельков, удалённых раньше срока хранения.
+
+    Сначала переносится не больше batch_size операций выбранных кошельков
+    (не удалённые вычитаются из свёртки), затем - кошельки, у которых
+    операций не осталось. Кошелёк с большим числом операций переезжает
+    за несколько порций; если его восстановят в промежутке, WalletRepo.restore
+    вернёт и уже перенесённые операции.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param retention: Срок хранения удалённых кошельков.
+    :param wallet_batch_size: Сколько кошельков выбрать.
+    :param batch_size: Сколько их операций перенести.
+    :return: (перенесено операций, перенесено кошельков).
+    """
+    wallet_ids = await _ids(conn, _PICK_WALLETS_SQL, {"retention": retention, "limit": wallet_batch_size})
+    if not wallet_ids:
+        return 0, 0
+    ids = await _ids(conn, _PICK_WALLET_TRANSACTIONS_SQL, {"wallet_ids": wallet_ids, "limit": batch_size})
+    if ids:
+        await rollups.adjust(conn, "id = ANY(:ids)", {"ids": ids}, sign=-1)
+        await conn.execute(text(_MOVE_TRANSACTIONS_SQL), {"ids": ids})
+    moved = await conn.execute(text(_MOVE_WALLETS_SQL), {"wallet_ids": wallet_ids})
+    return len(ids), moved.rowcount
+
+
+async def restore_wallet(conn: AsyncConnection, wallet_id: int) -> Optional[RowMapping]:
+    """
+    Возвращает кошелёк из архива в wallets с прежним id, не удалённым.
+
+    Операции кошелька возвращает restore_transactions.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param wallet_id: Идентификатор кошелька.
+    :return: Строка (id, balance) или None, если в архиве кошелька нет.
+    """
+    result = await conn.execute(text(_RESTORE_WALLET_SQL), {"wallet_id": wallet_id})
+    return result.mappings().one_or_none()
+
+
+async def restore_transactions(conn: AsyncConnection, wallet_id: int) -> int:
+    """
+    Возвращает из архива операции, перенесённые вместе с кошельком, и добавляет
+    их обратно в свёртку.
+
+    :param conn: Соединение с открытой транзакцией; кошелёк уже в wallets.
+    :param wallet_id: Идентификатор кошелька.
+    :return: Сколько операций возвращено.
+    """
+    ids = await _ids(conn, _RESTORE_TRANSACTIONS_SQL, {"wallet_id": wallet_id})
+    if ids:
+        params = {"wallet_id": wallet_id, "ids": ids}
+        await rollups.adjust(conn, "wallet_id = :wallet_id AND id = ANY(:ids)", params, sign=1)
+    return len(ids)
+
+
+async def run_archiver(
+    engine: AsyncEngine,
+    retention: datetime.timedelta = ARCHIVE_RETENTION,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    wallet_batch_size: int = ARCHIVE_WALLET_BATCH_SIZE,
+    max_duty: float = ARCHIVE_MAX_DUTY,
+    min_pause: float = ARCHIVE_MIN_PAUSE,
+    on_batch: Optional[Callable[[ArchiveSummary], Any]] = None,
+) -> ArchiveSummary:
+    """
+    Переносит в архив всё, что удалено раньше срока хранения: сначала
+    операции, удалённые по одной, затем кошельки вместе с их операциями.
+
+    Каждая порция - своя транзакция. После порции архиватор спит так, чтобы
+    порции занимали не больше max_duty времени (но не меньше min_pause):
+    чем медленнее порции под нагрузкой, тем длиннее паузы. Строки, занятые
+    рабочими запросами, пропускаются и переносятся следующим запуском.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param retention: Срок хранения удалённых строк.
+    :param batch_size: Операций в одной порции.
+    :param wallet_batch_size: Кошельков в одной порции.
+    :param max_duty: Доля времени, которую архиватор выполняет порции (0, 1].
+    :param min_pause: Минимальная пауза между порциями, секунды.
+    :param on_batch: Вызывается после каждой порции с накопленными итогами (прогресс).
+    :return: Итоги запуска.
+    """
+    summary = ArchiveSummary()
+
+    async def throttle(started: float) -> None:
+        summary.batches += 1
+        if on_batch is not None:
+            on_batch(summary)
+        elapsed = time.perf_counter() - started
+        await asyncio.sleep(max(min_pause, elapsed * (1 - max_duty) / max_duty))
+
+    while True:
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            moved = await archive_transactions_batch(conn, retention, batch_size)
+        if not moved:
+            break
+        summary.transactions += moved
+        await throttle(started)
+
+    while True:
+        started = time.perf_counter()
+        async with engine.begin() as conn:
+            moved, wallets_moved = await archive_wallets_batch(conn, retention, wallet_batch_size, batch_size)
+        if not moved and not wallets_moved:
+            break
+        summary.transactions += moved
+        summary.wallets += wallets_moved
+        await throttle(started)
+    return summary
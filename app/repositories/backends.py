@@ -0,0 +1,56 @@
+# выбор реализации репозитория кошельков по настройкам
+from __future__ import annotations
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.repositories.topup_coalescer import TopupCoalescer
+from app.repositories.wallet_cache import CachedWalletRepo
+from app.repositories.wallet_repository import WalletRepo
+from app.repositories.wallet_repository_asyncpg import AsyncpgWalletRepo
+from database.database import DatabaseSettings, get_settings
+
+
+def make_wallet_repo(
+    engine: AsyncEngine,
+    settings: Optional[DatabaseSettings] = None,
+) -> WalletRepo:
+    """
+    Создаёт репозиторий кошельков с реализацией из настроек.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param settings: Настройки БД; по умолчанию - из окружения.
+    :return: WalletRepo ("core") или AsyncpgWalletRepo ("asyncpg"),
+        обёрнутый в CachedWalletRepo, если включён кэш.
+    :raises RuntimeError: Если реализация неизвестна или несовместима с режимом PgBouncer.
+    """
+    settings = settings or get_settings()
+    repo: WalletRepo
+    if settings.repo_backend == "core":
+        repo = WalletRepo(engine)
+    elif settings.repo_backend == "asyncpg":
+        if settings.pgbouncer:
+            # именованные prepared statements не переживают transaction pooling PgBouncer
+            raise RuntimeError("WALLET_REPO_BACKEND=asyncpg is not supported with DB_PGBOUNCER")
+        repo = AsyncpgWalletRepo(engine)
+    else:
+        raise RuntimeError(f"unknown WALLET_REPO_BACKEND: {settings.repo_backend!r}")
+
+    if settings.cache_size > 0:
+        repo = CachedWalletRepo(repo, max_size=settings.cache_size, ttl=settings.cache_ttl)
+    return repo
+
+
+def make_topup_coalescer(
+    repo: WalletRepo,
+    settings: Optional[DatabaseSettings] = None,
+) -> Optional[TopupCoalescer]:
+    """
+    Создаёт групповой коммит пополнений, если он включён в настройках.
+
+    :param repo: Репозиторий, в который пишутся пачки.
+    :param settings: Настройки БД; по умолчанию - из окружения.
+    :return: TopupCoalescer (ещё не запущенный) или None, если TOPUP_COALESCE_WINDOW = 0.
+    """
+    settings = settings or get_settings()
+    if settings.topup_window <= 0:
+        return None
+    return TopupCoalescer(repo, window=settings.topup_window, max_batch=settings.topup_max_batch)
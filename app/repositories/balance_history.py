@@ -0,0 +1,237 @@
+# история баланса кошелька для графиков: операции за период читаются одним
+# COPY ... TO STDOUT (FORMAT binary) и разбираются numpy.frombuffer без объекта
+# Python на строку. баланс - накопленная сумма операций (np.cumsum в копейках, без
+# ошибок округления), начальный баланс периода берётся из свёртки transaction_rollups.
+# точки прореживаются до запрошенного числа: min/max по корзинам или LTTB
+from __future__ import annotations
+import datetime
+import struct
+import time
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Any, Optional, cast
+import asyncpg
+import numpy as np
+import numpy.typing as npt
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.metrics import observe_statement
+from app.repositories import transaction_rollups as rollups
+from app.schemas import DownsampleMethod
+
+# строка COPY binary: число полей, затем (длина, значение) на каждое поле.
+# timestamp - микросекунды от 2000-01-01, сумма заранее переведена в копейки int8
+_COPY_ROW = np.dtype(
+    [
+        ("fields", ">i2"),
+        ("created_at_len", ">i4"),
+        ("created_at", ">i8"),
+        ("cents_len", ">i4"),
+        ("cents", ">i8"),
+    ]
+)
+_COPY_SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+_PG_EPOCH = np.datetime64("2000-01-01T00:00:00", "us")
+
+
+@dataclass(frozen=True)
+class BalanceSeries:
+    # операции кошелька за период: время и баланс после каждой, по возрастанию времени
+    opening: Decimal
+    timestamps: npt.NDArray[np.datetime64]
+    balance_cents: npt.NDArray[np.int64]
+
+    def __len__(self) -> int:
+        return len(self.balance_cents)
+
+    @property
+    def closing(self) -> Decimal:
+        if not len(self):
+            return self.opening
+        return Decimal(int(self.balance_cents[-1])) / 100
+
+
+def _select_query(date_from: Optional[datetime.datetime], date_to: Optional[datetime.datetime]) -> str:
+    conditions = ["wallet_id = $1", "deleted_at IS NULL"]
+    if date_from is not None:
+        conditions.append(f"created_at >= ${len(conditions)}")
+    if date_to is not None:
+        conditions.append(f"created_at < ${len(conditions)}")
+    # порядок как у остальных выборок операций: (created_at, id)
+    return (
+        "SELECT created_at, (amount * 100)::int8 FROM transactions "
+        f"WHERE {' AND '.join(conditions)} ORDER BY created_at, id"
+    )
+
+
+def _render(template: str, args: list[Any]) -> str:
+    # COPY не принимает параметры ($1 в нём не привязать), поэтому значения подставляются
+    # литералами. подставляются только int и datetime, строки пользователя сюда не попадают
+    for number in range(len(args), 0, -1):
+        value = args[number - 1]
+        if isinstance(value, datetime.datetime):
+            literal = f"'{value.isoformat(sep=' ')}'::timestamp"
+        else:
+            literal = str(int(value))
+        template = template.replace(f"${number}", literal)
+    return template
+
+
+def parse_copy(data: bytes) -> tuple[npt.NDArray[np.datetime64], npt.NDArray[np.int64]]:
+    """
+    Разбирает ответ COPY binary из двух колонок (timestamp, int8).
+
+    :param data: Весь поток COPY: заголовок, строки и завершающий -1.
+    :return: Время операций (datetime64[us]) и суммы в копейках.
+    :raises ValueError: Если поток не в формате COPY binary.
+    """
+    if not data.startswith(_COPY_SIGNATURE):
+        raise ValueError("not a binary COPY stream")
+    # сигнатура, флаги (int32) и длина расширения заголовка (int32)
+    (extension,) = struct.unpack_from(">i", data, len(_COPY_SIGNATURE) + 4)
+    start = len(_COPY_SIGNATURE) + 8 + extension
+    count = (len(data) - start - 2) // _COPY_ROW.itemsize
+    rows = np.frombuffer(data, dtype=_COPY_ROW, offset=start, count=count)
+    timestamps = _PG_EPOCH + rows["created_at"].astype("timedelta64[us]")
+    return timestamps, rows["cents"].astype(np.int64)
+
+
+async def load_series(
+    conn: AsyncConnection,
+    wallet_id: int,
+    date_from: Optional[datetime.datetime] = None,
+    date_to: Optional[datetime.datetime] = None,
+) -> BalanceSeries:
+    """
+    Читает операции кошелька за период и считает баланс после каждой.
+
+    Соединение должно быть в транзакции REPEATABLE READ: начальный баланс
+    и операции периода читаются из одного снимка.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param wallet_id: Идентификатор кошелька.
+    :param date_from: Начало периода (включительно); None - с первой операции.
+    :param date_to: Конец периода (не включительно); None - до последней операции.
+    :return: BalanceSeries.
+    """
+    # COPY получает границы литералами ::timestamp, а Postgres молча отбросил бы
+    # часовой пояс - поэтому сначала к UTC, как хранится created_at
+    if date_from is not None:
+        date_from = rollups.naive_utc(date_from)
+    if date_to is not None:
+        date_to = rollups.naive_utc(date_to)
+    opening = Decimal(0)
+    if date_from is not None:
+        opening = await rollups.net_before(conn, wallet_id, date_from)
+
+    template = _select_query(date_from, date_to)
+    query = _render(template, [value for value in (wallet_id, date_from, date_to) if value is not None])
+    chunks: list[bytes] = []
+
+    async def collect(chunk: bytes) -> None:
+        chunks.append(chunk)
+
+    raw = await conn.get_raw_connection()
+    driver = cast(asyncpg.Connection, raw.driver_connection)
+    started = time.perf_counter()
+    await driver.copy_from_query(query, output=collect, format="binary")
+    timestamps, cents = parse_copy(b"".join(chunks))
+    # COPY (SELECT ...) TO STDOUT идёт мимо событий SQLAlchemy, поэтому метрику пишем сами
+    observe_statement(template, time.perf_counter() - started, len(cents))
+
+    balance = np.cumsum(cents)
+    balance += int(opening * 100)
+    return BalanceSeries(opening, timestamps, balance)
+
+
+def downsample_minmax(values: npt.NDArray[Any], points: int) -> npt.NDArray[np.intp]:
+    """
+    Прореживание min/max: ряд делится на корзины равной длины, из каждой
+    берутся минимум и максимум, плюс первая и последняя точки ряда.
+
+    :param values: Значения ряда.
+    :param points: Сколько точек оставить (не меньше 4).
+    :return: Индексы оставленных точек по возрастанию.
+    """
+    n = len(values)
+    if n <= points:
+        return np.arange(n)
+    buckets = (points - 2) // 2
+    starts = np.linspace(0, n, buckets + 1).astype(np.intp)[:-1]
+    bucket = np.repeat(np.arange(buckets), np.diff(np.append(starts, n)))
+
+    def first_match(extremes: npt.NDArray[Any]) -> npt.NDArray[np.intp]:
+        # первая точка каждой корзины, равная её экстремуму
+        hits = np.flatnonzero(values == extremes[bucket])
+        first = np.ones(len(hits), dtype=bool)
+        first[1:] = bucket[hits[1:]] != bucket[hits[:-1]]
+        return hits[first]
+
+    picked = np.concatenate(
+        (
+            [0, n - 1],
+            first_match(np.minimum.reduceat(values, starts)),
+            first_match(np.maximum.reduceat(values, starts)),
+        )
+    )
+    return np.unique(picked)
+
+
+def downsample_lttb(x: npt.NDArray[Any], y: npt.NDArray[Any], points: int) -> npt.NDArray[np.intp]:
+    """
+    Прореживание Largest-Triangle-Three-Buckets: из каждой корзины берётся
+    точка, образующая самый большой треугольник с уже выбранной точкой
+    предыдущей корзины и средней точкой следующей.
+
+    Выбор в корзине зависит от предыдущего, поэтому цикл идёт по корзинам
+    (points итераций), а точки внутри корзины обрабатываются векторно.
+
+    :param x: Координаты точек по возрастанию (например, секунды).
+    :param y: Значения ряда.
+    :param points: Сколько точек оставить (не меньше 3).
+    :return: Индексы оставленных точек по возрастанию.
+    """
+    n = len(y)
+    if n <= points:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    # points - 2 корзины между первой и последней точкой, в каждой хотя бы одна точка
+    edges = np.linspace(1, n - 1, points - 1).astype(np.intp)
+    sizes = np.diff(edges)
+    avg_x = np.add.reduceat(x[: n - 1], edges[:-1]) / sizes
+    avg_y = np.add.reduceat(y[: n - 1], edges[:-1]) / sizes
+    # для последней корзины "следующая" - последняя точка ряда
+    avg_x = np.append(avg_x[1:], x[-1])
+    avg_y = np.append(avg_y[1:], y[-1])
+
+    picked = np.empty(points, dtype=np.intp)
+    picked[0], picked[-1] = 0, n - 1
+    a = 0
+    for b in range(points - 2):
+        lo, hi = edges[b], edges[b + 1]
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - avg_x[b]) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (avg_y[b] - ay))
+        a = lo + int(np.argmax(area))
+        picked[b + 1] = a
+    return picked
+
+
+def downsample(series: BalanceSeries, points: int, method: DownsampleMethod) -> list[dict[str, Any]]:
+    """
+    Прореживает историю баланса до points точек.
+
+    :param series: История баланса.
+    :param points: Сколько точек оставить.
+    :param method: minmax (points не меньше 4) или lttb.
+    :return: Точки {"at": datetime, "balance": Decimal} по возрастанию времени.
+    """
+    if not len(series):
+        return []
+    if method == DownsampleMethod.MINMAX:
+        picked = downsample_minmax(series.balance_cents, points)
+    else:
+        seconds = (series.timestamps - series.timestamps[0]) / np.timedelta64(1, "s")
+        picked = downsample_lttb(seconds, series.balance_cents, points)
+    moments = series.timestamps[picked].tolist()
+    cents = series.balance_cents[picked].tolist()
+    return [{"at": at, "balance": Decimal(value) / 100} for at, value in zip(moments, cents)]
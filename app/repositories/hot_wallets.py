@@ -0,0 +1,167 @@
+# режим "горячих" кошельков: баланс = wallets.balance + сумма шардов wallet_balance_shards.
+# пополнение берёт блокировку одной случайной строки шарда, а не строки кошелька,
+# поэтому параллельные пополнения одного кошелька почти не ждут друг друга.
+# списание идёт по wallets.balance под блокировкой кошелька; если его не хватает,
+# шарды сначала сворачиваются в wallets.balance. так wallets.balance не уходит в минус,
+# а шарды содержат только пополнения (сумма >= 0)
+from __future__ import annotations
+import random
+from decimal import Decimal
+from typing import Any, Optional
+from sqlalchemy import and_, exists, func, literal, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql.elements import ColumnElement
+from app.repositories.wallet_stats import WalletStatsDelta
+from database.database import hot_wallets, wallet_balance_shards, wallets
+
+# как часто процесс перечитывает список горячих кошельков, секунды
+HOT_SET_TTL = 5.0
+
+shards = wallet_balance_shards
+
+
+def balance_with_shards() -> ColumnElement[Any]:
+    # баланс с учётом ещё не свёрнутых шардов; у обычного кошелька шардов нет
+    shard_sum = (
+        select(func.coalesce(func.sum(shards.c.delta), 0))
+        .where(shards.c.wallet_id == wallets.c.id)
+        .scalar_subquery()
+    )
+    return wallets.c.balance + shard_sum
+
+
+def effective_balance() -> ColumnElement[Any]:
+    # то же, колонкой "balance" для выдачи
+    return balance_with_shards().label("balance")
+
+
+def is_hot() -> ColumnElement[bool]:
+    # кошелёк в режиме шардов. шарды содержат только пополнения, поэтому у остальных
+    # кошельков баланс с шардами равен wallets.balance и сортировка по нему идёт по индексу
+    return exists().where(hot_wallets.c.wallet_id == wallets.c.id)
+
+
+def effective_columns() -> list[ColumnElement[Any]]:
+    # колонки wallets в том же порядке, но balance - с шардами
+    return [effective_balance() if c is wallets.c.balance else c for c in wallets.c]
+
+
+def active_shard_sum() -> ColumnElement[Any]:
+    # сумма несвёрнутых пополнений по всем не удалённым кошелькам (дополняет wallet_stats)
+    return (
+        select(func.coalesce(func.sum(shards.c.delta), 0))
+        .select_from(shards.join(wallets, wallets.c.id == shards.c.wallet_id))
+        .where(wallets.c.deleted_at.is_(None))
+        .scalar_subquery()
+    )
+
+
+async def load_hot_set(conn: AsyncConnection) -> dict[int, int]:
+    rows = await conn.execute(select(hot_wallets.c.wallet_id, hot_wallets.c.shards))
+    return {int(r.wallet_id): int(r.shards) for r in rows}
+
+
+async def credit_shard(conn: AsyncConnection, wallet_id: int, shard_count: int, delta: Decimal) -> bool:
+    # False - шарда нет (режим выключен) или кошелёк удалён: пополнять надо обычным путём
+    shard = random.randrange(shard_count)
+    stmt = (
+        update(shards)
+        .where(
+            and_(
+                shards.c.wallet_id == wallet_id,
+                shards.c.shard == shard,
+                exists().where(and_(wallets.c.id == wallet_id, wallets.c.deleted_at.is_(None))),
+            )
+        )
+        .values(delta=shards.c.delta + delta)
+        .returning(shards.c.wallet_id)
+    )
+    return (await conn.execute(stmt)).first() is not None
+
+
+async def fold_wallet(
+    conn: AsyncConnection,
+    wallet_id: int,
+    stats: WalletStatsDelta,
+    include_deleted: bool = False,
+) -> Optional[Decimal]:
+    # переносит шарды кошелька в wallets.balance. порядок блокировок: строка кошелька,
+    # затем строки шардов - пополнения держат только шард и ничего не ждут, deadlock'а нет.
+    # возвращает новый wallets.balance или None, если кошелька нет
+    stmt = select(wallets.c.balance, wallets.c.deleted_at).where(wallets.c.id == wallet_id)
+    if not include_deleted:
+        stmt = stmt.where(wallets.c.deleted_at.is_(None))
+    wallet = (await conn.execute(stmt.with_for_update())).first()
+    if wallet is None:
+        return None
+
+    locked = (
+        select(shards.c.shard, shards.c.delta)
+        .where(and_(shards.c.wallet_id == wallet_id, shards.c.delta != 0))
+        .with_for_update()
+        .cte("locked")
+    )
+    moved_rows = await conn.execute(
+        update(shards)
+        .where(and_(shards.c.wallet_id == wallet_id, shards.c.shard == locked.c.shard))
+        .values(delta=shards.c.delta - locked.c.delta)
+        .returning(locked.c.delta)
+    )
+    moved = sum((r[0] for r in moved_rows), Decimal(0))
+    if not moved:
+        return wallet.balance
+
+    new_balance = (
+        await conn.execute(
+            update(wallets)
+            .where(wallets.c.id == wallet_id)
+            .values(balance=wallets.c.balance + moved)
+            .returning(wallets.c.balance)
+        )
+    ).scalar_one()
+    if wallet.deleted_at is None:
+        stats.changed(wallet_id, wallet.balance, new_balance)
+    return new_balance
+
+
+async def enable(conn: AsyncConnection, wallet_id: int, shard_count: int) -> bool:
+    # False - кошелька нет или он удалён
+    # повторный вызов меняет число шардов; лишние старые шарды остаются в сумме
+    # баланса, но новых пополнений не получают и обнулятся при свёртке
+    wallet = (
+        await conn.execute(
+            select(wallets.c.id)
+            .where(and_(wallets.c.id == wallet_id, wallets.c.deleted_at.is_(None)))
+            .with_for_update()
+        )
+    ).first()
+    if wallet is None:
+        return False
+    await conn.execute(
+        pg_insert(hot_wallets)
+        .values(wallet_id=wallet_id, shards=shard_count)
+        .on_conflict_do_update(index_elements=[hot_wallets.c.wallet_id], set_={"shards": shard_count})
+    )
+    await conn.execute(
+        pg_insert(shards)
+        .from_select(
+            ["wallet_id", "shard"],
+            select(literal(wallet_id), func.generate_series(0, shard_count - 1)),
+        )
+        .on_conflict_do_nothing()
+    )
+    return True
+
+
+async def disable(conn: AsyncConnection, wallet_id: int, stats: WalletStatsDelta) -> bool:
+    # сначала свёртка (под блокировкой кошелька и шардов), затем удаление шардов.
+    # пополнение из процесса со старым списком горячих кошельков не найдёт шард
+    # и пройдёт обычным путём
+    if await fold_wallet(conn, wallet_id, stats, include_deleted=True) is None:
+        return False
+    await conn.execute(shards.delete().where(shards.c.wallet_id == wallet_id))
+    res = await conn.execute(
+        hot_wallets.delete().where(hot_wallets.c.wallet_id == wallet_id).returning(hot_wallets.c.wallet_id)
+    )
+    return res.first() is not None
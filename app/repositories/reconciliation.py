@@ -0,0 +1,371 @@
+# сверка балансов кошельков с леджером: wallets.balance плюс несвёрнутые шарды
+# горячего кошелька должен равняться сумме его не удалённых операций в transactions.
+# пространство id делится на чанки, чанки проверяются параллельно, каждый - одним
+# коротким снимком без блокировок. готовые чанки и расхождения пишутся в
+# reconciliation_chunks/reconciliation_drifts, поэтому прогон можно продолжить.
+# строки в transactions сейчас пишет только transfer: пополнения (update_balance_if_enough,
+# apply_deltas_batch, шарды горячих кошельков, коалесер) в леджер не попадают, и любой
+# пополненный кошелёк расходится с леджером. поэтому безопасно исправлять только в
+# режиме LEDGER; BALANCE требует force и не уменьшает баланс до суммы леджера
+from __future__ import annotations
+import asyncio
+from dataclasses import dataclass
+from decimal import Decimal
+from enum import Enum
+from typing import Any, Callable, Optional
+from sqlalchemy import and_, func, insert, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from app.repositories import hot_wallets as hot
+from app.repositories.wallet_stats import WalletStatsDelta
+from database.database import (
+    reconciliation_chunks,
+    reconciliation_drifts,
+    reconciliation_runs,
+    transactions,
+    wallets,
+)
+
+# кошельков в одном чанке: один запрос сверки и одна короткая транзакция отчёта
+RECONCILE_CHUNK_SIZE = 10_000
+# описание корректирующей операции при repair=ledger
+ADJUSTMENT_DESCRIPTION = "reconciliation adjustment"
+
+
+class RepairMode(str, Enum):
+    BALANCE = "balance"  # wallets.balance := сумма леджера, только если она больше баланса
+    LEDGER = "ledger"  # в леджер дописывается операция на разницу, баланс не меняется
+
+
+# баланс (с шардами) и сумма леджера по кошелькам чанка, в одном снимке: перевод меняет
+# wallets и transactions одной транзакцией, поэтому незавершённые переводы не видны
+_CHECK_SQL = """
+SELECT w.id, w.balance + COALESCE(s.delta, 0) AS balance, COALESCE(t.total, 0) AS ledger
+FROM wallets w
+LEFT JOIN (
+    SELECT wallet_id, sum(amount) AS total
+    FROM transactions
+    WHERE wallet_id >= :lo AND wallet_id < :hi AND deleted_at IS NULL
+    GROUP BY wallet_id
+) t ON t.wallet_id = w.id
+LEFT JOIN (
+    SELECT wallet_id, sum(delta) AS delta
+    FROM wallet_balance_shards
+    WHERE wallet_id >= :lo AND wallet_id < :hi
+    GROUP BY wallet_id
+) s ON s.wallet_id = w.id
+WHERE w.id >= :lo AND w.id < :hi
+    AND w.balance + COALESCE(s.delta, 0) <> COALESCE(t.total, 0)
+ORDER BY w.id
+"""
+
+
+@dataclass(frozen=True)
+class ReconcileRun:
+    id: int
+    chunk_size: int
+    first_wallet_id: int
+    last_wallet_id: int
+    repair: Optional[RepairMode]
+
+    def chunk_starts(self) -> range:
+        # границы чанков кратны chunk_size: при продолжении прогона они совпадают
+        first = self.first_wallet_id - self.first_wallet_id % self.chunk_size
+        return range(first, self.last_wallet_id + 1, self.chunk_size)
+
+
+@dataclass(frozen=True)
+class ChunkResult:
+    chunk_start: int
+    chunk_end: int
+    checked: int
+    drifted: int
+    repaired: int
+
+
+@dataclass(frozen=True)
+class ReconcileSummary:
+    run_id: int
+    chunks: int
+    total_chunks: int
+    checked: int
+    drifted: int
+    repaired: int
+    finished: bool
+
+
+async def start_run(
+    engine: AsyncEngine,
+    chunk_size: int = RECONCILE_CHUNK_SIZE,
+    repair: Optional[RepairMode] = None,
+    force: bool = False,
+) -> ReconcileRun:
+    """
+    Создаёт прогон сверки по текущему диапазону id кошельков.
+
+    Кошельки, созданные после старта, в прогон не входят.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param chunk_size: Кошельков в одном чанке.
+    :param repair: Способ исправления расхождений; None - только отчёт.
+    :param force: Явное согласие на repair=BALANCE (меняет wallets.balance).
+    :return: Новый прогон.
+    :raises ValueError: Если chunk_size меньше 1 или repair=BALANCE без force.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be positive")
+    if repair == RepairMode.BALANCE and not force:
+        raise ValueError("repair=balance overwrites wallet balances and requires force")
+    async with engine.begin() as conn:
+        first, last = (await conn.execute(select(func.min(wallets.c.id), func.max(wallets.c.id)))).one()
+        run_id = (
+            await conn.execute(
+                insert(reconciliation_runs)
+                .values(
+                    chunk_size=chunk_size,
+                    first_wallet_id=first or 0,
+                    last_wallet_id=last or -1,
+                    repair=repair.value if repair else None,
+                )
+                .returning(reconciliation_runs.c.id)
+            )
+        ).scalar_one()
+    return ReconcileRun(run_id, chunk_size, first or 0, last or -1, repair)
+
+
+async def load_run(engine: AsyncEngine, run_id: int) -> Optional[ReconcileRun]:
+    """
+    Читает параметры прогона для продолжения.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param run_id: Идентификатор прогона.
+    :return: Прогон или None, если его нет.
+    """
+    r = reconciliation_runs.c
+    async with engine.connect() as conn:
+        row = (
+            await conn.execute(
+                select(r.id, r.chunk_size, r.first_wallet_id, r.last_wallet_id, r.repair).where(r.id == run_id)
+            )
+        ).first()
+    if row is None:
+        return None
+    return ReconcileRun(
+        row.id,
+        row.chunk_size,
+        row.first_wallet_id,
+        row.last_wallet_id,
+        RepairMode(row.repair) if row.repair else None,
+    )
+
+
+async def _record_drift(
+    conn: AsyncConnection,
+    run_id: int,
+    wallet_id: int,
+    balance: Decimal,
+    ledger: Decimal,
+    repaired: bool,
+) -> None:
+    # при продолжении прогона чанк проверяется заново: исправленный кошелёк уже
+    # не расходится, а отметка о найденном и исправленном расхождении остаётся
+    stmt = pg_insert(reconciliation_drifts).values(
+        run_id=run_id, wallet_id=wallet_id, balance=balance, ledger=ledger, repaired=repaired
+    )
+    await conn.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[reconciliation_drifts.c.run_id, reconciliation_drifts.c.wallet_id],
+            set_={
+                "balance": stmt.excluded.balance,
+                "ledger": stmt.excluded.ledger,
+                "repaired": stmt.excluded.repaired,
+            },
+            where=reconciliation_drifts.c.repaired.is_(False),
+        )
+    )
+
+
+async def _repair_wallet(engine: AsyncEngine, run_id: int, wallet_id: int, mode: RepairMode) -> bool:
+    # своя короткая транзакция на кошелёк: строка кошелька блокируется, шарды горячего
+    # кошелька сворачиваются, и под блокировкой расхождение пересчитывается заново.
+    # перевод берёт ту же блокировку, поэтому сумма леджера кошелька не меняется
+    async with engine.begin() as conn:
+        stats = WalletStatsDelta()
+        balance = await hot.fold_wallet(conn, wallet_id, stats, include_deleted=True)
+        if balance is None:
+            return False
+        ledger = (
+            await conn.execute(
+                select(func.coalesce(func.sum(transactions.c.amount), 0)).where(
+                    and_(transactions.c.wallet_id == wallet_id, transactions.c.deleted_at.is_(None))
+                )
+            )
+        ).scalar_one()
+        if balance == ledger:
+            await stats.apply(conn)
+            return False
+        if mode == RepairMode.BALANCE and ledger < balance:
+            # пополнения в леджер не пишутся: уменьшение баланса до суммы леджера стёрло бы
+            # настоящие зачисления (и могло бы сделать баланс отрицательным). только в отчёт
+            await stats.apply(conn)
+            await _record_drift(conn, run_id, wallet_id, balance, ledger, repaired=False)
+            return False
+
+        if mode == RepairMode.BALANCE:
+            deleted_at = (
+                await conn.execute(
+                    update(wallets)
+                    .where(wallets.c.id == wallet_id)
+                    .values(balance=ledger)
+                    .returning(wallets.c.deleted_at)
+                )
+            ).scalar_one()
+            if deleted_at is None:
+                stats.changed(wallet_id, balance, ledger)
+        else:
+            await conn.execute(
+                insert(transactions).values(
+                    wallet_id=wallet_id, amount=balance - ledger, description=ADJUSTMENT_DESCRIPTION
+                )
+            )
+        await stats.apply(conn)
+        await _record_drift(conn, run_id, wallet_id, balance, ledger, repaired=True)
+        return True
+
+
+async def reconcile_chunk(engine: AsyncEngine, run: ReconcileRun, chunk_start: int) -> ChunkResult:
+    """
+    Сверяет кошельки с id в [chunk_start, chunk_start + chunk_size).
+
+    Сверка - один запрос в снимке REPEATABLE READ только для чтения, без
+    блокировок. Исправления (если включены) идут по кошельку в своей транзакции.
+    Отметка о готовом чанке пишется последней, вместе с неисправленными
+    расхождениями.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param run: Прогон.
+    :param chunk_start: Начало чанка.
+    :return: Итоги чанка.
+    """
+    chunk_end = chunk_start + run.chunk_size
+    bounds = {"lo": chunk_start, "hi": chunk_end}
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+        async with conn.begin():
+            checked = (
+                await conn.execute(
+                    select(func.count()).where(and_(wallets.c.id >= chunk_start, wallets.c.id < chunk_end))
+                )
+            ).scalar_one()
+            drifts = (await conn.execute(text(_CHECK_SQL), bounds)).all()
+
+    repaired: set[int] = set()
+    if run.repair is not None:
+        for row in drifts:
+            if await _repair_wallet(engine, run.id, row.id, run.repair):
+                repaired.add(row.id)
+
+    async with engine.begin() as conn:
+        for row in drifts:
+            if row.id not in repaired:
+                await _record_drift(conn, run.id, row.id, row.balance, row.ledger, repaired=False)
+        await conn.execute(
+            pg_insert(reconciliation_chunks)
+            .values(
+                run_id=run.id,
+                chunk_start=chunk_start,
+                checked=checked,
+                drifted=len(drifts),
+                repaired=len(repaired),
+            )
+            .on_conflict_do_nothing()
+        )
+    return ChunkResult(chunk_start, chunk_end, checked, len(drifts), len(repaired))
+
+
+async def summarize(engine: AsyncEngine, run: ReconcileRun) -> ReconcileSummary:
+    # итоги по готовым чанкам; годится и для прерванного прогона
+    c = reconciliation_chunks.c
+    async with engine.connect() as conn:
+        chunks, checked, drifted, repaired = (
+            await conn.execute(
+                select(
+                    func.count(),
+                    func.coalesce(func.sum(c.checked), 0),
+                    func.coalesce(func.sum(c.drifted), 0),
+                    func.coalesce(func.sum(c.repaired), 0),
+                ).where(c.run_id == run.id)
+            )
+        ).one()
+        finished_at = (
+            await conn.execute(select(reconciliation_runs.c.finished_at).where(reconciliation_runs.c.id == run.id))
+        ).scalar_one()
+    total = len(run.chunk_starts())
+    return ReconcileSummary(run.id, chunks, total, checked, drifted, repaired, finished_at is not None)
+
+
+async def run_reconciliation(
+    engine: AsyncEngine,
+    run: ReconcileRun,
+    concurrency: int = 4,
+    on_chunk: Optional[Callable[[ChunkResult], Any]] = None,
+) -> ReconcileSummary:
+    """
+    Проверяет все ещё не проверенные чанки прогона.
+
+    Одновременно идёт не больше concurrency чанков, то есть не больше
+    concurrency соединений; пул engine должен их вмещать. Прерванный прогон
+    продолжается повторным вызовом: готовые чанки пропускаются.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param run: Прогон (start_run или load_run).
+    :param concurrency: Сколько чанков проверять одновременно.
+    :param on_chunk: Вызывается после каждого готового чанка (прогресс).
+    :return: Итоги прогона.
+    """
+    async with engine.connect() as conn:
+        done = set(
+            (
+                await conn.execute(
+                    select(reconciliation_chunks.c.chunk_start).where(reconciliation_chunks.c.run_id == run.id)
+                )
+            ).scalars()
+        )
+    # общий итератор: следующий чанк берёт освободившийся воркер
+    pending = iter([start for start in run.chunk_starts() if start not in done])
+
+    async def worker() -> None:
+        for chunk_start in pending:
+            result = await reconcile_chunk(engine, run, chunk_start)
+            if on_chunk is not None:
+                on_chunk(result)
+
+    await asyncio.gather(*(worker() for _ in range(max(concurrency, 1))))
+
+    async with engine.begin() as conn:
+        await conn.execute(
+            update(reconciliation_runs)
+            .where(and_(reconciliation_runs.c.id == run.id, reconciliation_runs.c.finished_at.is_(None)))
+            .values(finished_at=func.now())
+        )
+    return await summarize(engine, run)
+
+
+async def list_drifts(engine: AsyncEngine, run_id: int, limit: Optional[int] = 100) -> list[dict[str, Any]]:
+    """
+    Расхождения, найденные прогоном, по возрастанию id кошелька.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param run_id: Идентификатор прогона.
+    :param limit: Максимальное количество строк; None - все.
+    :return: Строки wallet_id, balance, ledger, repaired.
+    """
+    d = reconciliation_drifts.c
+    stmt = (
+        select(d.wallet_id, d.balance, d.ledger, d.repaired)
+        .where(d.run_id == run_id)
+        .order_by(d.wallet_id)
+        .limit(limit)
+    )
+    async with engine.connect() as conn:
+        return [dict(row) for row in (await conn.execute(stmt)).mappings()]
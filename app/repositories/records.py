@@ -0,0 +1,89 @@
+# компактные записи строк для больших выборок: неизменяемые dataclass со __slots__.
+# запись кошелька занимает ~70 байт против ~230 у dict из 5 ключей (значения полей
+# одни и те же), поэтому выгрузки и задачи на сотни тысяч строк держат в памяти
+# в разы меньше. схемы ответа (WalletResponse, TransactionResponse) принимают их
+# напрямую (from_attributes)
+from __future__ import annotations
+import datetime
+from dataclasses import dataclass, fields
+from decimal import Decimal
+from operator import itemgetter
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar, Union
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import Executable
+
+
+@dataclass(frozen=True, slots=True)
+class WalletRecord:
+    id: int
+    name: str
+    balance: Decimal
+    created_at: datetime.datetime
+    deleted_at: Optional[datetime.datetime]
+
+
+@dataclass(frozen=True, slots=True)
+class TransactionRecord:
+    id: int
+    wallet_id: int
+    amount: Decimal
+    description: Optional[str]
+    created_at: datetime.datetime
+    deleted_at: Optional[datetime.datetime]
+
+
+RecordT = TypeVar("RecordT", bound=Union[WalletRecord, TransactionRecord])
+
+
+def record_factory(record: type[RecordT], keys: list[str]) -> Callable[[Any], RecordT]:
+    """
+    Строит конструктор записи из строки результата.
+
+    Позиции полей ищутся один раз на результат, поэтому порядок колонок
+    в запросе может отличаться от порядка полей записи.
+
+    :param record: Класс записи.
+    :param keys: Имена колонок результата.
+    :return: Функция строка -> запись.
+    :raises ValueError: Если в результате нет колонки для поля записи.
+    """
+    pick = itemgetter(*(keys.index(field.name) for field in fields(record)))
+    return lambda row: record(*pick(row))
+
+
+async def fetch_records(engine: AsyncEngine, stmt: Executable, record: type[RecordT]) -> list[RecordT]:
+    """
+    Выполняет запрос и возвращает все строки записями.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param stmt: Запрос.
+    :param record: Класс записи.
+    :return: Список записей.
+    """
+    async with engine.connect() as conn:
+        res = await conn.execute(stmt)
+        make = record_factory(record, list(res.keys()))
+        return [make(row) for row in res]
+
+
+async def iter_records(
+    engine: AsyncEngine,
+    stmt: Executable,
+    record: type[RecordT],
+    fetch_size: int,
+) -> AsyncIterator[RecordT]:
+    """
+    Читает строки серверным курсором и отдаёт их записями.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param stmt: Запрос.
+    :param record: Класс записи.
+    :param fetch_size: Сколько строк забирать из курсора за раз.
+    :return: Асинхронный генератор записей.
+    """
+    async with engine.connect() as conn:
+        res = await conn.stream(stmt.execution_options(yield_per=fetch_size))
+        make = record_factory(record, list(res.keys()))
+        async for partition in res.partitions():
+            for row in partition:
+                yield make(row)
@@ -0,0 +1,373 @@
+# репозиторий операций (леджер) кошельков
+from __future__ import annotations
+import datetime
+from typing import Any, AsyncIterator, Optional, Iterable, cast
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.sql import Executable, Select
+from sqlalchemy.sql.elements import ColumnElement
+from sqlalchemy.engine import CursorResult, Result
+from sqlalchemy import select, insert, update, and_, func
+from app.schemas import DownsampleMethod, RollupPeriod, TransactionType
+from database.database import transactions
+from app.repositories import balance_history, transaction_rollups as rollups
+from app.repositories.records import TransactionRecord, fetch_records, iter_records
+from app.repositories.wallet_repository import DEFAULT_FETCH_SIZE
+
+
+class TransactionRepo:
+    _engine: AsyncEngine
+
+    def __init__(self, engine: AsyncEngine) -> None:
+        self._engine = engine
+
+    @staticmethod
+    def _row_to_dict(row: Any) -> dict[str, Any]:
+        return dict(row)
+
+    @staticmethod
+    def _rows_to_dicts(keys: list[str], rows: Iterable[Any]) -> list[dict[str, Any]]:
+        # как в WalletRepo: имена колонок один раз на результат, а не через RowMapping
+        return [dict(zip(keys, row)) for row in rows]
+
+    @staticmethod
+    def _not_deleted() -> ColumnElement[bool]:
+        return transactions.c.deleted_at.is_(None)
+
+    @staticmethod
+    def _sign_condition(tx_type: TransactionType) -> ColumnElement[bool]:
+        # условие должно совпадать с предикатом частичного индекса,
+        # иначе планировщик не сможет его использовать
+        if tx_type == TransactionType.INCOME:
+            return transactions.c.amount > 0
+        return transactions.c.amount < 0
+
+    async def _iter_rows(self, stmt: Executable, fetch_size: int) -> AsyncIterator[dict[str, Any]]:
+        # stream() открывает серверный курсор: в памяти не больше fetch_size строк за раз
+        async with self._engine.connect() as conn:
+            res = await conn.stream(stmt.execution_options(yield_per=fetch_size))
+            keys = list(res.keys())
+            async for partition in res.partitions():
+                for row in self._rows_to_dicts(keys, partition):
+                    yield row
+
+    async def _fetch_one(self, stmt: Executable) -> Optional[dict[str, Any]]:
+        async with self._engine.connect() as conn:
+            res: Result = await conn.execute(stmt)
+            row = res.mappings().one_or_none()
+            return self._row_to_dict(row) if row else None
+
+    async def _fetch_all(self, stmt: Executable) -> list[dict[str, Any]]:
+        async with self._engine.connect() as conn:
+            res: Result = await conn.execute(stmt)
+            return self._rows_to_dicts(list(res.keys()), res.all())
+
+    async def _exec_rowcount(self, stmt: Executable) -> int:
+        async with self._engine.begin() as conn:
+            res: Result = await conn.execute(stmt)
+            return int(cast(CursorResult[Any], res).rowcount or 0)
+
+    async def _exec_one(self, stmt: Executable) -> dict[str, Any]:
+        async with self._engine.begin() as conn:
+            res: Result = await conn.execute(stmt)
+            row = res.mappings().one()
+            return self._row_to_dict(row)
+
+    async def create(
+        self,
+        wallet_id: int,
+        amount: float,
+        description: Optional[str] = None,
+    ) -> dict[str, Any]:
+        stmt = (
+            insert(transactions)
+            .values(wallet_id=wallet_id, amount=amount, description=description)
+            .returning(*transactions.c)
+        )
+        return await self._exec_one(stmt)
+
+    async def create_batch(
+        self, rows: Iterable[tuple[int, float, Optional[str]]]
+    ) -> int:
+        payload = [
+            {"wallet_id": wallet_id, "amount": amount, "description": description}
+            for wallet_id, amount, description in rows
+        ]
+        if not payload:
+            return 0
+
+        # executemany: параметры не упираются в лимит bind-параметров одного запроса
+        async with self._engine.begin() as conn:
+            await conn.execute(insert(transactions), payload)
+
+        return len(payload)
+
+    async def get_by_id(
+        self, transaction_id: int, include_deleted: bool = False
+    ) -> Optional[dict[str, Any]]:
+        stmt = select(transactions).where(transactions.c.id == transaction_id)
+        if not include_deleted:
+            stmt = stmt.where(self._not_deleted())
+        return await self._fetch_one(stmt)
+
+    def _wallet_stmt(
+        self,
+        wallet_id: int,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+        tx_type: Optional[TransactionType] = None,
+        limit: Optional[int] = None,
+        desc: bool = True,
+        include_deleted: bool = False,
+    ) -> Select[Any]:
+        # date_from включительно, date_to не включительно: [date_from, date_to)
+        conditions: list[ColumnElement[bool]] = [transactions.c.wallet_id == wallet_id]
+        if not include_deleted:
+            conditions.append(self._not_deleted())
+        if date_from is not None:
+            conditions.append(transactions.c.created_at >= date_from)
+        if date_to is not None:
+            conditions.append(transactions.c.created_at < date_to)
+        if tx_type is not None:
+            conditions.append(self._sign_condition(tx_type))
+
+        stmt = select(transactions).where(and_(*conditions))
+        if desc:
+            stmt = stmt.order_by(transactions.c.created_at.desc(), transactions.c.id.desc())
+        else:
+            stmt = stmt.order_by(transactions.c.created_at.asc(), transactions.c.id.asc())
+        if limit is not None:
+            stmt = stmt.limit(limit)
+        return stmt
+
+    async def list_by_wallet(
+        self,
+        wallet_id: int,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+        tx_type: Optional[TransactionType] = None,
+        limit: Optional[int] = 100,
+        desc: bool = True,
+        include_deleted: bool = False,
+    ) -> list[dict[str, Any]]:
+        stmt = self._wallet_stmt(
+            wallet_id,
+            date_from=date_from,
+            date_to=date_to,
+            tx_type=tx_type,
+            limit=limit,
+            desc=desc,
+            include_deleted=include_deleted,
+        )
+        return await self._fetch_all(stmt)
+
+    def iter_by_wallet(
+        self,
+        wallet_id: int,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+        tx_type: Optional[TransactionType] = None,
+        desc: bool = True,
+        include_deleted: bool = False,
+        fetch_size: int = DEFAULT_FETCH_SIZE,
+    ) -> AsyncIterator[dict[str, Any]]:
+        stmt = self._wallet_stmt(
+            wallet_id,
+            date_from=date_from,
+            date_to=date_to,
+            tx_type=tx_type,
+            desc=desc,
+            include_deleted=include_deleted,
+        )
+        return self._iter_rows(stmt, fetch_size)
+
+    async def list_records_by_wallet(
+        self,
+        wallet_id: int,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+        tx_type: Optional[TransactionType] = None,
+        limit: Optional[int] = 100,
+        desc: bool = True,
+        include_deleted: bool = False,
+    ) -> list[TransactionRecord]:
+        # как list_by_wallet, но строки - компактные TransactionRecord, а не dict
+        stmt = self._wallet_stmt(
+            wallet_id,
+            date_from=date_from,
+            date_to=date_to,
+            tx_type=tx_type,
+            limit=limit,
+            desc=desc,
+            include_deleted=include_deleted,
+        )
+        return await fetch_records(self._engine, stmt, TransactionRecord)
+
+    def iter_records_by_wallet(
+        self,
+        wallet_id: int,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+        tx_type: Optional[TransactionType] = None,
+        desc: bool = True,
+        include_deleted: bool = False,
+        fetch_size: int = DEFAULT_FETCH_SIZE,
+    ) -> AsyncIterator[TransactionRecord]:
+        stmt = self._wallet_stmt(
+            wallet_id,
+            date_from=date_from,
+            date_to=date_to,
+            tx_type=tx_type,
+            desc=desc,
+            include_deleted=include_deleted,
+        )
+        return iter_records(self._engine, stmt, TransactionRecord, fetch_size)
+
+    async def soft_delete(self, transaction_id: int) -> int:
+        # удалённая операция вычитается из свёртки в той же транзакции
+        stmt = (
+            update(transactions)
+            .where(and_(transactions.c.id == transaction_id, self._not_deleted()))
+            .values(deleted_at=func.now())
+            .returning(
+                transactions.c.id,
+                transactions.c.wallet_id,
+                transactions.c.amount,
+                transactions.c.created_at,
+            )
+        )
+        async with self._engine.begin() as conn:
+            row = (await conn.execute(stmt)).one_or_none()
+            if row is None:
+                return 0
+            await rollups.subtract(conn, row)
+        return 1
+
+    async def refresh_rollups(self, batch_size: int = rollups.ROLLUP_BATCH_SIZE) -> int:
+        # досчитать свёртку по новым операциям; возвращает новую отметку (id операции)
+        return await rollups.refresh(self._engine, batch_size)
+
+    async def totals(
+        self,
+        date_from: datetime.datetime,
+        date_to: datetime.datetime,
+        period: RollupPeriod = RollupPeriod.MONTH,
+        wallet_id: Optional[int] = None,
+    ) -> list[dict[str, Any]]:
+        # доходы и расходы за [date_from, date_to) по дням или месяцам; wallet_id=None - по всем.
+        # границы с часовым поясом приводятся к UTC, как хранится created_at
+        date_from, date_to = rollups.naive_utc(date_from), rollups.naive_utc(date_to)
+        if date_from >= date_to:
+            raise ValueError("date_from must be earlier than date_to")
+        # один снимок на отметку, свёртку и свежие операции
+        async with self._engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+            async with conn.begin():
+                return await rollups.totals(conn, wallet_id, date_from, date_to, period)
+
+    async def balance_history(
+        self,
+        wallet_id: int,
+        date_from: Optional[datetime.datetime] = None,
+        date_to: Optional[datetime.datetime] = None,
+        points: int = 500,
+        method: DownsampleMethod = DownsampleMethod.LTTB,
+    ) -> dict[str, Any]:
+        # история баланса по леджеру за [date_from, date_to), прореженная до points точек
+        if date_from is not None:
+            date_from = rollups.naive_utc(date_from)
+        if date_to is not None:
+            date_to = rollups.naive_utc(date_to)
+        if date_from is not None and date_to is not None and date_from >= date_to:
+            raise ValueError("date_from must be earlier than date_to")
+        async with self._engine.connect() as conn:
+            conn = await conn.execution_options(isolation_level="REPEATABLE READ", postgresql_readonly=True)
+            async with conn.begin():
+                series = await balance_history.load_series(conn, wallet_id, date_from, date_to)
+        return {
+            "wallet_id": wallet_id,
+            "opening_balance": series.opening,
+            "closing_balance": series.closing,
+            "transactions": len(series),
+            "method": method,
+            "points": balance_history.downsample(series, points, method),
+        }
+
+
+# -------
+# функции-обёртки, по аналогии с wallet_repository
+# функция добавления операции в леджер
+async def create_transaction(
+    engine: AsyncEngine,
+    wallet_id: int,
+    amount: float,
+    description: str | None = None,
+) -> dict[str, Any]:
+    """
+    Добавляет операцию кошелька в леджер.
+
+    Положительная сумма - доход, отрицательная - расход.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param wallet_id: Идентификатор кошелька.
+    :param amount: Сумма операции со знаком.
+    :param description: Описание операции.
+    :return: Созданная операция.
+    """
+    return await TransactionRepo(engine).create(wallet_id, amount, description)
+
+# функция получения истории операций кошелька
+async def get_wallet_transactions(
+    engine: AsyncEngine,
+    wallet_id: int,
+    date_from: datetime.datetime | None = None,
+    date_to: datetime.datetime | None = None,
+    tx_type: TransactionType | None = None,
+    limit: int | None = 100,
+) -> list[dict[str, Any]]:
+    """
+    Возвращает операции кошелька за период, от новых к старым.
+
+    Не возвращает soft-deleted операции. Запрос обслуживается индексом
+    (wallet_id, created_at), поэтому не зависит от размера всей таблицы.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param wallet_id: Идентификатор кошелька.
+    :param date_from: Начало периода (включительно).
+    :param date_to: Конец периода (не включительно).
+    :param tx_type: Только доходы или только расходы.
+    :param limit: Максимальное количество операций.
+    :return: Список операций.
+    """
+    return await TransactionRepo(engine).list_by_wallet(
+        wallet_id,
+        date_from=date_from,
+        date_to=date_to,
+        tx_type=tx_type,
+        limit=limit,
+    )
+
+
+# функция сводки доходов и расходов за период
+async def get_transaction_totals(
+    engine: AsyncEngine,
+    date_from: datetime.datetime,
+    date_to: datetime.datetime,
+    period: RollupPeriod = RollupPeriod.MONTH,
+    wallet_id: int | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Возвращает доходы и расходы за период по дням или месяцам.
+
+    Целые дни и месяцы читаются из свёртки transaction_rollups, неполные
+    дни по краям периода и ещё не свёрнутые операции - из transactions,
+    поэтому стоимость запроса не растёт с длиной истории.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param date_from: Начало периода (включительно).
+    :param date_to: Конец периода (не включительно).
+    :param period: Шаг группировки: день или месяц.
+    :param wallet_id: Идентификатор кошелька; None - по всем кошелькам.
+    :return: Суммы и количество доходов и расходов по периодам с операциями.
+    :raises ValueError: Если date_from не раньше date_to.
+    """
+    return await TransactionRepo(engine).totals(date_from, date_to, period=period, wallet_id=wallet_id)
@@ -0,0 +1,372 @@
+# суммы доходов и расходов по дням и месяцам (таблица transaction_rollups)
+# свёртка досчитывается порциями по id операций выше rollup_state.last_transaction_id,
+# поэтому обновление стоит O(новых операций), а не O(леджера). запрос за период
+# берёт целые месяцы и дни из свёртки, а неполные дни по краям и операции, которые
+# ещё не попали в свёртку, - из transactions
+from __future__ import annotations
+import asyncio
+import datetime
+from decimal import Decimal
+from typing import Any, Optional
+from sqlalchemy import Date, and_, cast, func, or_, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+from sqlalchemy.sql.elements import ColumnElement
+from app.schemas import RollupPeriod
+from database.database import ROLLUP_ALL_WALLETS, rollup_state, transaction_rollups, transactions
+
+# операций в одной транзакции обновления свёртки
+ROLLUP_BATCH_SIZE = 50_000
+# как часто обновление свёртки проверяет, завершились ли транзакции, начатые до него, секунды
+ROLLUP_SETTLE_POLL = 0.05
+
+_STATE_NAME = "transactions"
+
+TimeRange = tuple[datetime.datetime, datetime.datetime]
+DateRange = tuple[datetime.date, datetime.date]
+
+# операции из transactions, отобранные условием where, прибавляются к свёртке со знаком
+# :sign (1 - добавить, -1 - вычесть). GROUPING SETS считает за один проход дни и месяцы
+# по каждому кошельку и по всем вместе. GROUPING(t.day) = 1 - строка месячного набора,
+# wallet_id IS NULL - строка по всем кошелькам
+_UPSERT_SQL = """
+INSERT INTO transaction_rollups AS r
+    (period, wallet_id, period_start, income, expense, income_count, expense_count)
+SELECT
+    CASE WHEN GROUPING(t.day) = 0 THEN 'day' ELSE 'month' END,
+    COALESCE(t.wallet_id, :all_wallets),
+    COALESCE(t.day, t.month),
+    :sign * COALESCE(sum(t.amount) FILTER (WHERE t.amount > 0), 0),
+    :sign * COALESCE(sum(-t.amount) FILTER (WHERE t.amount < 0), 0),
+    :sign * count(*) FILTER (WHERE t.amount > 0),
+    :sign * count(*) FILTER (WHERE t.amount < 0)
+FROM (
+    SELECT wallet_id, amount, created_at::date AS day, date_trunc('month', created_at)::date AS month
+    FROM transactions
+    WHERE {where} AND deleted_at IS NULL AND amount <> 0
+) t
+GROUP BY GROUPING SETS ((t.wallet_id, t.day), (t.day), (t.wallet_id, t.month), (t.month))
+ON CONFLICT (period, wallet_id, period_start) DO UPDATE SET
+    income = r.income + EXCLUDED.income,
+    expense = r.expense + EXCLUDED.expense,
+    income_count = r.income_count + EXCLUDED.income_count,
+    expense_count = r.expense_count + EXCLUDED.expense_count
+"""
+# одна порция обновления: операции с id в (lo, hi]
+_REFRESH_SQL = _UPSERT_SQL.format(where="id > :lo AND id <= :hi")
+
+
+async def _ensure_state(conn: AsyncConnection) -> None:
+    # строку состояния кладёт миграция; create_all (тесты, create_tables) создаёт только таблицу
+    await conn.execute(
+        pg_insert(rollup_state)
+        .values(name=_STATE_NAME, last_transaction_id=0)
+        .on_conflict_do_nothing(index_elements=[rollup_state.c.name])
+    )
+
+
+async def _high_water_mark(conn: AsyncConnection, lock: Optional[str] = None) -> int:
+    # lock: None - просто прочитать, "share" - не дать обновлению свёртки сдвинуть отметку,
+    # "update" - сдвигать её самому
+    stmt = select(rollup_state.c.last_transaction_id).where(rollup_state.c.name == _STATE_NAME)
+    if lock is not None:
+        stmt = stmt.with_for_update(read=(lock == "share"))
+    value = (await conn.execute(stmt)).scalar_one_or_none()
+    return int(value or 0)
+
+
+async def _wait_settled(conn: AsyncConnection) -> None:
+    # ждёт, пока завершатся все транзакции, у которых уже есть xid: пока xmin текущего
+    # снимка не дойдёт до xmax снимка на входе. сама ничего не блокирует
+    xmax = int((await conn.execute(text("SELECT pg_snapshot_xmax(pg_current_snapshot())"))).scalar_one())
+    settled = text("SELECT pg_snapshot_xmin(pg_current_snapshot()) >= CAST(:xmax AS xid8)")
+    while not (await conn.execute(settled, {"xmax": xmax})).scalar_one():
+        await asyncio.sleep(ROLLUP_SETTLE_POLL)
+
+
+async def _settled_upper(engine: AsyncEngine) -> int:
+    # верхняя граница досчёта: id, до которого все операции уже зафиксированы или откачены.
+    # операция с меньшим id могла быть ещё не зафиксирована при чтении max(id); её
+    # транзакция к тому моменту уже получила xid (или получает его в том же INSERT,
+    # сразу после nextval), поэтому ждём завершения всех транзакций с xid дважды:
+    # второе ожидание накрывает INSERT, который взял id до чтения, а xid - после
+    async with engine.connect() as conn:
+        upper = int((await conn.execute(select(func.max(transactions.c.id)))).scalar() or 0)
+        await _wait_settled(conn)
+        await _wait_settled(conn)
+    return upper
+
+
+async def refresh(engine: AsyncEngine, batch_size: int = ROLLUP_BATCH_SIZE) -> int:
+    """
+    Досчитывает свёртку по операциям, добавленным после прошлого обновления.
+
+    Верхняя граница - max(id) операций, но отметка проходит её, только когда
+    завершились все транзакции, которые могли вставить операции с меньшим id:
+    ни одна из них не появится в леджере после того, как отметка её пройдёт.
+    Ожидание без блокировок: записи в леджер идут как обычно, долгие переводы
+    задерживают только само обновление. Дальше операции сворачиваются
+    порциями по batch_size id, каждая порция - своей транзакцией вместе со
+    сдвигом отметки.
+
+    :param engine: AsyncEngine SQLAlchemy.
+    :param batch_size: Сколько id операций сворачивать в одной транзакции.
+    :return: Новая отметка - id последней свёрнутой операции.
+    """
+    async with engine.begin() as conn:
+        await _ensure_state(conn)
+    upper = await _settled_upper(engine)
+
+    while True:
+        async with engine.begin() as conn:
+            # параллельное обновление ждёт здесь и продолжит с уже сдвинутой отметки
+            hwm = await _high_water_mark(conn, lock="update")
+            if hwm >= upper:
+                return hwm
+            hi = min(upper, hwm + batch_size)
+            await conn.execute(
+                text(_REFRESH_SQL),
+                {"lo": hwm, "hi": hi, "sign": 1, "all_wallets": ROLLUP_ALL_WALLETS},
+            )
+            await conn.execute(
+                update(rollup_state)
+                .where(rollup_state.c.name == _STATE_NAME)
+                .values(last_transaction_id=hi)
+            )
+
+
+async def subtract(conn: AsyncConnection, row: Any) -> None:
+    """
+    Вычитает удалённую операцию из свёртки в транзакции удаления.
+
+    Операции выше отметки в свёртку ещё не попали: обновление пропустит их
+    по deleted_at. FOR SHARE на строке состояния не даёт обновлению сдвинуть
+    отметку, пока удаление не зафиксировано.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param row: Удалённая операция (id, wallet_id, amount, created_at).
+    """
+    amount = Decimal(row.amount)
+    if not amount or row.id > await _high_water_mark(conn, lock="share"):
+        return
+
+    r = transaction_rollups.c
+    day = row.created_at.date()
+    income = amount if amount > 0 else Decimal(0)
+    expense = -amount if amount < 0 else Decimal(0)
+    # строки свёртки обновляем в одном порядке: параллельные удаления не возьмут их встречно
+    keys = sorted(
+        (period, wallet_id, start)
+        for period, start in ((RollupPeriod.DAY.value, day), (RollupPeriod.MONTH.value, day.replace(day=1)))
+        for wallet_id in (row.wallet_id, ROLLUP_ALL_WALLETS)
+    )
+    for period, wallet_id, start in keys:
+        await conn.execute(
+            update(transaction_rollups)
+            .where(and_(r.period == period, r.wallet_id == wallet_id, r.period_start == start))
+            .values(
+                income=r.income - income,
+                expense=r.expense - expense,
+                income_count=r.income_count - (1 if income else 0),
+                expense_count=r.expense_count - (1 if expense else 0),
+            )
+        )
+
+
+async def adjust(conn: AsyncConnection, where: str, params: dict[str, Any], sign: int) -> None:
+    """
+    Прибавляет к свёртке или вычитает из неё операции, которые уже в неё попали
+    (id не выше отметки) и не удалены.
+
+    Нужна, когда операции уходят из transactions или возвращаются туда с прежним id
+    (архив): обновление свёртки такие id уже прошло. Отобранные строки должны быть
+    заблокированы или вставлены этой же транзакцией.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param where: SQL-условие на строки transactions (параметры в params).
+    :param params: Параметры условия.
+    :param sign: 1 - прибавить, -1 - вычесть.
+    """
+    hwm = await _high_water_mark(conn, lock="share")
+    if not hwm:
+        return
+    await conn.execute(
+        text(_UPSERT_SQL.format(where=f"({where}) AND id <= :hwm")),
+        {**params, "hwm": hwm, "sign": sign, "all_wallets": ROLLUP_ALL_WALLETS},
+    )
+
+
+def naive_utc(moment: datetime.datetime) -> datetime.datetime:
+    """
+    Приводит момент времени к виду колонок created_at: TIMESTAMP без часового пояса, UTC.
+
+    :param moment: Наивный (уже UTC) или с часовым поясом, например из "...Z" в запросе.
+    :return: Наивный datetime в UTC.
+    """
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def _next_day(moment: datetime.datetime) -> datetime.date:
+    # первый целый день, начинающийся не раньше moment
+    day = moment.date()
+    return day if moment.time() == datetime.time.min else day + datetime.timedelta(days=1)
+
+
+def _next_month(day: datetime.date) -> datetime.date:
+    # первое число месяца не раньше day
+    if day.day == 1:
+        return day
+    return (day.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def _at_midnight(day: datetime.date) -> datetime.datetime:
+    return datetime.datetime.combine(day, datetime.time.min)
+
+
+def plan_ranges(
+    date_from: datetime.datetime,
+    date_to: datetime.datetime,
+    period: RollupPeriod,
+) -> tuple[list[TimeRange], list[DateRange], Optional[DateRange]]:
+    """
+    Делит период [date_from, date_to) на части по источнику данных.
+
+    :param date_from: Начало периода (включительно).
+    :param date_to: Конец периода (не включительно).
+    :param period: Шаг группировки: по месяцам целые месяцы берутся из месячной свёртки.
+    :return: (неполные дни по краям - из transactions, диапазоны дневной свёртки,
+        диапазон месячной свёртки или None); все диапазоны полуоткрытые.
+    """
+    first_day = _next_day(date_from)
+    end_day = date_to.date()
+    if first_day >= end_day:
+        return [(date_from, date_to)], [], None
+
+    raw: list[TimeRange] = []
+    if date_from < _at_midnight(first_day):
+        raw.append((date_from, _at_midnight(first_day)))
+    if _at_midnight(end_day) < date_to:
+        raw.append((_at_midnight(end_day), date_to))
+
+    if period == RollupPeriod.MONTH:
+        first_month = _next_month(first_day)
+        end_month = end_day.replace(day=1)
+        if first_month < end_month:
+            days = [(a, b) for a, b in ((first_day, first_month), (end_month, end_day)) if a < b]
+            return raw, days, (first_month, end_month)
+    return raw, [(first_day, end_day)], None
+
+
+async def totals(
+    conn: AsyncConnection,
+    wallet_id: Optional[int],
+    date_from: datetime.datetime,
+    date_to: datetime.datetime,
+    period: RollupPeriod,
+) -> list[dict[str, Any]]:
+    """
+    Доходы и расходы за период [date_from, date_to) с шагом день или месяц.
+
+    Соединение должно быть в транзакции REPEATABLE READ: отметка, свёртка и
+    свежие операции читаются из одного снимка и не считаются дважды.
+
+    :param conn: Соединение с открытой транзакцией.
+    :param wallet_id: Кошелёк; None - по всем кошелькам.
+    :param date_from: Начало периода (включительно).
+    :param date_to: Конец периода (не включительно).
+    :param period: Шаг группировки.
+    :return: Строки по периодам с операциями, по возрастанию period_start.
+    """
+    date_from, date_to = naive_utc(date_from), naive_utc(date_to)
+    hwm = await _high_water_mark(conn)
+    raw_ranges, day_ranges, month_range = plan_ranges(date_from, date_to, period)
+    buckets: dict[datetime.date, list[Any]] = {}
+
+    def add(start: datetime.date, income: Any, expense: Any, income_count: int, expense_count: int) -> None:
+        if period == RollupPeriod.MONTH:
+            start = start.replace(day=1)
+        bucket = buckets.setdefault(start, [Decimal(0), Decimal(0), 0, 0])
+        bucket[0] += income
+        bucket[1] += expense
+        bucket[2] += income_count
+        bucket[3] += expense_count
+
+    r = transaction_rollups.c
+    stored: list[ColumnElement[bool]] = [
+        and_(r.period == RollupPeriod.DAY.value, r.period_start >= a, r.period_start < b)
+        for a, b in day_ranges
+    ]
+    if month_range is not None:
+        stored.append(
+            and_(
+                r.period == RollupPeriod.MONTH.value,
+                r.period_start >= month_range[0],
+                r.period_start < month_range[1],
+            )
+        )
+    if stored:
+        key = ROLLUP_ALL_WALLETS if wallet_id is None else wallet_id
+        res = await conn.execute(
+            select(r.period_start, r.income, r.expense, r.income_count, r.expense_count)
+            .where(and_(r.wallet_id == key, or_(*stored)))
+        )
+        for row in res:
+            add(*row)
+
+    # неполные дни по краям (операции, уже учтённые в свёртке) и все операции выше отметки
+    t = transactions.c
+    pending: list[ColumnElement[bool]] = [
+        and_(t.id > hwm, t.created_at >= date_from, t.created_at < date_to)
+    ]
+    if raw_ranges:
+        pending.append(
+            and_(t.id <= hwm, or_(*(and_(t.created_at >= a, t.created_at < b) for a, b in raw_ranges)))
+        )
+    conditions: list[ColumnElement[bool]] = [t.deleted_at.is_(None), or_(*pending)]
+    if wallet_id is not None:
+        conditions.append(t.wallet_id == wallet_id)
+    bucket_start = cast(func.date_trunc(period.value, t.created_at), Date)
+    res = await conn.execute(
+        select(
+            bucket_start,
+            func.coalesce(func.sum(t.amount).filter(t.amount > 0), 0),
+            func.coalesce(func.sum(-t.amount).filter(t.amount < 0), 0),
+            func.count().filter(t.amount > 0),
+            func.count().filter(t.amount < 0),
+        )
+        .where(and_(*conditions))
+        .group_by(bucket_start)
+    )
+    for row in res:
+        add(*row)
+
+    return [
+        {
+            "period_start": start,
+            "income": income,
+            "expense": expense,
+            "income_count": income_count,
+            "expense_count": expense_count,
+        }
+        for start, (income, expense, income_count, expense_count) in sorted(buckets.items())
+        if income_count or expense_count
+    ]
+
+
+async def net_before(conn: AsyncConnection, wallet_id: Optional[int], moment: datetime.datetime) -> Decimal:
+    """
+    Сумма всех операций раньше moment (доходы минус расходы): баланс по леджеру
+    на начало периода. Читается по месячной свёртке, как totals.
+
+    :param conn: Соединение с открытой транзакцией REPEATABLE READ.
+    :param wallet_id: Кошелёк; None - по всем кошелькам.
+    :param moment: Граница (не включительно).
+    :return: Сумма операций.
+    """
+    moment = naive_utc(moment)
+    if moment <= datetime.datetime.min:
+        return Decimal(0)
+    rows = await totals(conn, wallet_id, datetime.datetime.min, moment, RollupPeriod.MONTH)
+    return sum((Decimal(row["income"]) - Decimal(row["expense"]) for row in rows), Decimal(0))
@@ -0,0 +1,169 @@
+# кэш кошельков перед WalletRepo: read-through для get_by_id/exists, сброс при записи
+from __future__ import annotations
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+from app.repositories.wallet_repository import WalletRepo
+
+
+class LRUTTLCache:
+    # ограниченный по размеру кэш: вытеснение самых давно использованных (LRU)
+    # и истечение записей по времени (TTL)
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data: OrderedDict[int, tuple[float, dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: int) -> Optional[dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: int, value: dict[str, Any]) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: int) -> None:
+        self._data.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class CachedWalletRepo(WalletRepo):
+    # кэширует не удалённые кошельки по id. include_deleted=True идёт мимо кэша.
+    # все методы, меняющие кошелёк, сбрасывают его запись после выполнения.
+    # кэш живёт в процессе: запись в другом воркере сюда не доходит,
+    # поэтому TTL - верхняя граница устаревания между воркерами
+
+    def __init__(self, inner: WalletRepo, max_size: int = 10_000, ttl: float = 30.0) -> None:
+        super().__init__(inner._engine)
+        self._inner = inner
+        self._cache = LRUTTLCache(max_size, ttl)
+        # загрузки из БД в процессе: id -> количество; и id, сброшенные во время загрузки.
+        # иначе чтение, начатое до записи, положило бы в кэш старую строку после сброса
+        self._loading: dict[int, int] = {}
+        self._dirty: set[int] = set()
+
+    def cache_stats(self) -> dict[str, Any]:
+        return self._cache.stats()
+
+    def invalidate(self, wallet_id: int) -> None:
+        self._cache.pop(wallet_id)
+        if wallet_id in self._loading:
+            self._dirty.add(wallet_id)
+
+    async def _load(self, wallet_id: int) -> Optional[dict[str, Any]]:
+        self._loading[wallet_id] = self._loading.get(wallet_id, 0) + 1
+        try:
+            row = await self._inner.get_by_id(wallet_id)
+            if row is not None and wallet_id not in self._dirty:
+                self._cache.set(wallet_id, row)
+            return row
+        finally:
+            left = self._loading[wallet_id] - 1
+            if left:
+                self._loading[wallet_id] = left
+            else:
+                del self._loading[wallet_id]
+                self._dirty.discard(wallet_id)
+
+    async def get_by_id(self, wallet_id: int, include_deleted: bool = False) -> Optional[dict[str, Any]]:
+        if include_deleted:
+            return await self._inner.get_by_id(wallet_id, include_deleted=True)
+        cached = self._cache.get(wallet_id)
+        if cached is not None:
+            # копия: вызывающий код может менять словарь, кэш от этого не должен портиться
+            return dict(cached)
+        row = await self._load(wallet_id)
+        return dict(row) if row is not None else None
+
+    async def exists(self, wallet_id: int, include_deleted: bool = False) -> bool:
+        if include_deleted:
+            return await self._inner.exists(wallet_id, include_deleted=True)
+        if self._cache.get(wallet_id) is not None:
+            return True
+        # промах: грузим строку целиком, следующий get_by_id/exists попадёт в кэш
+        return await self._load(wallet_id) is not None
+
+    async def update_name(self, wallet_id: int, name: str, include_deleted: bool = False) -> int:
+        try:
+            return await self._inner.update_name(wallet_id, name, include_deleted)
+        finally:
+            self.invalidate(wallet_id)
+
+    async def hard_delete(self, wallet_id: int, include_deleted: bool = False) -> int:
+        try:
+            return await self._inner.hard_delete(wallet_id, include_deleted)
+        finally:
+            self.invalidate(wallet_id)
+
+    async def update_balance_if_enough(self, wallet_id: int, delta: float) -> int:
+        try:
+            return await self._inner.update_balance_if_enough(wallet_id, delta)
+        finally:
+            self.invalidate(wallet_id)
+
+    async def apply_deltas_batch(
+        self,
+        deltas: Iterable[tuple[int, float]],
+    ) -> tuple[list[int], list[int]]:
+        items = list(deltas)
+        try:
+            return await self._inner.apply_deltas_batch(items)
+        finally:
+            for wallet_id, _ in items:
+                self.invalidate(wallet_id)
+
+    async def transfer(
+        self,
+        from_id: int,
+        to_id: int,
+        amount: float,
+        description: Optional[str] = None,
+    ) -> dict[str, Any]:
+        try:
+            return await self._inner.transfer(from_id, to_id, amount, description)
+        finally:
+            self.invalidate(from_id)
+            self.invalidate(to_id)
+
+    async def soft_delete(self, wallet_id: int) -> int:
+        try:
+            return await self._inner.soft_delete(wallet_id)
+        finally:
+            self.invalidate(wallet_id)
+
+    async def restore(self, wallet_id: int) -> int:
+        try:
+            return await self._inner.restore(wallet_id)
+        finally:
+            self.invalidate(wallet_id)
@@ -0,0 +1,137 @@
+# быстрый бэкенд репозитория кошельков: горячие запросы напрямую через asyncpg
+from __future__ import annotations
+import time
+from decimal import Decimal
+from typing import Any, Optional, cast
+import asyncpg
+from sqlalchemy.engine.interfaces import PoolProxiedConnection
+from sqlalchemy.ext.asyncio import AsyncConnection
+from app.metrics import observe_statement
+from app.slow_queries import sample_statement
+from app.repositories.wallet_repository import WalletRepo
+from database.database import STATS_SLOTS, wallets
+
+# список колонок берём из metadata, чтобы выдача совпадала с select(wallets)
+_COLUMNS = ", ".join(c.name for c in wallets.c)
+# get_by_id отдаёт баланс вместе с несвёрнутыми шардами горячего кошелька (см. hot_wallets.py)
+_GET_COLUMNS = ", ".join(
+    "balance + COALESCE((SELECT sum(delta) FROM wallet_balance_shards WHERE wallet_id = wallets.id), 0)"
+    " AS balance" if c.name == "balance" else c.name
+    for c in wallets.c
+)
+
+# пополнение/списание вместе с обновлением wallet_stats одним запросом,
+# та же логика, что у WalletStatsDelta.changed() + apply(). условие "новый максимум"
+# стоит внутри UPDATE: после ожидания блокировки слота оно пересчитается по свежей строке
+_IS_MAX = "u.new_balance > u.old_balance AND (s.max_balance IS NULL OR s.max_balance < u.new_balance)"
+_UPDATE_BALANCE_SQL = f"""
+WITH old AS (
+    SELECT id, balance FROM wallets WHERE id = $1 AND deleted_at IS NULL FOR UPDATE
+), upd AS (
+    UPDATE wallets w SET balance = old.balance + $2
+    FROM old
+    WHERE w.id = old.id AND old.balance + $2 >= 0
+    RETURNING w.id, w.balance AS new_balance, old.balance AS old_balance
+), stats AS (
+    UPDATE wallet_stats s SET
+        balance_sum = s.balance_sum + (u.new_balance - u.old_balance),
+        max_balance = CASE WHEN {_IS_MAX} THEN u.new_balance ELSE s.max_balance END,
+        max_wallet_id = CASE WHEN {_IS_MAX} THEN u.id ELSE s.max_wallet_id END,
+        max_stale = CASE WHEN {_IS_MAX} THEN false ELSE s.max_stale OR (
+            u.new_balance < u.old_balance AND s.max_wallet_id IS NOT DISTINCT FROM u.id
+        ) END
+    FROM upd u
+    WHERE s.slot = u.id % {STATS_SLOTS}
+)
+SELECT id FROM upd
+"""
+
+# имя prepared statement -> текст запроса.
+# include_deleted передаётся параметром, поэтому на каждый метод один запрос
+_STATEMENTS: dict[str, str] = {
+    "wallet_exists": (
+        "SELECT EXISTS (SELECT 1 FROM wallets WHERE id = $1 AND ($2 OR deleted_at IS NULL))"
+    ),
+    "wallet_get_by_id": (
+        f"SELECT {_GET_COLUMNS} FROM wallets WHERE id = $1 AND ($2 OR deleted_at IS NULL)"
+    ),
+    "wallet_update_name": (
+        "UPDATE wallets SET name = $2 WHERE id = $1 AND ($3 OR deleted_at IS NULL) RETURNING id"
+    ),
+    "wallet_update_balance_if_enough": _UPDATE_BALANCE_SQL,
+}
+
+# ошибки, после которых prepared statement надо подготовить заново
+# (поменялась схема таблицы или соединение сбросило свои statements)
+_STALE_STATEMENT_ERRORS = (
+    asyncpg.exceptions.InvalidCachedStatementError,
+    asyncpg.exceptions.InvalidSQLStatementNameError,
+)
+
+
+class AsyncpgWalletRepo(WalletRepo):
+    # тот же интерфейс, что у WalletRepo. exists/get_by_id/update_name/update_balance_if_enough
+    # выполняются именованными prepared statements на соединении asyncpg из пула SQLAlchemy:
+    # без построения select(...), компиляции и обёртки результата.
+    # остальные методы, а также баланс горячих кошельков, наследуются от WalletRepo
+
+    @staticmethod
+    def _statement_cache(raw: PoolProxiedConnection) -> dict[str, Any]:
+        # info живёт столько же, сколько само соединение в пуле
+        return raw.info.setdefault("wallet_statements", {"generation": 0})
+
+    async def _prepared(self, raw: PoolProxiedConnection, name: str) -> asyncpg.prepared_stmt.PreparedStatement:
+        cache = self._statement_cache(raw)
+        stmt = cache.get(name)
+        if stmt is None:
+            # после сброса меняем имя: старое могло остаться занятым на сервере
+            server_name = f"{name}_{cache['generation']}"
+            driver = cast(asyncpg.Connection, raw.driver_connection)
+            stmt = await driver.prepare(_STATEMENTS[name], name=server_name)
+            cache[name] = stmt
+        return stmt
+
+    async def _run(self, name: str, method: str, *args: Any) -> Any:
+        # запросы идут мимо событий SQLAlchemy, поэтому метрику и сэмплер медленных
+        # запросов вызываем здесь
+        started = time.perf_counter()
+        result = await self._execute(name, method, *args)
+        elapsed = time.perf_counter() - started
+        rows = len(result) if isinstance(result, list) else int(result is not None)
+        observe_statement(_STATEMENTS[name], elapsed, rows)
+        sample_statement(self._engine, _STATEMENTS[name], args, elapsed)
+        return result
+
+    async def _execute(self, name: str, method: str, *args: Any) -> Any:
+        async with self._engine.connect() as conn:  # type: AsyncConnection
+            raw = await conn.get_raw_connection()
+            try:
+                stmt = await self._prepared(raw, name)
+                return await getattr(stmt, method)(*args)
+            except _STALE_STATEMENT_ERRORS:
+                cache = self._statement_cache(raw)
+                generation = cache["generation"] + 1
+                cache.clear()
+                cache["generation"] = generation
+                stmt = await self._prepared(raw, name)
+                return await getattr(stmt, method)(*args)
+
+    async def exists(self, wallet_id: int, include_deleted: bool = False) -> bool:
+        return bool(await self._run("wallet_exists", "fetchval", wallet_id, include_deleted))
+
+    async def get_by_id(self, wallet_id: int, include_deleted: bool = False) -> Optional[dict[str, Any]]:
+        row = await self._run("wallet_get_by_id", "fetchrow", wallet_id, include_deleted)
+        return self._row_to_dict(row) if row is not None else None
+
+    async def update_name(self, wallet_id: int, name: str, include_deleted: bool = False) -> int:
+        rows = await self._run("wallet_update_name", "fetch", wallet_id, name, include_deleted)
+        return len(rows)
+
+    async def update_balance_if_enough(self, wallet_id: int, delta: float) -> int:
+        if await self._hot_shards(wallet_id):
+            # шарды и свёртка горячего кошелька - общий путь WalletRepo
+            return await super().update_balance_if_enough(wallet_id, delta)
+        rows = await self._run(
+            "wallet_update_balance_if_enough", "fetch", wallet_id, Decimal(str(delta))
+        )
+        return len(rows)
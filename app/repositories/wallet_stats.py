@@ -0,0 +1,185 @@
+# инкрементальная статистика кошельков (таблица wallet_stats)
+# количество, сумма балансов и максимум по не удалённым кошелькам обновляются
+# в той же транзакции, что и сами кошельки, поэтому чтение агрегатов - O(1)
+from __future__ import annotations
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Optional
+from sqlalchemy import and_, case, false, func, or_, select, text, update
+from sqlalchemy.ext.asyncio import AsyncConnection
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.elements import ColumnElement
+from database.database import STATS_SLOTS, wallet_stats, wallets
+
+
+def stats_slot(wallet_id: int) -> int:
+    return wallet_id % STATS_SLOTS
+
+
+@dataclass
+class _SlotDelta:
+    count: int = 0
+    total: Decimal = Decimal(0)
+    # баланс кошелька до транзакции и после неё; None - кошелёк не активен.
+    # сравниваем только начало и конец: промежуточные шаги (например, свёртка
+    # шардов и сразу списание) на максимум слота не влияют
+    start: dict[int, Optional[Decimal]] = field(default_factory=dict)
+    final: dict[int, Optional[Decimal]] = field(default_factory=dict)
+
+    def best(self) -> Optional[tuple[Decimal, int]]:
+        # кандидат в максимум слота: самый большой из выросших или появившихся кошельков
+        grown: list[tuple[Decimal, int]] = []
+        for wallet_id, balance in self.final.items():
+            before = self.start[wallet_id]
+            if balance is not None and (before is None or balance > before):
+                grown.append((balance, wallet_id))
+        return max(grown) if grown else None
+
+    def dropped(self) -> set[int]:
+        # кошельки, чей баланс уменьшился или ушёл: если один из них - максимум слота,
+        # максимум устарел
+        dropped: set[int] = set()
+        for wallet_id, balance in self.final.items():
+            before = self.start[wallet_id]
+            if balance is None or (before is not None and balance < before):
+                dropped.add(wallet_id)
+        return dropped
+
+
+class WalletStatsDelta:
+    # изменения статистики, накопленные за одну транзакцию записи.
+    # apply() пишет их одним UPDATE на каждый затронутый слот
+
+    def __init__(self) -> None:
+        self._slots: dict[int, _SlotDelta] = {}
+
+    def _slot(self, wallet_id: int) -> _SlotDelta:
+        return self._slots.setdefault(stats_slot(wallet_id), _SlotDelta())
+
+    def added(self, wallet_id: int, balance: Decimal) -> None:
+        # кошелёк стал активным: создан или восстановлен
+        d = self._slot(wallet_id)
+        d.count += 1
+        d.total += balance
+        d.start.setdefault(wallet_id, None)
+        d.final[wallet_id] = balance
+
+    def removed(self, wallet_id: int, balance: Decimal) -> None:
+        # кошелёк перестал быть активным: soft/hard delete
+        d = self._slot(wallet_id)
+        d.count -= 1
+        d.total -= balance
+        d.start.setdefault(wallet_id, balance)
+        d.final[wallet_id] = None
+
+    def changed(self, wallet_id: int, old_balance: Decimal, new_balance: Decimal) -> None:
+        # изменился баланс активного кошелька
+        d = self._slot(wallet_id)
+        d.total += new_balance - old_balance
+        d.start.setdefault(wallet_id, old_balance)
+        d.final[wallet_id] = new_balance
+
+    async def apply(self, conn: AsyncConnection) -> None:
+        # слоты обновляем по возрастанию номера: две транзакции не возьмут их в разном порядке
+        s = wallet_stats.c
+        for slot in sorted(self._slots):
+            d = self._slots[slot]
+            best = d.best()
+            dropped = d.dropped()
+            if not d.count and not d.total and best is None and not dropped:
+                continue
+
+            stale: ColumnElement[bool] = s.max_stale
+            if dropped:
+                stale = s.max_stale | func.coalesce(s.max_wallet_id.in_(dropped), false())
+
+            values: dict[str, Any] = {
+                "active_count": s.active_count + d.count,
+                "balance_sum": s.balance_sum + d.total,
+                "max_stale": stale,
+            }
+            if best is not None:
+                # новый баланс выше текущего максимума - он и есть максимум слота,
+                # даже если максимум был помечен устаревшим (тот мог быть только завышен)
+                best_balance, best_id = best
+                beats = or_(s.max_balance.is_(None), s.max_balance < best_balance)
+                values["max_balance"] = case((beats, best_balance), else_=s.max_balance)
+                values["max_wallet_id"] = case((beats, best_id), else_=s.max_wallet_id)
+                values["max_stale"] = case((beats, False), else_=stale)
+
+            await conn.execute(update(wallet_stats).where(s.slot == slot).values(**values))
+
+
+async def refresh_stale_max(conn: AsyncConnection) -> int:
+    # пересчёт максимума в слотах с max_stale (фоновая задача, не путь чтения).
+    # строки слотов блокируем, чтобы параллельная запись не перетёрла свежий максимум
+    # старым; слоты, занятые записями, пропускаем (SKIP LOCKED) до следующего прохода.
+    # возвращает число пересчитанных слотов
+    s = wallet_stats.c
+    stale_slots = (
+        await conn.execute(
+            select(s.slot).where(s.max_stale).order_by(s.slot).with_for_update(skip_locked=True)
+        )
+    ).scalars().all()
+
+    for slot in stale_slots:
+        top = (
+            await conn.execute(
+                select(wallets.c.id, wallets.c.balance)
+                .where(
+                    and_(
+                        wallets.c.deleted_at.is_(None),
+                        wallets.c.id % STATS_SLOTS == slot,
+                    )
+                )
+                .order_by(wallets.c.balance.desc(), wallets.c.id.desc())
+                .limit(1)
+            )
+        ).first()
+        await conn.execute(
+            update(wallet_stats)
+            .where(s.slot == slot)
+            .values(
+                max_balance=top.balance if top else None,
+                max_wallet_id=top.id if top else None,
+                max_stale=False,
+            )
+        )
+    return len(stale_slots)
+
+
+def stale_slots_top(slots: list[int]) -> Select[Any]:
+    # самый большой кошелёк среди слотов с устаревшим максимумом, без блокировок:
+    # чтение не ждёт записи и не задерживает их. индекс (balance, id) читается с конца
+    # до первого кошелька из этих слотов; без устаревших слотов запрос не нужен вовсе,
+    # иначе он прошёл бы весь индекс
+    return (
+        select(wallets.c.id)
+        .where(and_(wallets.c.deleted_at.is_(None), (wallets.c.id % STATS_SLOTS).in_(slots)))
+        .order_by(wallets.c.balance.desc(), wallets.c.id.desc())
+        .limit(1)
+    )
+
+
+# полный пересчёт статистики из таблицы wallets (восстановление после сбоя или ручных правок).
+# SHARE-блокировка wallets не даёт записям менять кошельки, пока идёт пересчёт
+_REBUILD_SQL = """
+INSERT INTO wallet_stats (slot, active_count, balance_sum, max_balance, max_wallet_id, max_stale)
+SELECT s.slot, COALESCE(a.active_count, 0), COALESCE(a.balance_sum, 0), m.balance, m.id, false
+FROM generate_series(0, :slots - 1) AS s(slot)
+LEFT JOIN (
+    SELECT id % :slots AS slot, count(*) AS active_count, sum(balance) AS balance_sum
+    FROM wallets WHERE deleted_at IS NULL GROUP BY 1
+) a ON a.slot = s.slot
+LEFT JOIN (
+    SELECT DISTINCT ON (id % :slots) id % :slots AS slot, id, balance
+    FROM wallets WHERE deleted_at IS NULL
+    ORDER BY id % :slots, balance DESC, id DESC
+) m ON m.slot = s.slot
+"""
+
+
+async def rebuild_wallet_stats(conn: AsyncConnection) -> None:
+    await conn.execute(text("LOCK TABLE wallets IN SHARE MODE"))
+    await conn.execute(wallet_stats.delete())
+    await conn.execute(text(_REBUILD_SQL), {"slots": STATS_SLOTS})
@@ -0,0 +1,52 @@
+from dataclasses import asdict
+from typing import Optional
+from app.dependencies import get_slow_query_sampler
+from app.schemas import SlowQueryEntry, SlowQueryReport
+from app.slow_queries import SlowQuerySampler
+from fastapi import APIRouter, Depends, HTTPException, Query
+from starlette import status
+
+# служебные эндпоинты для диагностики. наружу их не открываем:
+# закрываются на уровне прокси, как и /metrics
+router = APIRouter(prefix="/admin", tags=["admin"])
+
+
+# последние медленные запросы с планами EXPLAIN
+@router.get(
+    path="/slow-queries",
+    response_model=SlowQueryReport,
+    summary="Медленные запросы",
+    description=(
+        "Возвращает последние запросы к БД, выполнявшиеся дольше SLOW_QUERY_THRESHOLD, "
+        "с шаблоном, параметрами и планом EXPLAIN (ANALYZE, BUFFERS). Новые первыми. "
+        "Буфер свой у каждого воркера."
+    ),
+    response_description="Счётчики сэмплера и пойманные запросы.",
+)
+async def slow_queries(
+    limit: Optional[int] = Query(default=None, ge=1, description="Сколько последних запросов вернуть"),
+    sampler: Optional[SlowQuerySampler] = Depends(get_slow_query_sampler),
+) -> SlowQueryReport:
+    """
+    Отдаёт содержимое кольцевого буфера медленных запросов.
+
+    Args:
+        limit: Сколько последних записей вернуть (None - все).
+        sampler: Сэмплер медленных запросов.
+
+    Returns:
+        SlowQueryReport: настройки, счётчики и записи буфера.
+
+    Raises:
+        HTTPException: 404, если сэмплер выключен (SLOW_QUERY_THRESHOLD = 0).
+    """
+    if sampler is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Slow query sampler is disabled",
+        )
+    entries = sampler.entries()[:limit]
+    return SlowQueryReport(
+        **sampler.stats(),
+        entries=[SlowQueryEntry(**asdict(entry)) for entry in entries],
+    )
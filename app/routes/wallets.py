@@ -1,6 +1,39 @@
-from typing import Any, Callable, Dict, List, Optional
-from app.schemas import WalletCreate, WalletResponse, WalletTopup, WalletUpdate
-from fastapi import APIRouter, HTTPException
+import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from app.dependencies import get_topup_coalescer, get_transaction_repo, get_wallet_repo
+from app.repositories.topup_coalescer import TopupCoalescer
+from app.repositories.transaction_repository import TransactionRepo
+from app.repositories.wallet_cache import CachedWalletRepo
+from app.repositories.wallet_repository import (
+    DEFAULT_FETCH_SIZE,
+    InsufficientFunds,
+    WalletNotFound,
+    WalletRepo,
+)
+from app.schemas import (
+    BalanceDeltaBatch,
+    BalanceDeltaBatchResult,
+    BalanceHistory,
+    DownsampleMethod,
+    RollupPeriod,
+    TransferRequest,
+    TransferResponse,
+    TransactionResponse,
+    TransactionRollup,
+    WalletBulkCreate,
+    WalletBulkCreateResult,
+    WalletCreate,
+    WalletPage,
+    WalletResponse,
+    WalletSearchHit,
+    WalletStats,
+    WalletTopup,
+    WalletUpdate,
+)
+from app.serialization import json_list_response, json_model_response, ndjson_chunks, validate_list
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
 from starlette import status
 
 """
@@ -14,8 +47,9 @@ from starlette import status
 tags= ["wallets"] в swagger все эти маршруты будут в группе wallets.
 """
 router = APIRouter(prefix="/wallets", tags=["wallets"])
-# наша псевдо-база в памяти: id -> WalletResponse
-fake_db: dict[int, WalletResponse] = {}
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# данные живут в Postgres: обработчики асинхронные и получают репозиторий через Depends,
+# поэтому приложение можно запускать в нескольких воркерах и на нескольких узлах
 
 
 
@@ -23,39 +57,181 @@ fake_db: dict[int, WalletResponse] = {}
 
 # эндпоинт (по адресу /health) и даем ему логику (перенесли из мейна)
 @router.get("/health")
-def healthcheck() -> dict[str, str]:
+async def healthcheck() -> dict[str, str]:
     return {"status": "ok"}
 
 
 
 
+# статистика кэша кошельков (для мониторинга)
+@router.get(
+    path="/cache/stats",
+    summary="Статистика кэша кошельков",
+    description=(
+        "Возвращает размер кэша кошельков текущего воркера и счётчики "
+        "попаданий, промахов и вытеснений. Если кэш выключен, enabled=false."
+    ),
+    response_description="Счётчики кэша кошельков.",
+)
+async def wallet_cache_stats(
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> dict[str, Any]:
+    """
+    Отдаёт счётчики кэша кошельков.
+
+    Args:
+        repo: Репозиторий кошельков.
+
+    Returns:
+        Словарь со статистикой кэша и флагом enabled.
+    """
+    if not isinstance(repo, CachedWalletRepo):
+        return {"enabled": False}
+    return {"enabled": True, **repo.cache_stats()}
+
+
+
+
+# сводка по кошелькам для виджетов: агрегаты берутся из wallet_stats, без скана wallets
+@router.get(
+    path="/stats",
+    response_model=WalletStats,
+    summary="Сводка по кошелькам",
+    description=(
+        "Возвращает количество не удалённых кошельков, средний баланс и кошелёк "
+        "с максимальным балансом. Значения поддерживаются операциями записи, "
+        "поэтому запрос не зависит от размера таблицы."
+    ),
+    response_description="Количество, средний баланс и кошелёк с максимальным балансом.",
+)
+async def wallet_stats(
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> WalletStats:
+    """
+    Отдаёт агрегаты по не удалённым кошелькам.
+
+    Args:
+        repo: Репозиторий кошельков.
+
+    Returns:
+        WalletStats: количество, средний баланс и самый большой кошелёк (или None).
+    """
+    top = await repo.max_balance_wallet()
+    return WalletStats(
+        count=await repo.count(),
+        avg_balance=await repo.avg_balance(),
+        max_balance_wallet=WalletResponse.model_validate(top) if top else None,
+    )
+
+
+
+
+# доходы и расходы по всем кошелькам для графиков: целые дни и месяцы берутся из свёртки
+@router.get(
+    path="/rollups",
+    response_model=List[TransactionRollup],
+    summary="Доходы и расходы по всем кошелькам",
+    description=(
+        "Возвращает суммы и количество доходов и расходов всех кошельков за период "
+        "[date_from, date_to) по дням или месяцам. Целые дни и месяцы читаются из "
+        "предрасчитанной свёртки, поэтому запрос не пересчитывает весь леджер. "
+        "Границы с часовым поясом переводятся в UTC, без пояса - считаются UTC."
+    ),
+    response_description="Доходы и расходы по периодам с операциями.",
+)
+async def all_wallets_rollups(
+    date_from: datetime.datetime,
+    date_to: datetime.datetime,
+    period: RollupPeriod = RollupPeriod.MONTH,
+    transaction_repo: TransactionRepo = Depends(get_transaction_repo),
+) -> Response:
+    """
+    Отдаёт доходы и расходы всех кошельков за период.
+
+    Args:
+        date_from: Начало периода (включительно).
+        date_to: Конец периода (не включительно).
+        period: Шаг группировки: day или month.
+        transaction_repo: Репозиторий операций.
+
+    Raises:
+        HTTPException: 400, если date_from не раньше date_to.
+
+    Returns:
+        Response со списком TransactionRollup.
+    """
+    try:
+        rows = await transaction_repo.totals(date_from, date_to, period=period)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return json_list_response(TransactionRollup, rows)
+
+
+
+
 # созданию кошельков
-@router.get("/", response_model=WalletResponse,
+@router.post("/", response_model=WalletResponse,
     summary="создание нового кошелька",
-    description=( "Создаёт новый кошелёк с указанным названием и начальным балансом. "
-        "Данные сохраняются во временное хранилище в памяти."
+    status_code=status.HTTP_201_CREATED,
+    description=( "Создаёт новый кошелёк с указанным названием и нулевым балансом. "
+        "Идентификатор выдаёт база данных."
     ),
 response_description="Созданный кошелёк с присвоенным идентификатором.")
-def create_wallet(wallet: WalletCreate) -> WalletResponse:
+async def create_wallet(
+    wallet: WalletCreate,
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> WalletResponse:
     """
     Создает новый кошелек.
 
-    Эндпоинт принимает имя и начальный баланс кошелька, сохраняет данные в in-memory и возвращает
-    созданный обьект.
+    Эндпоинт принимает имя кошелька, сохраняет его в БД и возвращает
+    созданный обьект. id берётся из последовательности Postgres, поэтому
+    не пересекается между воркерами.
 
     Args:
-        wallet: Данные для создания кошелька (имя, начальный баланс).
+        wallet: Данные для создания кошелька (имя).
+        repo: Репозиторий кошельков.
     Returns:
         Обьект кошелька с присвоенным идентификатором.
     """
-    new_id = len(fake_db) + 1
-    wallet_response = WalletResponse(
-        id=new_id,
-        name=wallet.name,
-        balance=0.0,
-    )
-    fake_db[new_id] = wallet_response
-    return wallet_response
+    created = await repo.create(wallet.name)
+    return WalletResponse.model_validate(created)
+
+
+
+
+# массовое создание кошельков (онбординг партнёра)
+@router.post(
+    path="/bulk",
+    response_model=WalletBulkCreateResult,
+    status_code=status.HTTP_201_CREATED,
+    summary="Массовое создание кошельков",
+    description=(
+        "Создаёт кошельки с нулевым балансом по списку имён (до 100 000 за запрос). "
+        "Имена загружаются в БД через COPY чанками по 50 000, каждый чанк - своей "
+        "транзакцией."
+    ),
+    response_description="id созданных кошельков в порядке имён из запроса.",
+)
+async def create_wallets_bulk(
+    body: WalletBulkCreate,
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> WalletBulkCreateResult:
+    """
+    Создаёт кошельки пакетом.
+
+    Для миллионов имён удобнее `python -m scripts.import_wallets`: он читает
+    файл построчно и печатает прогресс.
+
+    Args:
+        body: Список имён кошельков.
+        repo: Репозиторий кошельков.
+
+    Returns:
+        WalletBulkCreateResult с id созданных кошельков.
+    """
+    ids = await repo.create_bulk(body.names)
+    return WalletBulkCreateResult(ids=ids)
 
 
 
@@ -63,54 +239,405 @@ def create_wallet(wallet: WalletCreate) -> WalletResponse:
 # четвертый эндпоинт, выдача списка кошельков по значению
 @router.get(
     path="/",
-    response_model=list[WalletResponse],
+    response_model=WalletPage,
     summary="Список кошельков",
     description=(
-        "Возвращает список кошельков с поддержкой фильтрации по названию, "
-        "пагинации (limit/offset) и сортировки по выбранному полю и порядку."
+        "Возвращает страницу кошельков с поддержкой фильтрации по названию "
+        "и сортировки по выбранному полю и порядку. Пагинация курсорная: "
+        "next_cursor из ответа передаётся в параметр cursor следующего запроса."
     ),
-    response_description="Список кошельков после применения фильтров и сортировки.",
+    response_description="Страница кошельков и курсор следующей страницы.",
 )
-def list_wallets(
+async def list_wallets(
     name: Optional[str] = None,
-    limit: int = 10,
-    offset: int = 0,
+    limit: int = Query(default=10, ge=1, le=100),
+    cursor: Optional[str] = None,
     sort_by: Optional[str] = None,
     sort_order: str = "asc",
-) -> list[WalletResponse]:
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> Response:
     """
-    Дает список кошельков с фильтрацией, сорт и пагинацией.
+    Дает страницу кошельков с фильтрацией, сорт и keyset-пагинацией.
+
+    Фильтр, сортировка и выбор страницы выполняются в SQL, поэтому
+    стоимость запроса не зависит от того, насколько далеко листает клиент.
 
     Args:
         name: Фильтр по названию кошелька.
-        limit: Количество элементов в выдаче.
-        offset: Смещение для пагинации.
-        sort_by: Поле для сортировки.
+        limit: Количество элементов на странице.
+        cursor: Курсор из предыдущего ответа (next_cursor).
+        sort_by: Поле для сортировки: id, name, balance или created_at.
         sort_order: Порядок сортировки.
+        repo: Репозиторий кошельков.
+
+    Raises:
+        HTTPException: 400, если поле сортировки неизвестно, курсор некорректен
+            или выдан для другой сортировки.
+
+    Returns:
+        Response с WalletPage: список WalletResponse и next_cursor.
+    """
+    try:
+        items, next_cursor = await repo.search_page(
+            name_part=name,
+            order_by=sort_by or "id",
+            desc=(sort_order == "desc"),
+            limit=limit,
+            cursor=cursor,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    # страница проверяется одним проходом и сериализуется без повторной проверки FastAPI
+    page = WalletPage(items=validate_list(WalletResponse, items), next_cursor=next_cursor)
+    return json_model_response(page)
+
+
+
+
+# рейтинг кошельков по балансу
+@router.get(
+    path="/top",
+    response_model=List[WalletResponse],
+    summary="Кошельки с наибольшим балансом",
+    description=(
+        "Возвращает n не удалённых кошельков с наибольшим балансом по убыванию. "
+        "Выборка идёт одним запросом по индексу баланса и читает только n строк."
+    ),
+    response_description="Кошельки по убыванию баланса.",
+)
+async def top_wallets(
+    n: int = Query(default=10, ge=1, le=100),
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> Response:
+    """
+    Дает топ кошельков по балансу.
+
+    Args:
+        n: Сколько кошельков вернуть.
+        repo: Репозиторий кошельков.
+
+    Returns:
+        Response со списком WalletResponse по убыванию баланса.
+    """
+    rows = await repo.top_by_balance(n)
+    return json_list_response(WalletResponse, rows)
+
+
+
+
+# нечёткий поиск кошелька по имени
+@router.get(
+    path="/search",
+    response_model=List[WalletSearchHit],
+    summary="Поиск кошельков по имени",
+    description=(
+        "Ищет кошельки, в имени которых есть строка q или похожее на неё слово "
+        "(с опечатками), и сортирует по похожести. Работает по триграммному индексу "
+        "pg_trgm; если расширения нет, ищет по подстроке без ранжирования."
+    ),
+    response_description="Найденные кошельки с оценкой похожести.",
+)
+async def search_wallets(
+    q: str = Query(min_length=1, max_length=50),
+    limit: int = Query(default=20, ge=1, le=100),
+    min_score: float = Query(default=0.3, ge=0, le=1),
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> Response:
+    """
+    Дает кошельки, похожие по имени на строку поиска.
+
+    Args:
+        q: Строка поиска.
+        limit: Максимум результатов.
+        min_score: Порог похожести для совпадений с опечатками.
+        repo: Репозиторий кошельков.
 
     Returns:
-        Список WalletResponse.
+        Response со списком WalletSearchHit по убыванию score.
     """
-    wallets = list(fake_db.values())
-    if name is not None:
-        wallets = [wallet for wallet in wallets if name.lower() in wallet.name.lower()]
-    # сортировка
-    if sort_by is not None:
-        if sort_by == "name":
-            wallets = sorted(
-                wallets,
-                key=lambda w: w.name.lower(),
-                reverse=(sort_order == "desc"),
-            )
-        elif sort_by == "balance":
-            wallets = sorted(
-                wallets,
-                key=lambda w: w.balance,
-                reverse=(sort_order == "desc"),
-            )
-    # пагинация через срез списка
-    wallet = wallets[offset : offset + limit]
-    return wallets
+    rows = await repo.search_fuzzy(q, limit=limit, min_score=min_score)
+    return json_list_response(WalletSearchHit, rows)
+
+
+
+
+# пакетное изменение балансов (для расчётных задач)
+@router.post(
+    path="/balances/batch",
+    response_model=BalanceDeltaBatchResult,
+    summary="Пакетное изменение балансов",
+    description=(
+        "Применяет список изменений баланса одной транзакцией. Изменения одного "
+        "кошелька складываются. Изменение, после которого баланс стал бы "
+        "отрицательным, не применяется, остальные применяются."
+    ),
+    response_description="Списки применённых и отклонённых кошельков.",
+)
+async def apply_balance_deltas(
+    batch: BalanceDeltaBatch,
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> BalanceDeltaBatchResult:
+    """
+    Применяет пакет изменений балансов.
+
+    Все изменения уходят в БД несколькими запросами UPDATE ... FROM (VALUES ...)
+    вместо одного запроса на кошелёк.
+
+    Args:
+        batch: Список пар (wallet_id, delta).
+        repo: Репозиторий кошельков.
+
+    Returns:
+        BalanceDeltaBatchResult с id применённых и отклонённых кошельков.
+    """
+    applied, rejected = await repo.apply_deltas_batch(
+        [(item.wallet_id, item.delta) for item in batch.items]
+    )
+    return BalanceDeltaBatchResult(applied=applied, rejected=rejected)
+
+
+
+
+# перевод между кошельками
+@router.post(
+    path="/transfer",
+    response_model=TransferResponse,
+    summary="Перевод между кошельками",
+    description=(
+        "Списывает сумму с одного кошелька и зачисляет на другой. Списание, "
+        "зачисление и две записи в журнале операций выполняются атомарно. "
+        "Если кошелёк не найден, возвращает 404; если не хватает средств - 409."
+    ),
+    response_description="Оба кошелька после перевода и id записей в журнале операций.",
+)
+async def transfer(
+    body: TransferRequest,
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> TransferResponse:
+    """
+    Переводит сумму между кошельками.
+
+    Args:
+        body: Кошелёк списания, кошелёк зачисления, сумма и описание.
+        repo: Репозиторий кошельков.
+
+    Raises:
+        HTTPException: 400, если кошельки совпадают или сумма меньше копейки;
+            404, если кошелёк не найден; 409, если не хватает средств.
+
+    Returns:
+        TransferResponse с обоими кошельками и id операций.
+    """
+    try:
+        result = await repo.transfer(
+            body.from_wallet_id, body.to_wallet_id, body.amount, body.description
+        )
+    except WalletNotFound as exc:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(exc))
+    except InsufficientFunds as exc:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return TransferResponse.model_validate(result)
+
+
+
+
+# выгрузка всех кошельков потоком (NDJSON)
+@router.get(
+    path="/export",
+    summary="Выгрузка кошельков (NDJSON)",
+    description=(
+        "Отдаёт все кошельки, подходящие под фильтр, потоком в формате NDJSON "
+        "(по одному JSON-объекту на строку). Строки читаются из серверного курсора "
+        "пачками по fetch_size, поэтому память сервера не растёт с размером выгрузки."
+    ),
+    response_description="Поток кошельков в формате application/x-ndjson.",
+    response_class=StreamingResponse,
+)
+async def export_wallets(
+    name: Optional[str] = None,
+    sort_by: Optional[str] = None,
+    sort_order: str = "asc",
+    fetch_size: int = Query(default=DEFAULT_FETCH_SIZE, ge=1, le=10_000),
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> StreamingResponse:
+    """
+    Выгружает кошельки потоком NDJSON.
+
+    Args:
+        name: Фильтр по названию кошелька.
+        sort_by: Поле для сортировки: id, name, balance или created_at.
+        sort_order: Порядок сортировки.
+        fetch_size: Размер пачки строк из серверного курсора.
+        repo: Репозиторий кошельков.
+
+    Raises:
+        HTTPException: 400, если поле сортировки неизвестно.
+
+    Returns:
+        StreamingResponse с NDJSON.
+    """
+    try:
+        rows = repo.iter_search(
+            name_part=name,
+            order_by=sort_by or "id",
+            desc=(sort_order == "desc"),
+            fetch_size=fetch_size,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return StreamingResponse(
+        ndjson_chunks(rows, WalletResponse, fetch_size),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+
+
+
+# выгрузка операций кошелька потоком (NDJSON)
+@router.get(
+    path="/{wallet_id}/transactions/export",
+    summary="Выгрузка операций кошелька (NDJSON)",
+    description=(
+        "Отдаёт операции кошелька от новых к старым потоком в формате NDJSON. "
+        "Если кошелёк не найден, возвращает ошибку 404."
+    ),
+    response_description="Поток операций в формате application/x-ndjson.",
+    response_class=StreamingResponse,
+)
+async def export_wallet_transactions(
+    wallet_id: int,
+    fetch_size: int = Query(default=DEFAULT_FETCH_SIZE, ge=1, le=10_000),
+    wallet_repo: WalletRepo = Depends(get_wallet_repo),
+    transaction_repo: TransactionRepo = Depends(get_transaction_repo),
+) -> StreamingResponse:
+    """
+    Выгружает операции кошелька потоком NDJSON.
+
+    Args:
+        wallet_id: Идентификатор кошелька.
+        fetch_size: Размер пачки строк из серверного курсора.
+        wallet_repo: Репозиторий кошельков.
+        transaction_repo: Репозиторий операций.
+
+    Raises:
+        HTTPException: 404, если кошелёк не найден.
+
+    Returns:
+        StreamingResponse с NDJSON.
+    """
+    if not await wallet_repo.exists(wallet_id):
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    rows = transaction_repo.iter_by_wallet(wallet_id, fetch_size=fetch_size)
+    return StreamingResponse(
+        ndjson_chunks(rows, TransactionResponse, fetch_size),
+        media_type=NDJSON_MEDIA_TYPE,
+    )
+
+
+
+
+# доходы и расходы кошелька по дням или месяцам
+@router.get(
+    path="/{wallet_id}/rollups",
+    response_model=List[TransactionRollup],
+    summary="Доходы и расходы кошелька",
+    description=(
+        "Возвращает суммы и количество доходов и расходов кошелька за период "
+        "[date_from, date_to) по дням или месяцам. Границы с часовым поясом "
+        "переводятся в UTC. Если кошелёк не найден, возвращает ошибку 404."
+    ),
+    response_description="Доходы и расходы кошелька по периодам с операциями.",
+)
+async def wallet_rollups(
+    wallet_id: int,
+    date_from: datetime.datetime,
+    date_to: datetime.datetime,
+    period: RollupPeriod = RollupPeriod.MONTH,
+    wallet_repo: WalletRepo = Depends(get_wallet_repo),
+    transaction_repo: TransactionRepo = Depends(get_transaction_repo),
+) -> Response:
+    """
+    Отдаёт доходы и расходы кошелька за период.
+
+    Args:
+        wallet_id: Идентификатор кошелька.
+        date_from: Начало периода (включительно).
+        date_to: Конец периода (не включительно).
+        period: Шаг группировки: day или month.
+        wallet_repo: Репозиторий кошельков.
+        transaction_repo: Репозиторий операций.
+
+    Raises:
+        HTTPException: 404, если кошелёк не найден; 400, если date_from не раньше date_to.
+
+    Returns:
+        Response со списком TransactionRollup.
+    """
+    if not await wallet_repo.exists(wallet_id):
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    try:
+        rows = await transaction_repo.totals(date_from, date_to, period=period, wallet_id=wallet_id)
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return json_list_response(TransactionRollup, rows)
+
+
+
+
+# история баланса кошелька для графиков, прореженная до points точек
+@router.get(
+    path="/{wallet_id}/balance-history",
+    response_model=BalanceHistory,
+    summary="История баланса кошелька",
+    description=(
+        "Возвращает баланс кошелька по леджеру после каждой операции за период "
+        "[from, to), прореженный до points точек методом minmax или lttb. "
+        "Границы с часовым поясом переводятся в UTC. "
+        "Если кошелёк не найден, возвращает ошибку 404."
+    ),
+    response_description="Начальный и конечный баланс периода и точки графика.",
+)
+async def wallet_balance_history(
+    wallet_id: int,
+    date_from: Optional[datetime.datetime] = Query(default=None, alias="from"),
+    date_to: Optional[datetime.datetime] = Query(default=None, alias="to"),
+    points: int = Query(default=500, ge=4, le=10_000),
+    method: DownsampleMethod = DownsampleMethod.LTTB,
+    wallet_repo: WalletRepo = Depends(get_wallet_repo),
+    transaction_repo: TransactionRepo = Depends(get_transaction_repo),
+) -> Response:
+    """
+    Отдаёт историю баланса кошелька за период.
+
+    Args:
+        wallet_id: Идентификатор кошелька.
+        date_from: Начало периода (включительно); без него - с первой операции.
+        date_to: Конец периода (не включительно); без него - до последней операции.
+        points: Сколько точек оставить после прореживания.
+        method: Способ прореживания: minmax или lttb.
+        wallet_repo: Репозиторий кошельков.
+        transaction_repo: Репозиторий операций.
+
+    Raises:
+        HTTPException: 404, если кошелёк не найден; 400, если from не раньше to.
+
+    Returns:
+        Response с BalanceHistory.
+    """
+    if not await wallet_repo.exists(wallet_id):
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    try:
+        history = await transaction_repo.balance_history(
+            wallet_id, date_from, date_to, points=points, method=method
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    return json_model_response(BalanceHistory.model_validate(history))
 
 
 
@@ -126,12 +653,16 @@ def list_wallets(
     ),
     response_description="Объект кошелька с указанным идентификатором.",
 )
-def get_wallet(wallet_id: int) -> WalletResponse:  # int wallet_id - аргумент
+async def get_wallet(
+    wallet_id: int,  # int wallet_id - аргумент
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> WalletResponse:
     """
      Возвращает данные одного кошелька по его идентификатору.
 
     Args:
         wallet_id: Идентификатор кошелька.
+        repo: Репозиторий кошельков.
 
     Raises:
         HTTPException: 404, если кошелёк с таким ID не найден.
@@ -139,12 +670,10 @@ def get_wallet(wallet_id: int) -> WalletResponse:  # int wallet_id - аргум
     Returns:
         Объект кошелька.
     """
-    wallet = fake_db.get(
-        wallet_id
-    )  # переменная wallet берет ЗНАЧЕНИЕ по ключу из словаря
+    wallet = await repo.get_by_id(wallet_id)
     if wallet is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    return wallet  # здесь будет значение по ключу из словаря
+    return WalletResponse.model_validate(wallet)
 
 
 
@@ -160,13 +689,18 @@ def get_wallet(wallet_id: int) -> WalletResponse:  # int wallet_id - аргум
     ),
     response_description="Обновлённый объект кошелька.",
 )
-def update_wallet(wallet_id: int, wallet_update: WalletUpdate) -> WalletResponse:
+async def update_wallet(
+    wallet_id: int,
+    wallet_update: WalletUpdate,
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> WalletResponse:
     """
     Обновляет параметры существующего кошелька.
 
      Args:
          wallet_id: Идентификатор кошелька, который нужно обновить.
-         wallet: Объект с новыми значениями полей кошелька.
+         wallet_update: Объект с новыми значениями полей кошелька.
+         repo: Репозиторий кошельков.
 
      Raises:
          HTTPException: 404, если кошелёк не найден.
@@ -174,12 +708,13 @@ def update_wallet(wallet_id: int, wallet_update: WalletUpdate) -> WalletResponse
      Returns:
          Обновлённый объект WalletResponse.
     """
-    wallet = fake_db.get(wallet_id)
-    if wallet is None:
+    if not await repo.update_name(wallet_id, wallet_update.name):
         raise HTTPException(status_code=404, detail="Wallet not found")
 
-    wallet.name = wallet_update.name
-    return wallet
+    wallet = await repo.get_by_id(wallet_id)
+    if wallet is None:
+        raise HTTPException(status_code=404, detail="Wallet not found")
+    return WalletResponse.model_validate(wallet)
 
 
 
@@ -189,17 +724,21 @@ def update_wallet(wallet_id: int, wallet_update: WalletUpdate) -> WalletResponse
     path="/{wallet_id}",
     summary="Удаление кошелька",
     description=(
-        "Удаляет кошелёк по идентификатору из временного хранилища. "
-        "Если кошелёк не найден, возвращает ошибку 404."
+        "Помечает кошелёк удалённым (soft delete): запись остаётся в БД, "
+        "но больше не видна в выдаче. Если кошелёк не найден, возвращает ошибку 404."
     ),
     response_description="Результат операции удаления в виде флага success.",
 )
-def delete_wallet(wallet_id: int) -> dict[str, bool]:
+async def delete_wallet(
+    wallet_id: int,
+    repo: WalletRepo = Depends(get_wallet_repo),
+) -> dict[str, bool]:
     """
-    Удаляет кошелёк по идентификатору.
+    Удаляет кошелёк по идентификатору (soft delete).
 
     Args:
         wallet_id: Идентификатор кошелька для удаления.
+        repo: Репозиторий кошельков.
 
     Raises:
         HTTPException: 404, если кошелёк с таким ID не найден.
@@ -207,8 +746,7 @@ def delete_wallet(wallet_id: int) -> dict[str, bool]:
     Returns:
         Словарь с ключом 'success', показывающим успешность операции.
     """
-    wallet = fake_db.pop(wallet_id, None)
-    if wallet is None:
+    if not await repo.soft_delete(wallet_id):
         raise HTTPException(status_code=404, detail="Wallet not found")
     return {"success": True}
 
@@ -227,13 +765,25 @@ def delete_wallet(wallet_id: int) -> dict[str, bool]:
     ),
     response_description="Кошелёк после успешного пополнения баланса.",
 )
-def top_up_wallet(wallet_id: int, top_up: WalletTopup) -> WalletResponse:
+async def top_up_wallet(
+    wallet_id: int,
+    top_up: WalletTopup,
+    repo: WalletRepo = Depends(get_wallet_repo),
+    coalescer: Optional[TopupCoalescer] = Depends(get_topup_coalescer),
+) -> WalletResponse:
     """
     Увеличивает баланс указанного кошелька на заданную сумму.
 
+    Баланс меняется одним UPDATE в БД (balance = balance + amount),
+    поэтому параллельные пополнения из разных воркеров не теряются.
+    С TOPUP_COALESCE_WINDOW > 0 пополнение попадает в пачку группового
+    коммита; ответ приходит после коммита пачки.
+
     Args:
         wallet_id: Идентификатор кошелька.
-        amount: Сумма пополнения (должна быть больше нуля).
+        top_up: Сумма пополнения (должна быть больше нуля).
+        repo: Репозиторий кошельков.
+        coalescer: Групповой коммит пополнений или None, если он выключен.
 
     Raises:
         HTTPException: 404, если кошелёк не найден.
@@ -241,8 +791,11 @@ def top_up_wallet(wallet_id: int, top_up: WalletTopup) -> WalletResponse:
     Returns:
         Обновлённый объект WalletResponse после пополнения.
     """
-    wallet = fake_db.get(wallet_id)  # wallet = значение по ключу из ДБ
+    writer = coalescer if coalescer is not None else repo
+    if not await writer.update_balance_if_enough(wallet_id, top_up.amount):
+        raise HTTPException(status_code=404, detail="Wallet not found")
+
+    wallet = await repo.get_by_id(wallet_id)
     if wallet is None:
         raise HTTPException(status_code=404, detail="Wallet not found")
-    wallet.balance += top_up.amount
-    return wallet
+    return WalletResponse.model_validate(wallet)
@@ -1,9 +1,9 @@
 # импортируем нужные элементы
 import datetime
 from enum import Enum
-from typing import Optional
+from typing import Any, Optional
 
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 """
 зачем мы импортируем BaseModel и наследуем от него?
@@ -61,13 +61,56 @@ class WalletUpdate(BaseModel):
         return value
 
 
+# массовое создание кошельков: те же правила для каждого имени, что у WalletCreate
+class WalletBulkCreate(BaseModel):
+    names: list[str] = Field(min_length=1, max_length=100_000)
+
+    @field_validator("names")
+    @classmethod
+    def validate_names(cls, value: list[str]) -> list[str]:
+        for name in value:
+            if len(name) < 2:
+                raise ValueError(f"имя слишком короткое: {name!r}")
+            if len(name) > 50:
+                raise ValueError(f"имя слишком длинное: {name[:50]!r}...")
+        return value
+
+
+# id созданных кошельков в порядке имён из запроса
+class WalletBulkCreateResult(BaseModel):
+    ids: list[int]
+
+
 # класс по выдаче информации кошелька
+# from_attributes: принимает и dict из репозитория, и WalletRecord без преобразования
 class WalletResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: int
     name: str
     balance: float
 
 
+# результат нечёткого поиска: score - похожесть имени на запрос (0..1),
+# None, если в БД нет pg_trgm и поиск шёл по подстроке
+class WalletSearchHit(WalletResponse):
+    score: Optional[float] = None
+
+
+# страница списка кошельков (keyset-пагинация)
+# next_cursor передаётся в следующий запрос, None - страниц больше нет
+class WalletPage(BaseModel):
+    items: list[WalletResponse]
+    next_cursor: Optional[str] = None
+
+
+# сводка по не удалённым кошелькам (читается из wallet_stats)
+class WalletStats(BaseModel):
+    count: int
+    avg_balance: Optional[float] = None
+    max_balance_wallet: Optional[WalletResponse] = None
+
+
 # класс по пополнению кошелька
 class WalletTopup(BaseModel):
     amount: float
@@ -80,6 +123,45 @@ class WalletTopup(BaseModel):
         return value
 
 
+# пакетное изменение балансов: delta может быть отрицательной (списание)
+class BalanceDelta(BaseModel):
+    wallet_id: int
+    delta: float
+
+
+class BalanceDeltaBatch(BaseModel):
+    items: list[BalanceDelta] = Field(min_length=1, max_length=10_000)
+
+
+# итог пакета: applied - изменённые кошельки, rejected - не найденные,
+# удалённые или те, у которых баланс ушёл бы в минус
+class BalanceDeltaBatchResult(BaseModel):
+    applied: list[int]
+    rejected: list[int]
+
+
+# перевод между кошельками
+class TransferRequest(BaseModel):
+    from_wallet_id: int
+    to_wallet_id: int
+    amount: float
+    description: Optional[str] = Field(default=None, max_length=255)
+
+    @field_validator("amount")
+    @classmethod
+    def validate_amount(cls, value: float) -> float:
+        if value <= 0:
+            raise ValueError("сумма должна быть положительной")
+        return value
+
+
+class TransferResponse(BaseModel):
+    from_wallet: WalletResponse
+    to_wallet: WalletResponse
+    debit_transaction_id: int
+    credit_transaction_id: int
+
+
 # класс Enum! Для перечислений
 class TransactionType(str, Enum):
     INCOME = "income"
@@ -111,6 +193,81 @@ class Transaction(BaseModel):
         return value
 
 
+# класс по выдаче операции из леджера (таблица transactions)
+# amount со знаком: положительная сумма - доход, отрицательная - расход
+class TransactionResponse(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    wallet_id: int
+    amount: float
+    description: Optional[str] = None
+    created_at: datetime.datetime
+
+
+# шаг сводки доходов и расходов (таблица transaction_rollups)
+class RollupPeriod(str, Enum):
+    DAY = "day"
+    MONTH = "month"
+
+
+# доходы и расходы за день или месяц; expense - сумма расходов по модулю
+class TransactionRollup(BaseModel):
+    period_start: datetime.date
+    income: float
+    expense: float
+    income_count: int
+    expense_count: int
+
+
+# способ прореживания истории баланса до заданного числа точек
+class DownsampleMethod(str, Enum):
+    MINMAX = "minmax"  # минимум и максимум каждой корзины: видны все пики
+    LTTB = "lttb"  # Largest-Triangle-Three-Buckets: точка на корзину, сохраняет форму линии
+
+
+# точка истории баланса: баланс сразу после операции в момент at
+class BalancePoint(BaseModel):
+    at: datetime.datetime
+    balance: float
+
+
+# история баланса по леджеру: opening_balance - сумма операций до начала периода,
+# transactions - сколько операций в периоде до прореживания
+class BalanceHistory(BaseModel):
+    wallet_id: int
+    opening_balance: float
+    closing_balance: float
+    transactions: int
+    method: DownsampleMethod
+    points: list[BalancePoint]
+
+
+# медленный запрос, пойманный сэмплером: шаблон, параметры и план EXPLAIN.
+# analyzed=false - запрос пишет данные, план снят без выполнения;
+# seq_scans - таблицы, которые план читает последовательным сканом
+class SlowQueryEntry(BaseModel):
+    captured_at: datetime.datetime
+    duration_ms: float
+    template: str
+    statement: str
+    parameters: list[Any]
+    plan: Optional[str] = None
+    analyzed: bool
+    seq_scans: list[str]
+    error: Optional[str] = None
+
+
+# slow - запросов дольше порога с запуска воркера, captured - из них снято планов
+class SlowQueryReport(BaseModel):
+    threshold: float
+    min_interval: float
+    max_entries: int
+    slow: int
+    captured: int
+    entries: list[SlowQueryEntry]
+
+
 # cls - класс, такой же обьект, как self, но
 # - self: конкретный обьект
 # - cls: сам класс (чертеж)
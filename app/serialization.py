@@ -0,0 +1,98 @@
+# быстрый путь ответа со списками: строки из репозитория проверяются одним проходом
+# TypeAdapter(list[Model]) и сразу пишутся в JSON сериализатором pydantic-core.
+# обычный путь FastAPI для каждого элемента делает model_validate, затем ещё раз
+# проверяет ответ по response_model, переводит его в dict и отдаёт json.dumps
+from functools import lru_cache
+from typing import Any, AsyncIterator, Iterable, TypeVar
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: type[ModelT]) -> TypeAdapter[list[ModelT]]:
+    # схема валидатора строится один раз на модель
+    return TypeAdapter(list[model])  # type: ignore[valid-type]
+
+
+def validate_list(model: type[ModelT], rows: Iterable[Any]) -> list[ModelT]:
+    """
+    Проверяет строки из репозитория одним вызовом валидатора.
+
+    :param model: Pydantic-модель элемента.
+    :param rows: Словари или записи (WalletRecord, TransactionRecord) из репозитория.
+    :return: Список моделей.
+    """
+    return list_adapter(model).validate_python(rows if isinstance(rows, list) else list(rows))
+
+
+def dump_list(model: type[ModelT], rows: Iterable[Any]) -> bytes:
+    """
+    Сериализует строки из репозитория в JSON-массив.
+
+    :param model: Pydantic-модель элемента.
+    :param rows: Словари или записи из репозитория.
+    :return: JSON в байтах.
+    """
+    adapter = list_adapter(model)
+    return adapter.dump_json(validate_list(model, rows))
+
+
+def json_list_response(model: type[ModelT], rows: Iterable[Any], status_code: int = 200) -> Response:
+    """
+    Готовый ответ со списком: FastAPI отдаёт Response как есть, без повторной
+    проверки по response_model.
+
+    :param model: Pydantic-модель элемента.
+    :param rows: Словари или записи из репозитория.
+    :param status_code: HTTP-статус ответа.
+    :return: Response с application/json.
+    """
+    return Response(content=dump_list(model, rows), status_code=status_code, media_type="application/json")
+
+
+def json_model_response(item: BaseModel, status_code: int = 200) -> Response:
+    """
+    Готовый ответ с одной уже проверенной моделью (например, страница списка).
+
+    :param item: Модель ответа.
+    :param status_code: HTTP-статус ответа.
+    :return: Response с application/json.
+    """
+    return Response(
+        content=item.__pydantic_serializer__.to_json(item),
+        status_code=status_code,
+        media_type="application/json",
+    )
+
+
+async def ndjson_chunks(
+    rows: AsyncIterator[Any],
+    model: type[ModelT],
+    chunk_rows: int,
+) -> AsyncIterator[bytes]:
+    """
+    Превращает поток строк из БД в NDJSON: одна JSON-строка на запись.
+
+    Строки копятся по chunk_rows, проверяются одним вызовом валидатора
+    и пишутся в сокет одним куском.
+
+    :param rows: Асинхронный поток строк из репозитория.
+    :param model: Pydantic-модель, через которую сериализуется строка.
+    :param chunk_rows: Сколько строк собирать в один кусок ответа.
+    :return: Асинхронный генератор кусков ответа в байтах.
+    """
+    serializer = model.__pydantic_serializer__
+    buffer: list[Any] = []
+
+    def render(batch: list[Any]) -> bytes:
+        return b"".join(serializer.to_json(item) + b"\n" for item in validate_list(model, batch))
+
+    async for row in rows:
+        buffer.append(row)
+        if len(buffer) >= chunk_rows:
+            yield render(buffer)
+            buffer = []
+    if buffer:
+        yield render(buffer)
@@ -0,0 +1,266 @@
+# сэмплер медленных запросов: запрос дольше порога повторяется как
+# EXPLAIN (ANALYZE, BUFFERS) на отдельном соединении, план попадает в кольцевой буфер.
+# включается SLOW_QUERY_THRESHOLD > 0, читается через GET /admin/slow-queries
+from __future__ import annotations
+import asyncio
+import dataclasses
+import datetime
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Optional
+from weakref import WeakKeyDictionary
+from sqlalchemy import event
+from sqlalchemy.engine import Connection, Engine, ExecutionContext
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from app.metrics import normalize_statement
+from database.database import DatabaseSettings, create_engine_from_settings, get_settings
+
+# сколько ждать EXPLAIN ANALYZE, секунды: он выполняет запрос ещё раз
+EXPLAIN_TIMEOUT = 30.0
+# сколько ждать соединение для EXPLAIN, секунды: план не стоит того, чтобы стоять в очереди
+EXPLAIN_CONNECT_TIMEOUT = 2.0
+# параметров в записи не больше этого числа (у пакетной вставки их десятки тысяч)
+MAX_PARAMETERS = 50
+
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "VALUES", "MERGE")
+_SEQ_SCAN = re.compile(r"Seq Scan on (\S+)")
+
+_samplers: WeakKeyDictionary[Engine, SlowQuerySampler] = WeakKeyDictionary()
+
+
+@dataclass(frozen=True)
+class SlowQuery:
+    captured_at: datetime.datetime
+    duration_ms: float
+    template: str
+    statement: str
+    parameters: list[Any]
+    plan: Optional[str] = None
+    # False - запрос пишет данные, снят только план без выполнения (EXPLAIN без ANALYZE)
+    analyzed: bool = False
+    seq_scans: list[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def _plain(value: Any) -> Any:
+    # параметры отдаются в JSON: Decimal, даты и прочее - строкой
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+class SlowQuerySampler:
+    # ловит запросы дольше threshold на событиях engine (и из AsyncpgWalletRepo
+    # через sample_statement). одновременно снимается не больше одного плана и не
+    # чаще раза в min_interval секунд: под общей деградацией медленными станут
+    # почти все запросы, и EXPLAIN ANALYZE каждого удвоил бы нагрузку.
+    # EXPLAIN идёт через explain_engine: отдельный пул на одно соединение, чтобы при
+    # исчерпанном пуле приложения (когда запросы и медленные) не отнимать у него соединение
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        threshold: float,
+        max_entries: int = 100,
+        min_interval: float = 10.0,
+        explain_engine: Optional[AsyncEngine] = None,
+    ) -> None:
+        self._engine = engine
+        self._explain_engine = explain_engine or engine
+        self.threshold = threshold
+        self.min_interval = min_interval
+        self._entries: deque[SlowQuery] = deque(maxlen=max_entries)
+        self._task: Optional[asyncio.Task[None]] = None
+        self._last_capture = float("-inf")
+        self.slow = 0
+        self.captured = 0
+
+    def install(self) -> None:
+        sync_engine = self._engine.sync_engine
+        _samplers[sync_engine] = self
+        event.listen(sync_engine, "before_cursor_execute", _before_execute)
+        event.listen(sync_engine, "after_cursor_execute", _after_execute)
+        event.listen(sync_engine, "handle_error", _on_error)
+
+    async def close(self) -> None:
+        sync_engine = self._engine.sync_engine
+        if _samplers.get(sync_engine) is self:
+            del _samplers[sync_engine]
+            event.remove(sync_engine, "before_cursor_execute", _before_execute)
+            event.remove(sync_engine, "after_cursor_execute", _after_execute)
+            event.remove(sync_engine, "handle_error", _on_error)
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._explain_engine is not self._engine:
+            await self._explain_engine.dispose()
+
+    def entries(self) -> list[SlowQuery]:
+        # новые первыми
+        return list(reversed(self._entries))
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "min_interval": self.min_interval,
+            "max_entries": self._entries.maxlen,
+            "slow": self.slow,
+            "captured": self.captured,
+        }
+
+    def observe(self, statement: str, parameters: Any, seconds: float) -> None:
+        # DDL, SET и собственные EXPLAIN сэмплера не объясняются
+        if seconds < self.threshold or not statement.lstrip()[:6].upper().startswith(_EXPLAINABLE):
+            return
+        if isinstance(parameters, (list, tuple)) and any(
+            isinstance(value, (list, tuple, dict)) for value in parameters
+        ):
+            # executemany: список наборов параметров, одного запроса для EXPLAIN нет
+            return
+        self.slow += 1
+        now = time.monotonic()
+        if self._task is not None or now - self._last_capture < self.min_interval:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # синхронное использование engine вне event loop: план снять негде
+            return
+        self._last_capture = now
+        params = tuple(parameters) if isinstance(parameters, (list, tuple)) else ()
+        self._task = loop.create_task(self._capture(statement, params, seconds))
+
+    async def _capture(self, statement: str, parameters: tuple[Any, ...], seconds: float) -> None:
+        captured_at = datetime.datetime.now(datetime.timezone.utc)
+        plan: Optional[str] = None
+        analyzed = False
+        error: Optional[str] = None
+        try:
+            plan, analyzed = await self._explain(statement, parameters)
+        except DBAPIError as exc:
+            # например, запрос к временной таблице другого соединения
+            error = str(exc.orig)
+        except Exception as exc:
+            # например, TimeoutError пула: задачу никто не ждёт, ошибка остаётся в записи
+            error = f"{type(exc).__name__}: {exc}"
+        finally:
+            self._task = None
+        self._entries.append(
+            SlowQuery(
+                captured_at=captured_at,
+                duration_ms=seconds * 1000,
+                template=normalize_statement(statement),
+                statement=statement,
+                parameters=[_plain(value) for value in parameters[:MAX_PARAMETERS]],
+                plan=plan,
+                analyzed=analyzed,
+                seq_scans=_SEQ_SCAN.findall(plan) if plan else [],
+                error=error,
+            )
+        )
+        self.captured += 1
+
+    async def _explain(self, statement: str, parameters: tuple[Any, ...]) -> tuple[str, bool]:
+        # ANALYZE выполняет запрос: делаем это только в READ ONLY транзакции, которая
+        # откатывается. запрос на запись в ней падает, и для него снимается план без выполнения
+        async with self._explain_engine.connect() as conn:
+            try:
+                await conn.exec_driver_sql("SET TRANSACTION READ ONLY")
+                await conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(EXPLAIN_TIMEOUT * 1000)}")
+                result = await conn.exec_driver_sql(f"EXPLAIN (ANALYZE, BUFFERS) {statement}", parameters)
+                analyzed = True
+            except DBAPIError:
+                await conn.rollback()
+                result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+                analyzed = False
+            plan = "\n".join(row[0] for row in result)
+            await conn.rollback()
+        return plan, analyzed
+
+
+def _before_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Optional[ExecutionContext],
+    executemany: bool,
+) -> None:
+    conn.info.setdefault("slow_query_started", []).append(time.perf_counter())
+
+
+def _after_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Optional[ExecutionContext],
+    executemany: bool,
+) -> None:
+    started = conn.info["slow_query_started"].pop()
+    sampler = _samplers.get(conn.engine)
+    # у executemany нет одного набора параметров, который можно было бы объяснить
+    if sampler is not None and not executemany:
+        sampler.observe(statement, parameters, time.perf_counter() - started)
+
+
+def _on_error(context: Any) -> None:
+    conn = context.connection
+    if conn is not None:
+        stack = conn.info.get("slow_query_started")
+        if stack:
+            stack.pop()
+
+
+def sample_statement(engine: AsyncEngine, statement: str, parameters: Any, seconds: float) -> None:
+    """
+    Передаёт сэмплеру запрос, выполненный мимо событий SQLAlchemy.
+
+    :param engine: AsyncEngine, через который выполнялся запрос.
+    :param statement: Текст запроса (с параметрами $1, $2, ...).
+    :param parameters: Значения параметров.
+    :param seconds: Время выполнения.
+    """
+    sampler = _samplers.get(engine.sync_engine)
+    if sampler is not None:
+        sampler.observe(statement, parameters, seconds)
+
+
+def install_sampler(
+    engine: AsyncEngine,
+    settings: Optional[DatabaseSettings] = None,
+) -> Optional[SlowQuerySampler]:
+    """
+    Подключает сэмплер медленных запросов к engine, если он включён в настройках.
+
+    :param engine: AsyncEngine приложения.
+    :param settings: Настройки БД; по умолчанию - из окружения.
+    :return: SlowQuerySampler или None, если SLOW_QUERY_THRESHOLD = 0.
+    """
+    settings = settings or get_settings()
+    if settings.slow_query_threshold <= 0:
+        return None
+    # одно своё соединение на воркер, открывается при первом EXPLAIN
+    explain_settings = dataclasses.replace(
+        settings,
+        pool_size=1,
+        max_overflow=0,
+        max_connections=None,
+        pool_timeout=EXPLAIN_CONNECT_TIMEOUT,
+    )
+    sampler = SlowQuerySampler(
+        engine,
+        threshold=settings.slow_query_threshold,
+        max_entries=settings.slow_query_buffer,
+        min_interval=settings.slow_query_interval,
+        explain_engine=create_engine_from_settings(explain_settings),
+    )
+    sampler.install()
+    return sampler
@@ -0,0 +1,4 @@
+# нагрузочные бенчмарки репозитория кошельков на детерминированных наборах данных.
+# запуск: python -m benchmarks seed --size 10k
+#         python -m benchmarks run --size 10k --compare
+# подробности - в app/Readme.md, раздел "Бенчмарки"
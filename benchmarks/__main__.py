@@ -0,0 +1,176 @@
+# командная строка бенчмарков.
+# база бенчмарков задаётся BENCH_DATABASE_URL (не DATABASE_URL): seed удаляет в ней все данные
+#   python -m benchmarks seed --size 10k [--seed 42] [--force]
+#   python -m benchmarks run --size 10k [--concurrency 1,8,32] [--ops 200] [--cases get_by_id,count]
+#                            [--backend core|asyncpg] [--reads-only] [--compare] [--save-baseline]
+#                            [--tolerance 0.25] [--output report.json]
+#   python -m benchmarks memory --size 1m [--limit 1000000]
+import argparse
+import asyncio
+import os
+import platform
+import random
+import sys
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.repositories.backends import make_wallet_repo
+from benchmarks import baseline, dataset, memory
+from benchmarks.cases import ALL_CASES, Context
+from benchmarks.runner import DEFAULT_CONCURRENCY, DEFAULT_OPS, Measurement, measure, to_json
+from database.database import DatabaseSettings, create_engine_from_settings
+
+
+def _settings(args: argparse.Namespace, pool_size: int) -> DatabaseSettings:
+    url = os.getenv("BENCH_DATABASE_URL")
+    if not url:
+        sys.exit("BENCH_DATABASE_URL is not set (separate database: seeding wipes it)")
+    return DatabaseSettings(
+        url=url,
+        pool_size=pool_size,
+        max_overflow=0,
+        repo_backend=getattr(args, "backend", "core"),
+    )
+
+
+async def _seed(args: argparse.Namespace) -> None:
+    engine = create_engine_from_settings(_settings(args, pool_size=2))
+    try:
+        size = dataset.SIZES[args.size]
+        if await dataset.seed(engine, size, args.seed, force=args.force):
+            print(f"seeded {size} wallets and transactions (seed {args.seed})")
+        else:
+            print(f"dataset {args.size} (seed {args.seed}) is already loaded")
+    finally:
+        await engine.dispose()
+
+
+async def _server_version(engine: AsyncEngine) -> str:
+    async with engine.connect() as conn:
+        return str((await conn.execute(text("SHOW server_version"))).scalar_one())
+
+
+async def _run(args: argparse.Namespace) -> int:
+    levels = [int(x) for x in args.concurrency.split(",")]
+    engine = create_engine_from_settings(_settings(args, pool_size=max(levels)))
+    try:
+        size = dataset.SIZES[args.size]
+        loaded = await dataset.current(engine)
+        if loaded is None or loaded.size != size:
+            print(f"dataset {args.size} is not loaded: run `python -m benchmarks seed --size {args.size}`")
+            return 2
+
+        repo = make_wallet_repo(engine, _settings(args, pool_size=max(levels)))
+
+        def make_context(rnd: random.Random) -> Context:
+            return Context(repo=repo, engine=engine, size=size, rnd=rnd)
+
+        selected = set(args.cases.split(",")) if args.cases else None
+        results: dict[str, dict[int, Measurement]] = {}
+        for case in ALL_CASES:
+            if selected is not None and case.name not in selected:
+                continue
+            if args.reads_only and case.writes:
+                continue
+            if case.max_size is not None and size > case.max_size:
+                continue
+            for level in levels:
+                if case.max_concurrency is not None and level > case.max_concurrency:
+                    continue
+                m = await measure(case, make_context, level, case.ops or args.ops, loaded.seed)
+                results.setdefault(case.name, {})[level] = m
+                print(
+                    f"{case.name:40} c={level:<3} p50 {m.p50_ms:8.2f}ms  "
+                    f"p99 {m.p99_ms:8.2f}ms  {m.throughput:9.0f} ops/s"
+                )
+
+        report: dict[str, Any] = {
+            "size": args.size,
+            "seed": loaded.seed,
+            "backend": args.backend,
+            "python": platform.python_version(),
+            "postgres": await _server_version(engine),
+            "results": to_json(results),
+        }
+    finally:
+        await engine.dispose()
+
+    if args.output:
+        baseline.save(Path(args.output), report)
+    path = baseline.baseline_path(args.size)
+    if args.save_baseline:
+        baseline.save(path, report)
+        print(f"baseline saved: {path}")
+    if args.compare:
+        reference = baseline.load(path)
+        if reference is None:
+            print(f"no baseline at {path}")
+            return 2
+        regressions = baseline.compare(reference, report, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"no regressions against {path} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+async def _memory(args: argparse.Namespace) -> int:
+    engine = create_engine_from_settings(_settings(args, pool_size=2))
+    try:
+        loaded = await dataset.current(engine)
+        if loaded is None or loaded.size != dataset.SIZES[args.size]:
+            print(f"dataset {args.size} is not loaded: run `python -m benchmarks seed --size {args.size}`")
+            return 2
+
+        repo = make_wallet_repo(engine, _settings(args, pool_size=2))
+        for label, load in memory.loaders(engine, repo, args.limit).items():
+            m = await memory.measure_memory(load)
+            print(
+                f"{label:32} {m.rows:>9} rows  {m.retained_bytes / 2**20:8.1f} MiB "
+                f"({m.bytes_per_row:6.0f} B/row)  peak {m.peak_bytes / 2**20:8.1f} MiB  {m.seconds:6.2f}s"
+            )
+    finally:
+        await engine.dispose()
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Бенчмарки репозитория кошельков")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    seed_cmd = commands.add_parser("seed", help="залить детерминированный набор данных")
+    seed_cmd.add_argument("--size", choices=sorted(dataset.SIZES), default="10k")
+    seed_cmd.add_argument("--seed", type=int, default=dataset.DEFAULT_SEED)
+    seed_cmd.add_argument("--force", action="store_true")
+
+    run_cmd = commands.add_parser("run", help="прогнать сценарии")
+    run_cmd.add_argument("--size", choices=sorted(dataset.SIZES), default="10k")
+    run_cmd.add_argument("--concurrency", default=",".join(str(x) for x in DEFAULT_CONCURRENCY))
+    run_cmd.add_argument("--ops", type=int, default=DEFAULT_OPS)
+    run_cmd.add_argument("--cases", default=None, help="имена сценариев через запятую")
+    run_cmd.add_argument("--backend", choices=("core", "asyncpg"), default="core")
+    run_cmd.add_argument("--reads-only", action="store_true")
+    run_cmd.add_argument("--compare", action="store_true", help="сравнить с эталоном, код 1 при регрессии")
+    run_cmd.add_argument("--save-baseline", action="store_true")
+    run_cmd.add_argument("--tolerance", type=float, default=baseline.DEFAULT_TOLERANCE)
+    run_cmd.add_argument("--output", default=None, help="куда записать отчёт JSON")
+
+    memory_cmd = commands.add_parser("memory", help="память под выборку: dict против записей")
+    memory_cmd.add_argument("--size", choices=sorted(dataset.SIZES), default="10k")
+    memory_cmd.add_argument("--limit", type=int, default=1_000_000, help="строк в выборке, не больше")
+
+    args = parser.parse_args()
+    if args.command == "seed":
+        asyncio.run(_seed(args))
+    elif args.command == "memory":
+        sys.exit(asyncio.run(_memory(args)))
+    else:
+        sys.exit(asyncio.run(_run(args)))
+
+
+if __name__ == "__main__":
+    main()
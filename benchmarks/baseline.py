@@ -0,0 +1,76 @@
+# эталонные результаты и сравнение с ними. эталон снимается на опорной машине
+# (python -m benchmarks run --save-baseline) и хранится в benchmarks/baselines/<размер>.json
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Optional
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+# допустимое ухудшение: p99 выше эталона / пропускная способность ниже эталона на 25%
+DEFAULT_TOLERANCE = 0.25
+
+
+@dataclass(frozen=True)
+class Regression:
+    case: str
+    concurrency: str
+    metric: str
+    baseline: float
+    current: float
+
+    def __str__(self) -> str:
+        change = (self.current - self.baseline) / self.baseline * 100 if self.baseline else 0.0
+        return (
+            f"{self.case} @ {self.concurrency}: {self.metric} "
+            f"{self.baseline:.2f} -> {self.current:.2f} ({change:+.0f}%)"
+        )
+
+
+def baseline_path(size_label: str) -> Path:
+    return BASELINE_DIR / f"{size_label}.json"
+
+
+def load(path: Path) -> Optional[dict[str, Any]]:
+    if not path.exists():
+        return None
+    with path.open(encoding="utf-8") as f:
+        data: dict[str, Any] = json.load(f)
+    return data
+
+
+def save(path: Path, report: dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> list[Regression]:
+    """
+    Сравнивает прогон с эталоном.
+
+    Сравниваются только пары (сценарий, параллельность), которые есть в обоих
+    отчётах: новые сценарии не считаются регрессией.
+
+    :param baseline: Отчёт-эталон.
+    :param current: Отчёт текущего прогона.
+    :param tolerance: Допустимое относительное ухудшение.
+    :return: Найденные регрессии (пустой список - регрессий нет).
+    """
+    regressions: list[Regression] = []
+    for case, levels in current["results"].items():
+        for level, m in levels.items():
+            base = baseline["results"].get(case, {}).get(level)
+            if base is None:
+                continue
+            if m["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+                regressions.append(Regression(case, level, "p99_ms", base["p99_ms"], m["p99_ms"]))
+            if m["throughput"] < base["throughput"] * (1 - tolerance):
+                regressions.append(
+                    Regression(case, level, "throughput", base["throughput"], m["throughput"])
+                )
+    return regressions
@@ -0,0 +1,175 @@
+# сценарии бенчмарков: по одному на каждый метод WalletRepo и каждую функцию модуля
+# wallet_repository. prepare готовит аргумент вне замера (например, создаёт кошелёк,
+# который потом удаляется), run - замеряемая операция
+import random
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.repositories import wallet_repository as module
+from app.repositories.wallet_repository import InsufficientFunds, WalletRepo
+from benchmarks.dataset import MAX_BALANCE, NAME_WORDS
+
+
+@dataclass
+class Context:
+    repo: WalletRepo
+    engine: AsyncEngine
+    size: int
+    rnd: random.Random
+
+    def wallet_id(self) -> int:
+        # id из залитого набора; soft-deleted среди них ~2%, как и в живой базе
+        return self.rnd.randint(1, self.size)
+
+    def word(self) -> str:
+        return self.rnd.choice(NAME_WORDS)
+
+    def name(self) -> str:
+        return f"bench {self.rnd.randrange(10**9)}"
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    run: Callable[[Context, Any], Awaitable[Any]]
+    prepare: Optional[Callable[[Context], Awaitable[Any]]] = None
+    writes: bool = False
+    # операций на один уровень параллельности; None - значение из командной строки
+    ops: Optional[int] = None
+    # выше этого уровня параллельности сценарий не запускается
+    max_concurrency: Optional[int] = None
+    # на наборах больше этого размера сценарий не запускается (читает всю таблицу)
+    max_size: Optional[int] = None
+
+
+async def _take(rows: AsyncIterator[Any], n: int) -> int:
+    # первые n строк потокового чтения, затем курсор закрывается
+    taken = 0
+    async for _ in rows:
+        taken += 1
+        if taken >= n:
+            break
+    aclose = getattr(rows, "aclose", None)
+    if aclose is not None:
+        await aclose()
+    return taken
+
+
+async def _created(ctx: Context) -> int:
+    return int((await ctx.repo.create(ctx.name()))["id"])
+
+
+async def _soft_deleted(ctx: Context) -> int:
+    wallet_id = await _created(ctx)
+    await ctx.repo.soft_delete(wallet_id)
+    return wallet_id
+
+
+async def _hot(ctx: Context) -> int:
+    wallet_id = await _created(ctx)
+    await ctx.repo.enable_hot_wallet(wallet_id)
+    return wallet_id
+
+
+async def _transfer(ctx: Context, _: Any) -> None:
+    try:
+        await ctx.repo.transfer(ctx.wallet_id(), ctx.wallet_id() + 1, 0.01, "bench")
+    except (InsufficientFunds, module.WalletNotFound):
+        pass
+
+
+async def _transfer_module(ctx: Context, _: Any) -> None:
+    try:
+        await module.transfer_between_wallets(ctx.engine, ctx.wallet_id(), ctx.wallet_id() + 1, 0.01)
+    except (InsufficientFunds, module.WalletNotFound):
+        pass
+
+
+def _deltas(ctx: Context) -> list[tuple[int, float]]:
+    return [(ctx.wallet_id(), 0.01) for _ in range(100)]
+
+
+# ----- методы WalletRepo
+REPO_CASES = [
+    Case("exists", lambda c, _: c.repo.exists(c.wallet_id())),
+    Case("get_by_id", lambda c, _: c.repo.get_by_id(c.wallet_id())),
+    Case("get_all[limit=50]", lambda c, _: c.repo.get_all(limit=50)),
+    Case("iter_all[1000]", lambda c, _: _take(c.repo.iter_all(), 1000)),
+    Case("search[word]",
+         lambda c, _: c.repo.search(name_part=c.word(), order_by="balance", desc=True, limit=50)),
+    Case("iter_search[word]", lambda c, _: _take(c.repo.iter_search(name_part=c.word()), 1000)),
+    Case("search_records[word]",
+         lambda c, _: c.repo.search_records(name_part=c.word(), order_by="balance", desc=True, limit=50)),
+    Case("iter_search_records[word]",
+         lambda c, _: _take(c.repo.iter_search_records(name_part=c.word()), 1000)),
+    Case("search_page[min_balance]",
+         lambda c, _: c.repo.search_page(min_balance=MAX_BALANCE * 0.9, order_by="balance", limit=50)),
+    Case("has_trgm", lambda c, _: c.repo.has_trgm()),
+    Case("search_fuzzy", lambda c, _: c.repo.search_fuzzy(f"{c.word()} {c.rnd.randrange(1000)}")),
+    Case("count", lambda c, _: c.repo.count()),
+    Case("count[include_deleted]", lambda c, _: c.repo.count(include_deleted=True), ops=20),
+    Case("avg_balance", lambda c, _: c.repo.avg_balance()),
+    Case("max_balance_wallet", lambda c, _: c.repo.max_balance_wallet()),
+    Case("top_by_balance[10]", lambda c, _: c.repo.top_by_balance(10)),
+    Case("create", lambda c, _: c.repo.create(c.name()), writes=True),
+    Case("update_name", lambda c, _: c.repo.update_name(c.wallet_id(), c.name()), writes=True),
+    Case("update_balance_if_enough",
+         lambda c, _: c.repo.update_balance_if_enough(c.wallet_id(), 0.01), writes=True),
+    Case("apply_deltas_batch[100]", lambda c, _: c.repo.apply_deltas_batch(_deltas(c)), writes=True),
+    Case("transfer", _transfer, writes=True),
+    Case("create_batch[100]",
+         lambda c, _: c.repo.create_batch([c.name() for _ in range(100)]), writes=True),
+    Case("create_bulk[1000]",
+         lambda c, _: c.repo.create_bulk(c.name() for _ in range(1000)), writes=True, ops=20),
+    Case("soft_delete", lambda c, wallet_id: c.repo.soft_delete(wallet_id), prepare=_created, writes=True),
+    Case("restore", lambda c, wallet_id: c.repo.restore(wallet_id), prepare=_soft_deleted, writes=True),
+    Case("hard_delete", lambda c, wallet_id: c.repo.hard_delete(wallet_id), prepare=_created, writes=True),
+    Case("enable_hot_wallet", lambda c, wallet_id: c.repo.enable_hot_wallet(wallet_id),
+         prepare=_created, writes=True),
+    Case("disable_hot_wallet", lambda c, wallet_id: c.repo.disable_hot_wallet(wallet_id),
+         prepare=_hot, writes=True),
+    Case("fold_hot_wallets", lambda c, _: c.repo.fold_hot_wallets(), writes=True, max_concurrency=1),
+    Case("refresh_stale_max", lambda c, _: c.repo.refresh_stale_max(), writes=True, max_concurrency=1),
+    # пересчёт блокирует запись во wallets и читает всю таблицу
+    Case("rebuild_stats", lambda c, _: c.repo.rebuild_stats(), writes=True, ops=3,
+         max_concurrency=1, max_size=1_000_000),
+]
+
+# ----- функции модуля (каждая создаёт свой WalletRepo поверх engine)
+MODULE_CASES = [
+    Case("module.wallet_exists", lambda c, _: module.wallet_exists(c.engine, c.wallet_id())),
+    Case("module.get_wallet_by_id", lambda c, _: module.get_wallet_by_id(c.engine, c.wallet_id())),
+    Case("module.get_all_wallets", lambda c, _: module.get_all_wallets(c.engine), ops=20,
+         max_size=10_000),
+    Case("module.search_wallets[min_balance]",
+         lambda c, _: module.search_wallets(c.engine, min_balance=MAX_BALANCE * 0.999), ops=20),
+    Case("module.search_wallets_page",
+         lambda c, _: module.search_wallets_page(c.engine, name_part=c.word(), limit=50)),
+    Case("module.search_wallets_fuzzy",
+         lambda c, _: module.search_wallets_fuzzy(c.engine, f"{c.word()} {c.rnd.randrange(1000)}")),
+    Case("module.count_wallets", lambda c, _: module.count_wallets(c.engine)),
+    Case("module.avg_balance", lambda c, _: module.avg_balance(c.engine)),
+    Case("module.max_balance_wallet", lambda c, _: module.max_balance_wallet(c.engine)),
+    Case("module.top_wallets_by_balance", lambda c, _: module.top_wallets_by_balance(c.engine)),
+    Case("module.create_wallet", lambda c, _: module.create_wallet(c.engine, c.name()), writes=True),
+    Case("module.update_wallet",
+         lambda c, _: module.update_wallet(c.engine, c.wallet_id(), c.name()), writes=True),
+    Case("module.delete_wallet", lambda c, wallet_id: module.delete_wallet(c.engine, wallet_id),
+         prepare=_created, writes=True),
+    Case("module.update_balance_if_enough",
+         lambda c, _: module.update_balance_if_enough(c.engine, c.wallet_id(), 0.01), writes=True),
+    Case("module.apply_balance_deltas",
+         lambda c, _: module.apply_balance_deltas(c.engine, _deltas(c)), writes=True),
+    Case("module.transfer_between_wallets", _transfer_module, writes=True),
+    Case("module.create_wallets_batch",
+         lambda c, _: module.create_wallets_batch(c.engine, [c.name() for _ in range(100)]), writes=True),
+    Case("module.create_wallets_bulk",
+         lambda c, _: module.create_wallets_bulk(c.engine, [c.name() for _ in range(1000)]),
+         writes=True, ops=20),
+    Case("module.soft_delete_wallet", lambda c, wallet_id: module.soft_delete_wallet(c.engine, wallet_id),
+         prepare=_created, writes=True),
+]
+
+ALL_CASES = REPO_CASES + MODULE_CASES
@@ -0,0 +1,133 @@
+# детерминированные наборы данных для бенчмарков.
+# строки генерирует сам Postgres (generate_series), значения - чистые функции от номера
+# строки и seed, без random(): один и тот же (size, seed) даёт одни и те же данные
+# на любой машине и при любом плане запроса
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.repositories.wallet_stats import rebuild_wallet_stats
+from database.migrate import migrate
+
+# размеры наборов: столько кошельков и столько же операций
+SIZES = {
+    "10k": 10_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+DEFAULT_SEED = 42
+# строк в одном INSERT ... SELECT при заливке (каждый - отдельная транзакция)
+SEED_CHUNK = 1_000_000
+# каждый DELETED_EVERY-й кошелёк - soft-deleted
+DELETED_EVERY = 50
+# балансы равномерно в [0, MAX_BALANCE)
+MAX_BALANCE = 10_000
+# первое слово имени; поиск по нему в бенчмарках находит ~1/len(NAME_WORDS) кошельков
+NAME_WORDS = (
+    "alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel",
+    "india", "juliet", "kilo", "lima", "mike", "november", "oscar", "papa",
+)
+
+_MARKER_TABLE = """
+CREATE TABLE IF NOT EXISTS bench_dataset (
+    size BIGINT NOT NULL,
+    seed INTEGER NOT NULL,
+    seeded_at TIMESTAMP NOT NULL DEFAULT NOW()
+)
+"""
+
+_WORDS_SQL = "ARRAY[" + ", ".join(f"'{w}'" for w in NAME_WORDS) + "]"
+
+_INSERT_WALLETS = f"""
+INSERT INTO wallets (id, name, balance, created_at, deleted_at)
+SELECT
+    i,
+    ({_WORDS_SQL})[1 + (i * 31 + :seed) % {len(NAME_WORDS)}] || ' ' || i,
+    ((i * 2654435761 + :seed) % ({MAX_BALANCE} * 100)) / 100.0,
+    TIMESTAMP '2025-01-01' + i * INTERVAL '1 second',
+    CASE WHEN i % {DELETED_EVERY} = 0 THEN TIMESTAMP '2025-06-01' END
+FROM generate_series(CAST(:first AS BIGINT), CAST(:last AS BIGINT)) AS i
+"""
+
+_INSERT_TRANSACTIONS = """
+INSERT INTO transactions (id, wallet_id, amount, description, created_at)
+SELECT
+    i,
+    1 + (i * 7919 + :seed) % :size,
+    ((i * 48271 + :seed) % 20001 - 10000) / 100.0,
+    'bench',
+    TIMESTAMP '2025-01-01' + i * INTERVAL '500 milliseconds'
+FROM generate_series(CAST(:first AS BIGINT), CAST(:last AS BIGINT)) AS i
+"""
+
+_RESET = (
+    "TRUNCATE wallets, transactions, wallet_stats, hot_wallets, wallet_balance_shards "
+    "RESTART IDENTITY CASCADE"
+)
+
+
+@dataclass(frozen=True)
+class Dataset:
+    size: int
+    seed: int
+
+
+async def current(engine: AsyncEngine) -> Optional[Dataset]:
+    """
+    Возвращает набор данных, залитый в базу бенчмарков.
+
+    :param engine: AsyncEngine базы бенчмарков.
+    :return: Dataset или None, если база ещё не заполнялась.
+    """
+    async with engine.begin() as conn:
+        await conn.execute(text(_MARKER_TABLE))
+        row = (await conn.execute(text("SELECT size, seed FROM bench_dataset"))).first()
+    return Dataset(size=int(row.size), seed=int(row.seed)) if row else None
+
+
+async def seed(engine: AsyncEngine, size: int, seed: int = DEFAULT_SEED, force: bool = False) -> bool:
+    """
+    Заливает в базу бенчмарков size кошельков и size операций.
+
+    Все данные базы бенчмарков удаляются. Схема создаётся миграциями.
+
+    :param engine: AsyncEngine базы бенчмарков.
+    :param size: Количество кошельков (и операций).
+    :param seed: Seed генерации значений.
+    :param force: Перезалить, даже если такой набор уже залит.
+    :return: False, если набор уже был залит и перезаливка не понадобилась.
+    """
+    await migrate(engine)
+    if not force and await current(engine) == Dataset(size, seed):
+        return False
+
+    async with engine.begin() as conn:
+        await conn.execute(text(_RESET))
+        await conn.execute(text("DELETE FROM bench_dataset"))
+
+    for sql, table in ((_INSERT_WALLETS, "wallets"), (_INSERT_TRANSACTIONS, "transactions")):
+        started = time.perf_counter()
+        for first in range(1, size + 1, SEED_CHUNK):
+            last = min(size, first + SEED_CHUNK - 1)
+            async with engine.begin() as conn:
+                await conn.execute(text(sql), {"first": first, "last": last, "seed": seed, "size": size})
+            print(f"{table}: {last}/{size} ({time.perf_counter() - started:.0f}s)")
+        async with engine.begin() as conn:
+            # id вставлены явно: последовательность двигаем за последний
+            await conn.execute(
+                text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), :size)"), {"size": size}
+            )
+
+    async with engine.begin() as conn:
+        await rebuild_wallet_stats(conn)
+        await conn.execute(text("INSERT INTO bench_dataset (size, seed) VALUES (:size, :seed)"),
+                           {"size": size, "seed": seed})
+
+    # свежая статистика планировщика и visibility map: без них первые прогоны медленнее
+    async with engine.connect() as conn:
+        autocommit = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await autocommit.execute(text("VACUUM ANALYZE wallets, transactions"))
+    return True
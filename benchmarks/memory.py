@@ -0,0 +1,65 @@
+# память под большие выборки: dict на строку (как отдают search/list_by_wallet)
+# против компактных записей WalletRecord/TransactionRecord. замер tracemalloc:
+# retained - сколько занимает загруженный список вместе со значениями полей,
+# peak - пик во время загрузки (строки драйвера, буферы)
+import gc
+import time
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.repositories.records import TransactionRecord, fetch_records
+from app.repositories.transaction_repository import TransactionRepo
+from app.repositories.wallet_repository import WalletRepo
+from database.database import transactions
+
+
+@dataclass(frozen=True)
+class MemoryMeasurement:
+    rows: int
+    retained_bytes: int
+    peak_bytes: int
+    seconds: float
+
+    @property
+    def bytes_per_row(self) -> float:
+        return self.retained_bytes / self.rows if self.rows else 0.0
+
+
+async def measure_memory(load: Callable[[], Awaitable[list[Any]]]) -> MemoryMeasurement:
+    """
+    Загружает выборку под tracemalloc.
+
+    :param load: Корутина-фабрика, возвращающая список строк.
+    :return: MemoryMeasurement с числом строк, памятью и временем загрузки.
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        rows = await load()
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    measurement = MemoryMeasurement(len(rows), current - before, peak - before, elapsed)
+    del rows
+    return measurement
+
+
+def loaders(engine: AsyncEngine, repo: WalletRepo, limit: int) -> dict[str, Callable[[], Awaitable[list[Any]]]]:
+    # пары "dict / запись" по каждой таблице; списки операций кошелька короткие,
+    # поэтому для операций берётся вся таблица тем же путём, что и в TransactionRepo
+    tx_stmt = select(transactions).order_by(transactions.c.id).limit(limit)
+    tx_repo = TransactionRepo(engine)
+    return {
+        "wallets dict": lambda: repo.search(include_deleted=True, limit=limit),
+        "wallets WalletRecord": lambda: repo.search_records(include_deleted=True, limit=limit),
+        "transactions dict": lambda: tx_repo._fetch_all(tx_stmt),
+        "transactions TransactionRecord": lambda: fetch_records(engine, tx_stmt, TransactionRecord),
+    }
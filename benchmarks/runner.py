@@ -0,0 +1,86 @@
+# прогон сценария на нескольких уровнях параллельности: задержки p50/p99 и пропускная способность
+import asyncio
+import random
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Callable
+
+from benchmarks.cases import Case, Context
+
+DEFAULT_CONCURRENCY = (1, 8, 32)
+DEFAULT_OPS = 200
+# прогревочных операций перед замером: кэш планов, пул соединений, prepared statements
+WARMUP_OPS = 5
+
+
+@dataclass(frozen=True)
+class Measurement:
+    ops: int
+    p50_ms: float
+    p99_ms: float
+    throughput: float  # операций в секунду
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def measure(
+    case: Case,
+    make_context: Callable[[random.Random], Context],
+    concurrency: int,
+    ops: int,
+    seed: int,
+) -> Measurement:
+    """
+    Выполняет ops операций сценария в concurrency параллельных задачах.
+
+    Аргументы prepare готовятся до замера, в замер попадает только run.
+    У каждой задачи свой random.Random от seed, поэтому последовательность
+    аргументов воспроизводима.
+
+    :param case: Сценарий.
+    :param make_context: Фабрика Context по генератору случайных чисел.
+    :param concurrency: Число параллельных задач.
+    :param ops: Число замеряемых операций.
+    :param seed: Seed генераторов.
+    :return: Measurement с задержками и пропускной способностью.
+    """
+    contexts = [make_context(random.Random(seed * 1000 + i)) for i in range(concurrency)]
+    total = WARMUP_OPS + ops
+    args: list[Any] = []
+    for i in range(total):
+        ctx = contexts[i % concurrency]
+        args.append(await case.prepare(ctx) if case.prepare is not None else None)
+
+    for i in range(WARMUP_OPS):
+        await case.run(contexts[0], args[i])
+
+    queue = iter(range(WARMUP_OPS, total))
+    latencies: list[float] = []
+
+    async def worker(ctx: Context) -> None:
+        # задачи разбирают общую очередь: быстрые берут больше операций
+        for i in queue:
+            started = time.perf_counter()
+            await case.run(ctx, args[i])
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(ctx) for ctx in contexts))
+    elapsed = time.perf_counter() - started
+
+    return Measurement(
+        ops=len(latencies),
+        p50_ms=percentile(latencies, 0.5) * 1000,
+        p99_ms=percentile(latencies, 0.99) * 1000,
+        throughput=len(latencies) / elapsed,
+    )
+
+
+def to_json(results: dict[str, dict[int, Measurement]]) -> dict[str, dict[str, dict[str, Any]]]:
+    return {
+        case: {str(level): asdict(m) for level, m in levels.items()}
+        for case, levels in results.items()
+    }
@@ -1,5 +1,8 @@
 import os
+from dataclasses import dataclass
 from functools import lru_cache
+from typing import Any, Optional
+from uuid import uuid4
 from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 # здесь мы конвертируем нашу schema.sql в бд построенную через alchemy
 
@@ -9,10 +12,16 @@ from sqlalchemy import (
     Table,
     Column,
     Integer,
+    BigInteger,
+    SmallInteger,
     String,
     Numeric,
+    Date,
     DateTime,
+    Boolean,
     ForeignKey,
+    Index,
+    false,
     func,
 )
 
@@ -30,6 +39,27 @@ wallets = Table(
     Column("deleted_at", DateTime, nullable=True),
 )
 
+# индексы под keyset-пагинацию списка кошельков: (колонка сортировки, id) без soft-deleted строк.
+# страница "после курсора" читается коротким range scan'ом, сортировка по id идёт по PK
+Index(
+    "ix_wallets_name_id_active",
+    wallets.c.name,
+    wallets.c.id,
+    postgresql_where=wallets.c.deleted_at.is_(None),
+)
+Index(
+    "ix_wallets_balance_id_active",
+    wallets.c.balance,
+    wallets.c.id,
+    postgresql_where=wallets.c.deleted_at.is_(None),
+)
+Index(
+    "ix_wallets_created_at_id_active",
+    wallets.c.created_at,
+    wallets.c.id,
+    postgresql_where=wallets.c.deleted_at.is_(None),
+)
+
 # CREATE TABLE transactions (...)
 transactions = Table(
     "transactions",
@@ -42,6 +72,175 @@ transactions = Table(
     Column("deleted_at", DateTime, nullable=True),
 )
 
+# индексы под историю операций кошелька: (wallet_id, created_at) без soft-deleted строк.
+# запрос "операции кошелька за период" идёт range scan'ом по индексу, а не по всей таблице.
+# отдельные частичные индексы по знаку суммы обслуживают выборки только доходов/расходов
+Index(
+    "ix_transactions_wallet_created_at",
+    transactions.c.wallet_id,
+    transactions.c.created_at,
+    postgresql_where=transactions.c.deleted_at.is_(None),
+)
+Index(
+    "ix_transactions_wallet_created_at_income",
+    transactions.c.wallet_id,
+    transactions.c.created_at,
+    postgresql_where=(transactions.c.deleted_at.is_(None)) & (transactions.c.amount > 0),
+)
+Index(
+    "ix_transactions_wallet_created_at_expense",
+    transactions.c.wallet_id,
+    transactions.c.created_at,
+    postgresql_where=(transactions.c.deleted_at.is_(None)) & (transactions.c.amount < 0),
+)
+
+# статистика не удалённых кошельков, которую поддерживают сами операции записи.
+# строк STATS_SLOTS штук, кошелёк попадает в слот id % STATS_SLOTS: параллельные записи
+# в разные кошельки блокируют разные строки, а чтение - это сумма по STATS_SLOTS строкам.
+# max_wallet_id/max_balance - максимум слота; max_stale=true, если максимальный кошелёк
+# уменьшился или удалён, и максимум слота надо пересчитать
+STATS_SLOTS = 16
+
+wallet_stats = Table(
+    "wallet_stats",
+    metadata,
+    Column("slot", SmallInteger, primary_key=True, autoincrement=False),
+    Column("active_count", BigInteger, nullable=False, server_default="0"),
+    Column("balance_sum", Numeric(20, 2), nullable=False, server_default="0"),
+    Column("max_balance", Numeric(12, 2), nullable=True),
+    Column("max_wallet_id", Integer, nullable=True),
+    Column("max_stale", Boolean, nullable=False, server_default=false()),
+)
+
+# "горячие" кошельки (на них приходится основная часть пополнений).
+# пополнение такого кошелька прибавляется к одной из HOT_WALLET_SHARDS строк
+# wallet_balance_shards, выбранной случайно, и не ждёт блокировку строки wallets.
+# баланс = wallets.balance + сумма delta его шардов; свёртка переносит шарды в wallets.balance
+HOT_WALLET_SHARDS = 8
+
+hot_wallets = Table(
+    "hot_wallets",
+    metadata,
+    Column("wallet_id", Integer, ForeignKey("wallets.id", ondelete="CASCADE"), primary_key=True),
+    Column("shards", SmallInteger, nullable=False),
+    Column("created_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+wallet_balance_shards = Table(
+    "wallet_balance_shards",
+    metadata,
+    Column("wallet_id", Integer, ForeignKey("wallets.id", ondelete="CASCADE"), primary_key=True),
+    Column("shard", SmallInteger, primary_key=True, autoincrement=False),
+    Column("delta", Numeric(14, 2), nullable=False, server_default="0"),
+)
+
+# предрасчитанные суммы доходов и расходов по дням (period='day') и месяцам (period='month'):
+# по каждому кошельку и по всем кошелькам вместе (wallet_id = ROLLUP_ALL_WALLETS).
+# expense - сумма расходов по модулю. в свёртку попадают операции с id не выше
+# rollup_state.last_transaction_id, остальное досчитывается по transactions
+ROLLUP_ALL_WALLETS = 0
+
+transaction_rollups = Table(
+    "transaction_rollups",
+    metadata,
+    Column("period", String(5), primary_key=True),
+    Column("wallet_id", Integer, primary_key=True, autoincrement=False),
+    Column("period_start", Date, primary_key=True),
+    Column("income", Numeric(20, 2), nullable=False, server_default="0"),
+    Column("expense", Numeric(20, 2), nullable=False, server_default="0"),
+    Column("income_count", BigInteger, nullable=False, server_default="0"),
+    Column("expense_count", BigInteger, nullable=False, server_default="0"),
+)
+
+rollup_state = Table(
+    "rollup_state",
+    metadata,
+    Column("name", String(50), primary_key=True),
+    Column("last_transaction_id", BigInteger, nullable=False, server_default="0"),
+)
+
+# сверка wallets.balance (вместе с шардами горячих кошельков) с суммой операций леджера.
+# прогон делит id кошельков на чанки; готовый чанк записывается в reconciliation_chunks
+# в той же транзакции, что и найденные расхождения, поэтому прерванный прогон
+# продолжается с непроверенных чанков
+reconciliation_runs = Table(
+    "reconciliation_runs",
+    metadata,
+    Column("id", Integer, primary_key=True),
+    Column("started_at", DateTime, nullable=False, server_default=func.now()),
+    Column("finished_at", DateTime, nullable=True),
+    Column("chunk_size", Integer, nullable=False),
+    Column("first_wallet_id", Integer, nullable=False),
+    Column("last_wallet_id", Integer, nullable=False),
+    Column("repair", String(10), nullable=True),  # None - только отчёт
+)
+
+reconciliation_chunks = Table(
+    "reconciliation_chunks",
+    metadata,
+    Column("run_id", Integer, ForeignKey("reconciliation_runs.id", ondelete="CASCADE"), primary_key=True),
+    Column("chunk_start", Integer, primary_key=True, autoincrement=False),
+    Column("checked", Integer, nullable=False),
+    Column("drifted", Integer, nullable=False),
+    Column("repaired", Integer, nullable=False),
+    Column("finished_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+reconciliation_drifts = Table(
+    "reconciliation_drifts",
+    metadata,
+    Column("run_id", Integer, ForeignKey("reconciliation_runs.id", ondelete="CASCADE"), primary_key=True),
+    Column("wallet_id", Integer, primary_key=True, autoincrement=False),
+    Column("balance", Numeric(14, 2), nullable=False),
+    Column("ledger", Numeric(20, 2), nullable=False),
+    Column("repaired", Boolean, nullable=False, server_default=false()),
+)
+
+# архив: soft-deleted строки старше срока хранения переносятся сюда из wallets и
+# transactions (см. app/repositories/archive.py), чтобы горячие таблицы и их индексы
+# не росли за счёт удалённого. внешних ключей нет: операции архивного кошелька лежат
+# в архиве вместе с ним. balance - баланс на момент архивации вместе с шардами
+wallets_archive = Table(
+    "wallets_archive",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(255), nullable=False),
+    Column("balance", Numeric(14, 2), nullable=False),
+    Column("created_at", DateTime, nullable=False),
+    Column("deleted_at", DateTime, nullable=False),
+    Column("archived_at", DateTime, nullable=False, server_default=func.now()),
+)
+
+transactions_archive = Table(
+    "transactions_archive",
+    metadata,
+    Column("id", Integer, primary_key=True, autoincrement=False),
+    Column("wallet_id", Integer, nullable=False),
+    Column("amount", Numeric(12, 2), nullable=False),
+    Column("description", String(255), nullable=True),
+    Column("created_at", DateTime, nullable=False),
+    Column("deleted_at", DateTime, nullable=True),  # NULL - операция ушла вместе с кошельком
+    Column("archived_at", DateTime, nullable=False, server_default=func.now()),
+)
+Index("ix_transactions_archive_wallet_id", transactions_archive.c.wallet_id)
+
+# поиск кандидатов в архив: частичные индексы только по удалённым строкам, их мало
+Index(
+    "ix_wallets_deleted_at",
+    wallets.c.deleted_at,
+    postgresql_where=wallets.c.deleted_at.is_not(None),
+)
+Index(
+    "ix_transactions_deleted_at",
+    transactions.c.deleted_at,
+    postgresql_where=transactions.c.deleted_at.is_not(None),
+)
+Index(
+    "ix_transactions_wallet_id_deleted",
+    transactions.c.wallet_id,
+    postgresql_where=transactions.c.deleted_at.is_not(None),
+)
+
 # Дальше добавляем в этот же файл подключение к БД и создание таблиц
 
 
@@ -55,19 +254,149 @@ def _get_database_url() -> str:
     return url
 
 
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if not value:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class DatabaseSettings:
+    # настройки engine и пула соединений; по умолчанию читаются из переменных окружения
+    url: str
+    echo: bool = False  # логирование каждого запроса - дорого, только для отладки
+    pool_size: int = 5  # постоянные соединения пула одного воркера
+    max_overflow: int = 10  # сколько соединений можно открыть сверх pool_size под пиковую нагрузку
+    pool_timeout: float = 30.0  # сколько ждать свободное соединение, секунды
+    pool_recycle: int = 1800  # пересоздавать соединения старше N секунд (-1 - никогда)
+    pool_pre_ping: bool = True  # проверять соединение перед выдачей из пула
+    statement_cache_size: int = 100  # кэш prepared statements asyncpg на соединение
+    pgbouncer: bool = False  # режим PgBouncer (transaction pooling): без prepared statements
+    workers: int = 1  # количество воркеров uvicorn, делящих бюджет соединений
+    max_connections: Optional[int] = None  # бюджет соединений к Postgres на всё приложение
+    repo_backend: str = "core"  # реализация WalletRepo: "core" (SQLAlchemy Core) или "asyncpg"
+    cache_size: int = 0  # кэш кошельков по id на процесс, записей (0 - выключен)
+    cache_ttl: float = 30.0  # время жизни записи кэша кошельков, секунды
+    topup_window: float = 0.0  # окно группового коммита пополнений, секунды (0 - выключен)
+    topup_max_batch: int = 1000  # пополнений в одной транзакции группового коммита
+    slow_query_threshold: float = 0.0  # порог медленного запроса для EXPLAIN, секунды (0 - выключено)
+    slow_query_buffer: int = 100  # сколько последних медленных запросов хранить
+    slow_query_interval: float = 10.0  # не чаще одного EXPLAIN за столько секунд
+
+    @classmethod
+    def from_env(cls) -> "DatabaseSettings":
+        max_connections = os.getenv("DB_MAX_CONNECTIONS")
+        return cls(
+            url=_get_database_url(),
+            echo=_env_bool("DB_ECHO", False),
+            pool_size=_env_int("DB_POOL_SIZE", 5),
+            max_overflow=_env_int("DB_MAX_OVERFLOW", 10),
+            pool_timeout=_env_float("DB_POOL_TIMEOUT", 30.0),
+            pool_recycle=_env_int("DB_POOL_RECYCLE", 1800),
+            pool_pre_ping=_env_bool("DB_POOL_PRE_PING", True),
+            statement_cache_size=_env_int("DB_STATEMENT_CACHE_SIZE", 100),
+            pgbouncer=_env_bool("DB_PGBOUNCER", False),
+            # WEB_CONCURRENCY - та же переменная, из которой uvicorn берёт число воркеров
+            workers=_env_int("WEB_CONCURRENCY", 1),
+            max_connections=int(max_connections) if max_connections else None,
+            repo_backend=os.getenv("WALLET_REPO_BACKEND", "core"),
+            cache_size=_env_int("WALLET_CACHE_SIZE", 0),
+            cache_ttl=_env_float("WALLET_CACHE_TTL", 30.0),
+            topup_window=_env_float("TOPUP_COALESCE_WINDOW", 0.0),
+            topup_max_batch=_env_int("TOPUP_COALESCE_MAX_BATCH", 1000),
+            slow_query_threshold=_env_float("SLOW_QUERY_THRESHOLD", 0.0),
+            slow_query_buffer=_env_int("SLOW_QUERY_BUFFER_SIZE", 100),
+            slow_query_interval=_env_float("SLOW_QUERY_SAMPLE_INTERVAL", 10.0),
+        )
+
+    def pool_limits(self) -> tuple[int, int]:
+        # (pool_size, max_overflow) одного воркера.
+        # если задан бюджет соединений, делим его на воркеры, чтобы
+        # workers * (pool_size + max_overflow) не превысило max_connections Postgres
+        pool_size, max_overflow = self.pool_size, self.max_overflow
+        if self.max_connections is None:
+            return pool_size, max_overflow
+
+        per_worker = self.max_connections // max(self.workers, 1)
+        if per_worker < 1:
+            raise RuntimeError(
+                f"DB_MAX_CONNECTIONS={self.max_connections} is too small for {self.workers} workers"
+            )
+        pool_size = min(pool_size, per_worker)
+        max_overflow = min(max_overflow, per_worker - pool_size)
+        return pool_size, max_overflow
+
+    def connect_args(self) -> dict[str, Any]:
+        # аргументы для asyncpg.connect и asyncpg-диалекта SQLAlchemy
+        if self.pgbouncer:
+            # PgBouncer в режиме transaction pooling не держит prepared statements
+            # между транзакциями: выключаем оба кэша и даём уникальные имена
+            return {
+                "statement_cache_size": 0,
+                "prepared_statement_cache_size": 0,
+                "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+            }
+        return {
+            "statement_cache_size": self.statement_cache_size,
+            "prepared_statement_cache_size": self.statement_cache_size,
+        }
+
+
+def create_engine_from_settings(settings: DatabaseSettings) -> AsyncEngine:
+    # новый engine по настройкам; в приложении используем общий из get_engine()
+    pool_size, max_overflow = settings.pool_limits()
+    return create_async_engine(
+        settings.url,
+        echo=settings.echo,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_timeout=settings.pool_timeout,
+        pool_recycle=settings.pool_recycle,
+        pool_pre_ping=settings.pool_pre_ping,
+        connect_args=settings.connect_args(),
+    )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> DatabaseSettings:
+    # настройки читаем из окружения один раз на процесс
+    return DatabaseSettings.from_env()
+
+
 @lru_cache(maxsize=1)
-def get_engine(echo: bool = True) -> AsyncEngine:
+def get_engine() -> AsyncEngine:
     # создаём (и кэшируем) engine, чтобы его можно было получить и использовать из любого места приложения
-    return create_async_engine(_get_database_url(), echo=echo)
+    return create_engine_from_settings(get_settings())
+
+
+async def dispose_engine() -> None:
+    # закрываем соединения пула при остановке приложения
+    if get_engine.cache_info().currsize:
+        await get_engine().dispose()
 
 
-# оставляем переменную engine для обратной совместимости (если она уже импортируется в других местах)
-engine = get_engine(echo=True)
+def __getattr__(name: str) -> Any:
+    # оставляем переменную engine для обратной совместимости (from database.database import engine).
+    # engine создаётся лениво: импорт модуля больше не требует DATABASE_URL и не открывает пул
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 async def create_tables(db_engine: AsyncEngine | None = None) -> None:
     # можно передать свой engine (например для тестов); если не передали — используем общий
-    db_engine = db_engine or engine
+    db_engine = db_engine or get_engine()
     async with db_engine.begin() as conn:
         await conn.run_sync(metadata.create_all)
 
@@ -0,0 +1,181 @@
+# применение версионных миграций из database/migrations.
+# применённые версии записываются в таблицу schema_migrations,
+# параллельный запуск (несколько подов при деплое) исключает advisory lock
+import asyncio
+import importlib
+import pkgutil
+from dataclasses import dataclass
+from types import ModuleType
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from database import migrations
+from database.database import get_engine
+
+# ключ pg_advisory_lock: одно и то же число у всех экземпляров мигратора
+MIGRATIONS_LOCK_KEY = 7_310_001
+# пауза между попытками взять блокировку, секунды
+LOCK_POLL_INTERVAL = 1.0
+
+_CREATE_VERSIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    version INTEGER PRIMARY KEY,
+    name VARCHAR(255) NOT NULL,
+    applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+)
+"""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    transactional: bool
+    upgrade: Callable[[AsyncConnection], Awaitable[None]]
+
+
+def _load(module: ModuleType, name: str) -> Migration:
+    return Migration(
+        version=int(module.VERSION),
+        name=name,
+        transactional=bool(getattr(module, "TRANSACTIONAL", True)),
+        upgrade=module.upgrade,
+    )
+
+
+def discover() -> list[Migration]:
+    """
+    Находит все миграции в пакете database.migrations.
+
+    :return: Миграции по возрастанию версии.
+    :raises RuntimeError: Если две миграции объявили одну версию.
+    """
+    found: dict[int, Migration] = {}
+    for info in pkgutil.iter_modules(migrations.__path__):
+        module = importlib.import_module(f"{migrations.__name__}.{info.name}")
+        migration = _load(module, info.name)
+        if migration.version in found:
+            raise RuntimeError(
+                f"duplicate migration version {migration.version}: "
+                f"{found[migration.version].name}, {migration.name}"
+            )
+        found[migration.version] = migration
+    return [found[v] for v in sorted(found)]
+
+
+async def create_index_concurrently(conn: AsyncConnection, name: str, definition: str) -> None:
+    """
+    Создаёт индекс через CREATE INDEX CONCURRENTLY, не блокируя запись в таблицу.
+
+    Прерванная сборка CONCURRENTLY оставляет индекс в состоянии INVALID, а
+    IF NOT EXISTS его бы пропустил - поэтому такой индекс сначала удаляется.
+    Соединение должно быть в режиме AUTOCOMMIT.
+
+    :param conn: Соединение без открытой транзакции.
+    :param name: Имя индекса.
+    :param definition: Определение после имени: "таблица (колонки) [WHERE ...]".
+    """
+    invalid = (
+        await conn.execute(
+            text(
+                "SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE c.relname = :name AND NOT i.indisvalid"
+            ),
+            {"name": name},
+        )
+    ).first()
+    if invalid is not None:
+        await conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+    await conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {definition}"))
+
+
+async def _acquire_lock(conn: AsyncConnection) -> None:
+    # pg_try_advisory_lock в цикле, а не ждущий pg_advisory_lock: ждущий запрос держит
+    # снимок, и CREATE INDEX CONCURRENTLY у владельца блокировки ждал бы его вечно
+    while True:
+        got = (
+            await conn.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+        ).scalar_one()
+        if got:
+            return
+        await asyncio.sleep(LOCK_POLL_INTERVAL)
+
+
+async def applied_versions(conn: AsyncConnection) -> set[int]:
+    await conn.execute(text(_CREATE_VERSIONS_TABLE))
+    rows = await conn.execute(text("SELECT version FROM schema_migrations"))
+    return {int(r[0]) for r in rows}
+
+
+async def _record(conn: AsyncConnection, migration: Migration) -> None:
+    await conn.execute(
+        text("INSERT INTO schema_migrations (version, name) VALUES (:version, :name)"),
+        {"version": migration.version, "name": migration.name},
+    )
+
+
+async def _apply(db_engine: AsyncEngine, migration: Migration) -> None:
+    if migration.transactional:
+        # изменения и запись о версии - в одной транзакции: либо всё, либо ничего
+        async with db_engine.begin() as conn:
+            await migration.upgrade(conn)
+            await _record(conn, migration)
+        return
+
+    # вне транзакции каждый запрос фиксируется сразу. если миграция упадёт на середине,
+    # версия не запишется и при следующем запуске она пойдёт заново -
+    # поэтому такие миграции обязаны быть идемпотентными (IF NOT EXISTS и т.п.)
+    async with db_engine.connect() as conn:
+        autocommit = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await migration.upgrade(autocommit)
+        await _record(autocommit, migration)
+
+
+async def migrate(
+    db_engine: Optional[AsyncEngine] = None,
+    target: Optional[int] = None,
+) -> list[Migration]:
+    """
+    Применяет ещё не применённые миграции по порядку версий.
+
+    :param db_engine: AsyncEngine; по умолчанию - общий engine приложения.
+    :param target: Последняя версия, которую нужно применить; None - все.
+    :return: Миграции, применённые этим запуском.
+    """
+    db_engine = db_engine or get_engine()
+    pending_all = discover()
+    applied: list[Migration] = []
+
+    # блокировка сессионная и держится на отдельном соединении без транзакции:
+    # CREATE INDEX CONCURRENTLY ждёт завершения чужих транзакций, и открытая
+    # транзакция мигратора заблокировала бы его самого
+    async with db_engine.connect() as lock_conn:
+        lock = await lock_conn.execution_options(isolation_level="AUTOCOMMIT")
+        await _acquire_lock(lock)
+        try:
+            done = await applied_versions(lock)
+            for migration in pending_all:
+                if migration.version in done:
+                    continue
+                if target is not None and migration.version > target:
+                    break
+                await _apply(db_engine, migration)
+                applied.append(migration)
+        finally:
+            await lock.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATIONS_LOCK_KEY})
+    return applied
+
+
+async def status(db_engine: Optional[AsyncEngine] = None) -> list[tuple[Migration, bool]]:
+    """
+    Возвращает список миграций с отметкой, применена ли каждая.
+
+    :param db_engine: AsyncEngine; по умолчанию - общий engine приложения.
+    :return: Пары (миграция, применена) по возрастанию версии.
+    """
+    db_engine = db_engine or get_engine()
+    async with db_engine.begin() as conn:
+        done = await applied_versions(conn)
+    return [(m, m.version in done) for m in discover()]
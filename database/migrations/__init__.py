@@ -0,0 +1,5 @@
+# версионные миграции схемы. каждый модуль vNNNN_<имя>.py задаёт:
+# - VERSION: номер версии (возрастает, не переиспользуется)
+# - TRANSACTIONAL: False, если миграция не может идти в транзакции (CREATE INDEX CONCURRENTLY)
+# - async upgrade(conn): сами изменения
+# применяет их database/migrate.py, запуск: python -m scripts.migrate
@@ -0,0 +1,34 @@
+# исходная схема: таблицы wallets и transactions с колонкой deleted_at.
+# IF NOT EXISTS - на базах, созданных create_tables/add_deleted_at.py, миграция ничего не меняет
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 1
+TRANSACTIONAL = True
+
+_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS wallets (
+        id SERIAL PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        balance NUMERIC(12, 2) NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "ALTER TABLE wallets ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP NULL",
+    """
+    CREATE TABLE IF NOT EXISTS transactions (
+        id SERIAL PRIMARY KEY,
+        wallet_id INTEGER NOT NULL REFERENCES wallets(id),
+        amount NUMERIC(12, 2) NOT NULL,
+        description VARCHAR(255),
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMP NULL",
+)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for sql in _STATEMENTS:
+        await conn.execute(text(sql))
@@ -0,0 +1,30 @@
+# индексы под фильтры репозиториев (см. Index(...) в database/database.py).
+# CONCURRENTLY строит индекс без блокировки записи в таблицу, но не работает в транзакции
+from database.migrate import create_index_concurrently
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 2
+TRANSACTIONAL = False
+
+# имя индекса -> определение (без CREATE INDEX)
+_INDEXES = {
+    # keyset-пагинация списка кошельков: (колонка сортировки, id) без soft-deleted строк
+    "ix_wallets_name_id_active": "wallets (name, id) WHERE deleted_at IS NULL",
+    "ix_wallets_balance_id_active": "wallets (balance, id) WHERE deleted_at IS NULL",
+    "ix_wallets_created_at_id_active": "wallets (created_at, id) WHERE deleted_at IS NULL",
+    # история операций кошелька за период, в том числе только доходы/расходы
+    "ix_transactions_wallet_created_at": (
+        "transactions (wallet_id, created_at) WHERE deleted_at IS NULL"
+    ),
+    "ix_transactions_wallet_created_at_income": (
+        "transactions (wallet_id, created_at) WHERE deleted_at IS NULL AND amount > 0"
+    ),
+    "ix_transactions_wallet_created_at_expense": (
+        "transactions (wallet_id, created_at) WHERE deleted_at IS NULL AND amount < 0"
+    ),
+}
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for name, definition in _INDEXES.items():
+        await create_index_concurrently(conn, name, definition)
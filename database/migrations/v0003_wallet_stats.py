@@ -0,0 +1,47 @@
+# таблица wallet_stats (агрегаты по не удалённым кошелькам) и её первичное заполнение.
+# SQL заполнения - замороженная копия на момент миграции: последующие правки
+# app/repositories/wallet_stats.py не должны менять то, что делает уже выпущенная миграция
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 3
+TRANSACTIONAL = True
+
+# число слотов на момент миграции (database.STATS_SLOTS)
+_SLOTS = 16
+
+# SHARE-блокировка wallets не даёт записям менять кошельки, пока идёт заполнение
+_FILL_SQL = """
+INSERT INTO wallet_stats (slot, active_count, balance_sum, max_balance, max_wallet_id, max_stale)
+SELECT s.slot, COALESCE(a.active_count, 0), COALESCE(a.balance_sum, 0), m.balance, m.id, false
+FROM generate_series(0, :slots - 1) AS s(slot)
+LEFT JOIN (
+    SELECT id % :slots AS slot, count(*) AS active_count, sum(balance) AS balance_sum
+    FROM wallets WHERE deleted_at IS NULL GROUP BY 1
+) a ON a.slot = s.slot
+LEFT JOIN (
+    SELECT DISTINCT ON (id % :slots) id % :slots AS slot, id, balance
+    FROM wallets WHERE deleted_at IS NULL
+    ORDER BY id % :slots, balance DESC, id DESC
+) m ON m.slot = s.slot
+"""
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    await conn.execute(
+        text(
+            """
+            CREATE TABLE IF NOT EXISTS wallet_stats (
+                slot SMALLINT PRIMARY KEY,
+                active_count BIGINT NOT NULL DEFAULT 0,
+                balance_sum NUMERIC(20, 2) NOT NULL DEFAULT 0,
+                max_balance NUMERIC(12, 2),
+                max_wallet_id INTEGER,
+                max_stale BOOLEAN NOT NULL DEFAULT false
+            )
+            """
+        )
+    )
+    await conn.execute(text("LOCK TABLE wallets IN SHARE MODE"))
+    await conn.execute(text("DELETE FROM wallet_stats"))
+    await conn.execute(text(_FILL_SQL), {"slots": _SLOTS})
@@ -0,0 +1,35 @@
+# GIN-индекс триграмм по имени кошелька для нечёткого поиска (WalletRepo.search_fuzzy).
+# если pg_trgm на сервере нет или расширение нельзя создать, миграция ничего не делает,
+# а поиск работает через ILIKE. после установки pg_trgm миграцию можно применить заново:
+# DELETE FROM schema_migrations WHERE version = 4; python -m scripts.migrate
+import logging
+
+from database.migrate import create_index_concurrently
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 4
+TRANSACTIONAL = False
+
+logger = logging.getLogger(__name__)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    available = (
+        await conn.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"))
+    ).first()
+    if available is None:
+        logger.warning("pg_trgm is not available, skipping trigram index")
+        return
+    try:
+        await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    except DBAPIError as exc:
+        # например, у пользователя миграций нет прав на CREATE EXTENSION
+        logger.warning("cannot create pg_trgm, skipping trigram index: %s", exc)
+        return
+    await create_index_concurrently(
+        conn,
+        "ix_wallets_name_trgm_active",
+        "wallets USING gin (name gin_trgm_ops) WHERE deleted_at IS NULL",
+    )
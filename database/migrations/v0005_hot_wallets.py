@@ -0,0 +1,29 @@
+# таблицы режима "горячих" кошельков: список горячих кошельков и шарды их баланса
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 5
+TRANSACTIONAL = True
+
+_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS hot_wallets (
+        wallet_id INTEGER PRIMARY KEY REFERENCES wallets(id) ON DELETE CASCADE,
+        shards SMALLINT NOT NULL,
+        created_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS wallet_balance_shards (
+        wallet_id INTEGER NOT NULL REFERENCES wallets(id) ON DELETE CASCADE,
+        shard SMALLINT NOT NULL,
+        delta NUMERIC(14, 2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (wallet_id, shard)
+    )
+    """,
+)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for sql in _STATEMENTS:
+        await conn.execute(text(sql))
@@ -0,0 +1,39 @@
+# свёртка доходов и расходов по дням и месяцам и отметка, до какой операции она посчитана.
+# сама свёртка не заполняется здесь: на большом леджере это долгая транзакция.
+# её досчитывает python -m scripts.refresh_rollups порциями, а до этого запросы
+# берут операции выше отметки прямо из transactions
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 6
+TRANSACTIONAL = True
+
+_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS transaction_rollups (
+        period VARCHAR(5) NOT NULL,
+        wallet_id INTEGER NOT NULL,
+        period_start DATE NOT NULL,
+        income NUMERIC(20, 2) NOT NULL DEFAULT 0,
+        expense NUMERIC(20, 2) NOT NULL DEFAULT 0,
+        income_count BIGINT NOT NULL DEFAULT 0,
+        expense_count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (period, wallet_id, period_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        name VARCHAR(50) PRIMARY KEY,
+        last_transaction_id BIGINT NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    INSERT INTO rollup_state (name, last_transaction_id) VALUES ('transactions', 0)
+    ON CONFLICT (name) DO NOTHING
+    """,
+)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for sql in _STATEMENTS:
+        await conn.execute(text(sql))
@@ -0,0 +1,46 @@
+# прогоны сверки балансов с леджером: параметры прогона, готовые чанки и расхождения
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 7
+TRANSACTIONAL = True
+
+_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS reconciliation_runs (
+        id SERIAL PRIMARY KEY,
+        started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        finished_at TIMESTAMP,
+        chunk_size INTEGER NOT NULL,
+        first_wallet_id INTEGER NOT NULL,
+        last_wallet_id INTEGER NOT NULL,
+        repair VARCHAR(10)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reconciliation_chunks (
+        run_id INTEGER NOT NULL REFERENCES reconciliation_runs(id) ON DELETE CASCADE,
+        chunk_start INTEGER NOT NULL,
+        checked INTEGER NOT NULL,
+        drifted INTEGER NOT NULL,
+        repaired INTEGER NOT NULL,
+        finished_at TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (run_id, chunk_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reconciliation_drifts (
+        run_id INTEGER NOT NULL REFERENCES reconciliation_runs(id) ON DELETE CASCADE,
+        wallet_id INTEGER NOT NULL,
+        balance NUMERIC(14, 2) NOT NULL,
+        ledger NUMERIC(20, 2) NOT NULL,
+        repaired BOOLEAN NOT NULL DEFAULT false,
+        PRIMARY KEY (run_id, wallet_id)
+    )
+    """,
+)
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for sql in _STATEMENTS:
+        await conn.execute(text(sql))
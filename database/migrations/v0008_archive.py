@@ -0,0 +1,49 @@
+# архив soft-deleted кошельков и операций и частичные индексы для поиска кандидатов
+# (см. wallets_archive/transactions_archive и Index(...) в database/database.py).
+# индексы по wallets/transactions строятся CONCURRENTLY, поэтому миграция не в транзакции
+from database.migrate import create_index_concurrently
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+VERSION = 8
+TRANSACTIONAL = False
+
+_STATEMENTS = (
+    """
+    CREATE TABLE IF NOT EXISTS wallets_archive (
+        id INTEGER PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        balance NUMERIC(14, 2) NOT NULL,
+        created_at TIMESTAMP NOT NULL,
+        deleted_at TIMESTAMP NOT NULL,
+        archived_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS transactions_archive (
+        id INTEGER PRIMARY KEY,
+        wallet_id INTEGER NOT NULL,
+        amount NUMERIC(12, 2) NOT NULL,
+        description VARCHAR(255),
+        created_at TIMESTAMP NOT NULL,
+        deleted_at TIMESTAMP,
+        archived_at TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+    """,
+    # таблица только что создана и пуста, CONCURRENTLY не нужен
+    "CREATE INDEX IF NOT EXISTS ix_transactions_archive_wallet_id ON transactions_archive (wallet_id)",
+)
+
+# имя индекса -> определение (без CREATE INDEX)
+_INDEXES = {
+    "ix_wallets_deleted_at": "wallets (deleted_at) WHERE deleted_at IS NOT NULL",
+    "ix_transactions_deleted_at": "transactions (deleted_at) WHERE deleted_at IS NOT NULL",
+    "ix_transactions_wallet_id_deleted": "transactions (wallet_id) WHERE deleted_at IS NOT NULL",
+}
+
+
+async def upgrade(conn: AsyncConnection) -> None:
+    for sql in _STATEMENTS:
+        await conn.execute(text(sql))
+    for name, definition in _INDEXES.items():
+        await create_index_concurrently(conn, name, definition)
@@ -1,3 +1,4 @@
+# устарело: колонку deleted_at теперь добавляет миграция database/migrations/v0001_baseline.py
 import asyncio
 from sqlalchemy import text
 
@@ -0,0 +1,69 @@
+# перенос soft-deleted кошельков и операций старше срока хранения в архивные таблицы
+# запуск: python -m scripts.archive                       - перенести всё, что старше 30 дней
+#         python -m scripts.archive --retention-days 90
+#         python -m scripts.archive --batch-size 500 --max-duty 0.2   - мягче под нагрузкой
+#         python -m scripts.archive --interval 3600       - запускать каждый час
+
+import argparse
+import asyncio
+import datetime
+from typing import Optional
+
+from app.repositories.archive import (
+    ARCHIVE_BATCH_SIZE,
+    ARCHIVE_MAX_DUTY,
+    ARCHIVE_MIN_PAUSE,
+    ARCHIVE_RETENTION,
+    ARCHIVE_WALLET_BATCH_SIZE,
+    ArchiveSummary,
+    run_archiver,
+)
+from database.database import dispose_engine, get_engine
+
+
+def progress(summary: ArchiveSummary) -> None:
+    if summary.batches % 100 == 0:
+        print(
+            f"{summary.batches} batch(es): {summary.transactions} transaction(s), "
+            f"{summary.wallets} wallet(s)",
+            flush=True,
+        )
+
+
+async def main(args: argparse.Namespace, interval: Optional[float]) -> None:
+    engine = get_engine()
+    try:
+        while True:
+            summary = await run_archiver(
+                engine,
+                retention=datetime.timedelta(days=args.retention_days),
+                batch_size=args.batch_size,
+                wallet_batch_size=args.wallet_batch_size,
+                max_duty=args.max_duty,
+                min_pause=args.min_pause,
+                on_batch=progress,
+            )
+            print(
+                f"archived {summary.transactions} transaction(s) and {summary.wallets} wallet(s) "
+                f"in {summary.batches} batch(es)",
+                flush=True,
+            )
+            if interval is None:
+                return
+            await asyncio.sleep(interval)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Архивация удалённых кошельков и операций")
+    parser.add_argument("--retention-days", type=float, default=ARCHIVE_RETENTION.days)
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--wallet-batch-size", type=int, default=ARCHIVE_WALLET_BATCH_SIZE)
+    parser.add_argument("--max-duty", type=float, default=ARCHIVE_MAX_DUTY)
+    parser.add_argument("--min-pause", type=float, default=ARCHIVE_MIN_PAUSE)
+    parser.add_argument("--interval", type=float, default=None)
+    args = parser.parse_args()
+    if not 0 < args.max_duty <= 1:
+        parser.error("--max-duty must be in (0, 1]")
+    asyncio.run(main(args, args.interval))
@@ -0,0 +1,99 @@
+# сравнение прежнего и быстрого пути ответа со списком кошельков на больших списках.
+# строки той же формы, что у wallets, берутся из generate_series (в БД ничего не пишется),
+# замеряется только преобразование строк в тело ответа
+# запуск: python -m scripts.bench_responses [--sizes 1000,10000,100000] [--repeat 5]
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import Any, Callable, List, Sequence
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from sqlalchemy import text
+
+from app.repositories.wallet_repository import WalletRepo
+from app.schemas import WalletResponse
+from app.serialization import dump_list, ndjson_chunks
+from database.database import get_engine
+
+_ROWS = text(
+    "SELECT g AS id, 'wallet ' || g AS name, (g % 100000)::numeric(12, 2) AS balance, "
+    "now()::timestamp AS created_at, NULL::timestamp AS deleted_at "
+    "FROM generate_series(1, :n) AS g"
+)
+_RESPONSE_FIELD = create_model_field(name="Response", type_=List[WalletResponse], mode="serialization")
+
+
+async def legacy_list(mappings: Sequence[Any]) -> bytes:
+    # прежний путь: dict(RowMapping) в репозитории, model_validate в обработчике,
+    # затем FastAPI проверяет ответ по response_model и отдаёт json.dumps
+    rows = [dict(row) for row in mappings]
+    items = [WalletResponse.model_validate(row) for row in rows]
+    content = await serialize_response(field=_RESPONSE_FIELD, response_content=items, is_coroutine=True)
+    return bytes(JSONResponse(content).body)
+
+
+async def fast_list(keys: list[str], tuples: Sequence[Any]) -> bytes:
+    return dump_list(WalletResponse, WalletRepo._rows_to_dicts(keys, tuples))
+
+
+async def legacy_ndjson(mappings: Sequence[Any]) -> bytes:
+    return b"".join(
+        WalletResponse.model_validate(dict(row)).model_dump_json().encode() + b"\n" for row in mappings
+    )
+
+
+async def fast_ndjson(keys: list[str], tuples: Sequence[Any]) -> bytes:
+    async def rows() -> Any:
+        for row in WalletRepo._rows_to_dicts(keys, tuples):
+            yield row
+
+    return b"".join([chunk async for chunk in ndjson_chunks(rows(), WalletResponse, 1000)])
+
+
+async def timed(fn: Callable[[], Any], repeat: int) -> tuple[float, bytes]:
+    times: list[float] = []
+    body = b""
+    for _ in range(repeat):
+        started = time.perf_counter()
+        body = await fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times), body
+
+
+async def main(sizes: list[int], repeat: int) -> None:
+    engine = get_engine()
+    for n in sizes:
+        async with engine.connect() as conn:
+            mappings = (await conn.execute(_ROWS, {"n": n})).mappings().all()
+            res = await conn.execute(_ROWS, {"n": n})
+            keys = list(res.keys())
+            tuples = res.all()
+
+        for label, legacy, fast in (
+            ("json list", lambda: legacy_list(mappings), lambda: fast_list(keys, tuples)),
+            ("ndjson", lambda: legacy_ndjson(mappings), lambda: fast_ndjson(keys, tuples)),
+        ):
+            legacy_time, legacy_body = await timed(legacy, repeat)
+            fast_time, fast_body = await timed(fast, repeat)
+            if label == "json list":
+                assert json.loads(legacy_body) == json.loads(fast_body), "bodies differ"
+            else:
+                assert legacy_body.splitlines() == fast_body.splitlines(), "bodies differ"
+            print(
+                f"{label:10} {n:>8} rows: legacy {legacy_time * 1000:8.1f}ms, "
+                f"fast {fast_time * 1000:8.1f}ms ({legacy_time / fast_time:.1f}x)"
+            )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сравнение путей сериализации списков кошельков")
+    parser.add_argument("--sizes", default="1000,10000,100000")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main([int(x) for x in args.sizes.split(",")], args.repeat))
@@ -0,0 +1,85 @@
+# нагрузочная проверка группового коммита пополнений: одни и те же пополнения
+# сначала по одному (транзакция на каждое), затем через TopupCoalescer
+# запуск: python -m scripts.bench_topups [--topups 5000] [--wallets 50] [--window 0.005] [--max-batch 1000]
+# в конце проверяется, что каждый кошелёк пополнен ровно на сумму своих пополнений
+
+import argparse
+import asyncio
+import random
+import time
+from decimal import Decimal
+from typing import Union
+
+from database.database import get_engine
+from app.repositories.topup_coalescer import TopupCoalescer
+from app.repositories.wallet_repository import WalletRepo
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def run(
+    label: str,
+    writer: Union[WalletRepo, TopupCoalescer],
+    repo: WalletRepo,
+    plan: list[tuple[int, int]],
+    ids: list[int],
+) -> None:
+    before = {wallet_id: (await repo.get_by_id(wallet_id) or {})["balance"] for wallet_id in ids}
+    expected: dict[int, Decimal] = {wallet_id: Decimal(0) for wallet_id in ids}
+    for wallet_id, amount in plan:
+        expected[wallet_id] += amount
+
+    latencies: list[float] = []
+
+    async def one(wallet_id: int, amount: int) -> None:
+        started = time.perf_counter()
+        assert await writer.update_balance_if_enough(wallet_id, amount) == 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(wallet_id, amount) for wallet_id, amount in plan))
+    elapsed = time.perf_counter() - started
+
+    for wallet_id in ids:
+        wallet = await repo.get_by_id(wallet_id)
+        assert wallet is not None
+        assert wallet["balance"] - before[wallet_id] == expected[wallet_id], f"wallet {wallet_id} mismatch"
+
+    print(f"{label}: {elapsed:.2f}s, {len(plan) / elapsed:.0f} topups/s, "
+          f"p50 {_percentile(latencies, 0.5) * 1000:.1f}ms, p99 {_percentile(latencies, 0.99) * 1000:.1f}ms")
+
+
+async def main(topups: int, wallet_count: int, window: float, max_batch: int, seed: int) -> None:
+    engine = get_engine()
+    repo = WalletRepo(engine)
+    ids = await repo.create_bulk(f"bench topup {i}" for i in range(wallet_count))
+
+    rnd = random.Random(seed)
+    plan = [(rnd.choice(ids), rnd.choice((1, 5, 10, 50))) for _ in range(topups)]
+
+    await run("direct", repo, repo, plan, ids)
+
+    coalescer = TopupCoalescer(repo, window=window, max_batch=max_batch)
+    coalescer.start()
+    await run(f"coalesced (window {window * 1000:g}ms)", coalescer, repo, plan, ids)
+    await coalescer.close()
+    stats = coalescer.stats()
+    print(f"batches: {stats['batches']}, avg batch: {stats['avg_batch']:.1f}")
+
+    for wallet_id in ids:
+        await repo.soft_delete(wallet_id)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка группового коммита пополнений")
+    parser.add_argument("--topups", type=int, default=5000)
+    parser.add_argument("--wallets", type=int, default=50)
+    parser.add_argument("--window", type=float, default=0.005)
+    parser.add_argument("--max-batch", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.topups, args.wallets, args.window, args.max_batch, args.seed))
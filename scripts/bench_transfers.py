@@ -0,0 +1,85 @@
+# нагрузочная проверка переводов: много одновременных переводов между несколькими "горячими" кошельками
+# запуск: python -m scripts.bench_transfers [--transfers 1000] [--wallets 5] [--isolation SERIALIZABLE]
+# в конце проверяется, что сумма балансов не изменилась
+
+import argparse
+import asyncio
+import random
+import time
+from decimal import Decimal
+
+from sqlalchemy.exc import DBAPIError
+
+from database.database import get_engine, get_settings, create_engine_from_settings
+from app.repositories.wallet_repository import InsufficientFunds, WalletRepo
+
+
+def _percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+async def main(transfers: int, wallet_count: int, isolation: str, seed: int) -> None:
+    engine = get_engine()
+    if isolation != "READ COMMITTED":
+        engine = create_engine_from_settings(get_settings()).execution_options(isolation_level=isolation)
+    repo = WalletRepo(engine)
+
+    ids = []
+    for i in range(wallet_count):
+        wallet = await repo.create(f"bench transfer {i}")
+        await repo.update_balance_if_enough(wallet["id"], 1000)
+        ids.append(wallet["id"])
+
+    rnd = random.Random(seed)
+    plan = []
+    for _ in range(transfers):
+        a, b = rnd.sample(ids, 2)
+        plan.append((a, b, rnd.choice((1, 5, 10, 50))))
+
+    latencies: list[float] = []
+    rejected = 0
+    failed = 0
+
+    async def one(a: int, b: int, amount: int) -> None:
+        nonlocal rejected, failed
+        started = time.perf_counter()
+        try:
+            await repo.transfer(a, b, amount, "bench")
+        except InsufficientFunds:
+            rejected += 1
+        except DBAPIError:
+            # повторы исчерпаны (TRANSFER_MAX_ATTEMPTS) - перевод откатился целиком
+            failed += 1
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(a, b, amount) for a, b, amount in plan))
+    elapsed = time.perf_counter() - started
+
+    total = Decimal(0)
+    for wallet_id in ids:
+        row = await repo.get_by_id(wallet_id)
+        assert row is not None
+        total += row["balance"]
+
+    print(f"isolation: {isolation}, wallets: {wallet_count}, transfers: {transfers}")
+    print(f"elapsed: {elapsed:.2f}s, throughput: {transfers / elapsed:.0f} transfers/s")
+    print(f"latency p50: {_percentile(latencies, 0.5) * 1000:.1f}ms, p99: {_percentile(latencies, 0.99) * 1000:.1f}ms")
+    print(f"insufficient funds: {rejected}, failed after retries: {failed}, retries: {repo.transfer_retries}")
+    print(f"balance sum: {total} (expected {1000 * wallet_count})")
+    assert total == 1000 * wallet_count, "money was created or lost"
+
+    for wallet_id in ids:
+        await repo.soft_delete(wallet_id)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Нагрузочная проверка переводов")
+    parser.add_argument("--transfers", type=int, default=1000)
+    parser.add_argument("--wallets", type=int, default=5)
+    parser.add_argument("--isolation", default="READ COMMITTED")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.transfers, args.wallets, args.isolation, args.seed))
@@ -1,11 +1,19 @@
 # создаем скрипт запуска кода для БД
 
 import asyncio
-from database.database import create_tables
+from database.database import create_tables, get_engine
+from app.repositories.wallet_stats import rebuild_wallet_stats
+
+
+async def _create() -> None:
+    await create_tables()
+    # строки wallet_stats (по одной на слот) появляются при пересчёте
+    async with get_engine().begin() as conn:
+        await rebuild_wallet_stats(conn)
 
 
 def main() -> None:
-    asyncio.run(create_tables())
+    asyncio.run(_create())
 
 
 if __name__ == "__main__":
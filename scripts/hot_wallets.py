@@ -0,0 +1,49 @@
+# режим горячих кошельков: пополнения расходятся по шардам, баланс - их сумма
+# запуск: python -m scripts.hot_wallets enable 42 --shards 8 - включить для кошелька 42
+#         python -m scripts.hot_wallets disable 42           - свернуть шарды и выключить
+#         python -m scripts.hot_wallets fold --interval 5    - сворачивать шарды каждые 5 секунд
+#         python -m scripts.hot_wallets fold                 - свернуть один раз
+
+import argparse
+import asyncio
+from typing import Optional
+
+from app.repositories.wallet_repository import WalletRepo
+from database.database import HOT_WALLET_SHARDS, dispose_engine, get_engine
+
+
+async def fold(repo: WalletRepo, interval: Optional[float]) -> None:
+    while True:
+        folded = await repo.fold_hot_wallets()
+        print(f"folded {folded} wallet(s)")
+        if interval is None:
+            return
+        await asyncio.sleep(interval)
+
+
+async def main(args: argparse.Namespace) -> None:
+    repo = WalletRepo(get_engine())
+    try:
+        if args.command == "enable":
+            ok = await repo.enable_hot_wallet(args.wallet_id, args.shards)
+            print("enabled" if ok else "wallet not found")
+        elif args.command == "disable":
+            ok = await repo.disable_hot_wallet(args.wallet_id)
+            print("disabled" if ok else "wallet is not hot")
+        else:
+            await fold(repo, args.interval)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Горячие кошельки")
+    commands = parser.add_subparsers(dest="command", required=True)
+    enable = commands.add_parser("enable")
+    enable.add_argument("wallet_id", type=int)
+    enable.add_argument("--shards", type=int, default=HOT_WALLET_SHARDS)
+    disable = commands.add_parser("disable")
+    disable.add_argument("wallet_id", type=int)
+    fold_cmd = commands.add_parser("fold")
+    fold_cmd.add_argument("--interval", type=float, default=None)
+    asyncio.run(main(parser.parse_args()))
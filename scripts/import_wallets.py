@@ -0,0 +1,48 @@
+# массовое создание кошельков из файла: одно имя на строку
+# запуск: python -m scripts.import_wallets names.txt
+#         python -m scripts.import_wallets names.txt --chunk-size 20000 --ids-out ids.txt
+
+import argparse
+import asyncio
+import time
+from typing import Iterator, Optional
+
+from app.repositories.wallet_repository import BULK_CREATE_CHUNK_SIZE, WalletRepo
+from database.database import dispose_engine, get_engine
+
+
+def read_names(path: str) -> Iterator[str]:
+    # файл читается построчно: миллионы имён не держим в памяти
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            name = line.strip()
+            if name:
+                yield name
+
+
+async def main(path: str, chunk_size: int, ids_out: Optional[str]) -> None:
+    repo = WalletRepo(get_engine())
+    started = time.perf_counter()
+
+    def progress(created: int) -> None:
+        elapsed = time.perf_counter() - started
+        print(f"created {created} wallets, {created / elapsed:.0f}/s")
+
+    try:
+        ids = await repo.create_bulk(read_names(path), chunk_size=chunk_size, on_progress=progress)
+    finally:
+        await dispose_engine()
+
+    if ids_out:
+        with open(ids_out, "w", encoding="utf-8") as f:
+            f.writelines(f"{wallet_id}\n" for wallet_id in ids)
+    print(f"done: {len(ids)} wallets in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Массовое создание кошельков из файла")
+    parser.add_argument("path")
+    parser.add_argument("--chunk-size", type=int, default=BULK_CREATE_CHUNK_SIZE)
+    parser.add_argument("--ids-out", default=None, help="куда записать id созданных кошельков")
+    args = parser.parse_args()
+    asyncio.run(main(args.path, args.chunk_size, args.ids_out))
@@ -0,0 +1,36 @@
+# применение миграций схемы БД
+# запуск: python -m scripts.migrate            - применить все новые миграции
+#         python -m scripts.migrate --target 2 - применить миграции до версии 2 включительно
+#         python -m scripts.migrate --status   - показать применённые и ожидающие
+
+import argparse
+import asyncio
+from typing import Optional
+
+from database.database import dispose_engine
+from database.migrate import migrate, status
+
+
+async def main(target: Optional[int], show_status: bool) -> None:
+    try:
+        if show_status:
+            for migration, applied in await status():
+                mark = "applied" if applied else "pending"
+                print(f"{migration.version:04d} {migration.name}: {mark}")
+            return
+
+        applied_now = await migrate(target=target)
+        for migration in applied_now:
+            print(f"applied {migration.version:04d} {migration.name}")
+        if not applied_now:
+            print("nothing to apply")
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Миграции схемы БД")
+    parser.add_argument("--target", type=int, default=None)
+    parser.add_argument("--status", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.target, args.status))
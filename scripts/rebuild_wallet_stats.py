@@ -0,0 +1,37 @@
+# пересчёт таблицы wallet_stats по wallets (восстановление после ручных правок в БД)
+# запуск: python -m scripts.rebuild_wallet_stats
+#         python -m scripts.rebuild_wallet_stats --stale-only              - только устаревшие максимумы слотов
+#         python -m scripts.rebuild_wallet_stats --stale-only --interval 60 - раз в минуту
+
+import argparse
+import asyncio
+from typing import Optional
+
+from app.repositories.wallet_repository import WalletRepo
+from database.database import dispose_engine, get_engine
+
+
+async def main(stale_only: bool, interval: Optional[float]) -> None:
+    repo = WalletRepo(get_engine())
+    try:
+        if not stale_only:
+            await repo.rebuild_stats()
+            print("count:", await repo.count())
+            print("avg:", await repo.avg_balance())
+            print("max_wallet:", await repo.max_balance_wallet())
+            return
+        while True:
+            print(f"refreshed {await repo.refresh_stale_max()} stale slot(s)", flush=True)
+            if interval is None:
+                return
+            await asyncio.sleep(interval)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Пересчёт статистики кошельков")
+    parser.add_argument("--stale-only", action="store_true")
+    parser.add_argument("--interval", type=float, default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.stale_only, args.interval))
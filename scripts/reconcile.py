@@ -0,0 +1,105 @@
+# сверка балансов кошельков с леджером (сумма не удалённых операций в transactions)
+# запуск: python -m scripts.reconcile run --concurrency 8             - новый прогон, только отчёт
+#         python -m scripts.reconcile run --repair balance --force    - wallets.balance := сумма леджера,
+#                                                                        если она больше (небезопасно, см. README)
+#         python -m scripts.reconcile run --repair ledger             - дописать корректирующие операции
+#         python -m scripts.reconcile resume 12 --concurrency 8       - продолжить прерванный прогон 12
+#         python -m scripts.reconcile report 12 --limit 50            - расхождения прогона 12
+
+import argparse
+import asyncio
+import dataclasses
+
+from app.repositories.reconciliation import (
+    RECONCILE_CHUNK_SIZE,
+    ChunkResult,
+    ReconcileRun,
+    RepairMode,
+    list_drifts,
+    load_run,
+    run_reconciliation,
+    start_run,
+    summarize,
+)
+from database.database import create_engine_from_settings, get_settings
+
+
+async def execute(args: argparse.Namespace, run: ReconcileRun) -> None:
+    total = len(run.chunk_starts())
+    done = 0
+
+    def progress(result: ChunkResult) -> None:
+        nonlocal done
+        done += 1
+        if result.drifted or done % 100 == 0:
+            print(
+                f"[{result.chunk_start}, {result.chunk_end}): checked {result.checked}, "
+                f"drifted {result.drifted}, repaired {result.repaired} ({done} chunk(s) this session)",
+                flush=True,
+            )
+
+    print(f"run {run.id}: wallets {run.first_wallet_id}..{run.last_wallet_id}, {total} chunk(s)", flush=True)
+    summary = await run_reconciliation(args.engine, run, args.concurrency, progress)
+    print(
+        f"run {summary.run_id}: {summary.chunks}/{summary.total_chunks} chunk(s), "
+        f"checked {summary.checked}, drifted {summary.drifted}, repaired {summary.repaired}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    # соединений ровно столько, сколько чанков идёт одновременно
+    settings = dataclasses.replace(get_settings(), pool_size=args.concurrency, max_overflow=0)
+    args.engine = create_engine_from_settings(settings)
+    try:
+        if args.command == "run":
+            repair = RepairMode(args.repair) if args.repair else None
+            await execute(args, await start_run(args.engine, args.chunk_size, repair, args.force))
+        elif args.command == "resume":
+            run = await load_run(args.engine, args.run_id)
+            if run is None:
+                print("run not found")
+                return
+            if run.repair == RepairMode.BALANCE and not args.force:
+                print("run repairs balances: pass --force to resume it")
+                return
+            await execute(args, run)
+        else:
+            run = await load_run(args.engine, args.run_id)
+            if run is None:
+                print("run not found")
+                return
+            summary = await summarize(args.engine, run)
+            state = "finished" if summary.finished else "unfinished"
+            print(
+                f"run {summary.run_id} ({state}): {summary.chunks}/{summary.total_chunks} chunk(s), "
+                f"checked {summary.checked}, drifted {summary.drifted}, repaired {summary.repaired}"
+            )
+            for row in await list_drifts(args.engine, args.run_id, args.limit):
+                print(
+                    f"wallet {row['wallet_id']}: balance {row['balance']}, ledger {row['ledger']}"
+                    f"{' (repaired)' if row['repaired'] else ''}"
+                )
+    finally:
+        await args.engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Сверка балансов кошельков с леджером")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_cmd = commands.add_parser("run")
+    run_cmd.add_argument("--chunk-size", type=int, default=RECONCILE_CHUNK_SIZE)
+    run_cmd.add_argument("--concurrency", type=int, default=4)
+    run_cmd.add_argument("--repair", choices=[mode.value for mode in RepairMode], default=None)
+    run_cmd.add_argument("--force", action="store_true")
+    resume_cmd = commands.add_parser("resume")
+    resume_cmd.add_argument("run_id", type=int)
+    resume_cmd.add_argument("--concurrency", type=int, default=4)
+    resume_cmd.add_argument("--force", action="store_true")
+    report_cmd = commands.add_parser("report")
+    report_cmd.add_argument("run_id", type=int)
+    report_cmd.add_argument("--limit", type=int, default=100)
+    report_cmd.set_defaults(concurrency=1)
+    args = parser.parse_args()
+    if args.command == "run" and args.repair == RepairMode.BALANCE.value and not args.force:
+        parser.error("--repair balance overwrites wallet balances; pass --force")
+    asyncio.run(main(args))
@@ -0,0 +1,32 @@
+# досчёт свёртки доходов и расходов (transaction_rollups) по новым операциям
+# запуск: python -m scripts.refresh_rollups                 - досчитать один раз
+#         python -m scripts.refresh_rollups --interval 60   - досчитывать каждые 60 секунд
+#         python -m scripts.refresh_rollups --batch-size 10000
+
+import argparse
+import asyncio
+from typing import Optional
+
+from app.repositories.transaction_repository import TransactionRepo
+from app.repositories.transaction_rollups import ROLLUP_BATCH_SIZE
+from database.database import dispose_engine, get_engine
+
+
+async def main(interval: Optional[float], batch_size: int) -> None:
+    repo = TransactionRepo(get_engine())
+    try:
+        while True:
+            print("rolled up to transaction id", await repo.refresh_rollups(batch_size))
+            if interval is None:
+                return
+            await asyncio.sleep(interval)
+    finally:
+        await dispose_engine()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Досчёт свёртки доходов и расходов")
+    parser.add_argument("--interval", type=float, default=None)
+    parser.add_argument("--batch-size", type=int, default=ROLLUP_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(main(args.interval, args.batch_size))
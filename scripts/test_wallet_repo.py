@@ -51,6 +51,16 @@ async def main():
 
     print("count (should exclude deleted):", await count_wallets(engine))
 
+    print("\n6) Unknown sort column is rejected")
+    # keys/items/get - методы ColumnCollection, а не колонки wallets
+    for order_by in ("keys", "items", "get", "no_such_column"):
+        try:
+            await search_wallets(engine, order_by=order_by)
+        except ValueError as exc:
+            print(order_by, "=>", exc)
+        else:
+            raise AssertionError(f"order_by={order_by!r} was accepted")
+
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,136 @@
+# проверка совпадения результатов WalletRepo (SQLAlchemy Core) и AsyncpgWalletRepo
+# запуск: python -m scripts.test_wallet_repo_parity (нужна БД из DATABASE_URL)
+
+import asyncio
+from typing import Any
+
+from sqlalchemy import func, select
+
+from database.database import STATS_SLOTS, engine, wallet_stats, wallets
+from app.repositories.wallet_repository import WalletRepo
+from app.repositories.wallet_repository_asyncpg import AsyncpgWalletRepo
+from app.repositories.wallet_stats import stats_slot
+
+
+def _without_identity(row: dict[str, Any] | None) -> dict[str, Any] | None:
+    # у пары кошельков для записи разные id и created_at, сравниваем остальное
+    if row is None:
+        return None
+    return {k: v for k, v in row.items() if k not in ("id", "created_at")}
+
+
+async def _slot_stats(wallet_id: int) -> dict[str, Any]:
+    # строка wallet_stats слота кошелька и то, что в ней должно быть по wallets
+    slot = stats_slot(wallet_id)
+    async with engine.connect() as conn:
+        row = (
+            await conn.execute(select(wallet_stats).where(wallet_stats.c.slot == slot))
+        ).mappings().one()
+        in_slot = (wallets.c.id % STATS_SLOTS == slot) & wallets.c.deleted_at.is_(None)
+        count, total = (
+            await conn.execute(
+                select(func.count(), func.coalesce(func.sum(wallets.c.balance), 0)).where(in_slot)
+            )
+        ).one()
+        top = (
+            await conn.execute(
+                select(wallets.c.balance, wallets.c.id)
+                .where(in_slot)
+                .order_by(wallets.c.balance.desc(), wallets.c.id.desc())
+                .limit(1)
+            )
+        ).one_or_none()
+    assert (row["active_count"], row["balance_sum"]) == (count, total), ("wallet_stats", dict(row))
+    if not row["max_stale"]:
+        assert (row["max_balance"], row["max_wallet_id"]) == (tuple(top) if top else (None, None)), (
+            "wallet_stats max", dict(row), top,
+        )
+    return dict(row)
+
+
+def _stats_change(before: dict[str, Any], after: dict[str, Any]) -> tuple[Any, Any]:
+    return after["active_count"] - before["active_count"], after["balance_sum"] - before["balance_sum"]
+
+
+async def check_reads(core: WalletRepo, fast: WalletRepo, wallet_ids: list[int]) -> None:
+    # чтения: одни и те же кошельки через обе реализации
+    for wid in wallet_ids + [-1]:
+        for include_deleted in (False, True):
+            assert await core.exists(wid, include_deleted) == await fast.exists(wid, include_deleted), (
+                "exists", wid, include_deleted,
+            )
+            assert await core.get_by_id(wid, include_deleted) == await fast.get_by_id(wid, include_deleted), (
+                "get_by_id", wid, include_deleted,
+            )
+    print("reads: ok")
+
+
+async def check_writes(core: WalletRepo, fast: WalletRepo) -> None:
+    # записи: одинаковая последовательность операций на двух новых кошельках
+    a = await core.create("Parity write")
+    b = await core.create("Parity write")
+
+    steps: list[tuple[str, tuple[Any, ...]]] = [
+        ("update_balance_if_enough", (100,)),
+        ("update_balance_if_enough", (-30.5,)),
+        ("update_balance_if_enough", (-1_000_000,)),
+        ("update_balance_if_enough", (0.01,)),
+        ("update_name", ("Parity renamed",)),
+    ]
+    # wallet_stats: asyncpg-реализация обновляет слот своим CTE, а не WalletStatsDelta.
+    # слоты a и b разные, поэтому сравниваем изменение слота и его согласованность с wallets
+    await core.rebuild_stats()
+    for method, args in steps:
+        stats_a = await _slot_stats(a["id"])
+        res_core = await getattr(core, method)(a["id"], *args)
+        change_core = _stats_change(stats_a, await _slot_stats(a["id"]))
+        stats_b = await _slot_stats(b["id"])
+        res_fast = await getattr(fast, method)(b["id"], *args)
+        change_fast = _stats_change(stats_b, await _slot_stats(b["id"]))
+        assert res_core == res_fast, (method, args, res_core, res_fast)
+        assert change_core == change_fast, ("wallet_stats", method, args, change_core, change_fast)
+        assert _without_identity(await core.get_by_id(a["id"])) == _without_identity(
+            await fast.get_by_id(b["id"])
+        ), (method, args)
+
+    # после soft delete обе реализации не должны видеть и менять кошелёк
+    await core.soft_delete(a["id"])
+    await core.soft_delete(b["id"])
+    for method, args in steps:
+        stats_a, stats_b = await _slot_stats(a["id"]), await _slot_stats(b["id"])
+        res_core = await getattr(core, method)(a["id"], *args)
+        res_fast = await getattr(fast, method)(b["id"], *args)
+        assert res_core == res_fast == 0, (method, args, res_core, res_fast)
+        assert stats_a == await _slot_stats(a["id"]) and stats_b == await _slot_stats(b["id"]), (
+            "wallet_stats", method, args,
+        )
+    assert await core.update_name(a["id"], "x", include_deleted=True) == await fast.update_name(
+        b["id"], "x", include_deleted=True
+    )
+
+    await core.hard_delete(a["id"], include_deleted=True)
+    await core.hard_delete(b["id"], include_deleted=True)
+    print("writes: ok")
+
+
+async def main() -> None:
+    core = WalletRepo(engine)
+    fast = AsyncpgWalletRepo(engine)
+
+    await core.create_batch(["Parity A", "Parity B"])
+    wallets = await core.search(name_part="Parity ")
+    wallet_ids = [w["id"] for w in wallets]
+    await core.update_balance_if_enough(wallet_ids[0], 12.34)
+    await core.soft_delete(wallet_ids[1])
+
+    await check_reads(core, fast, wallet_ids)
+    await check_writes(core, fast)
+
+    for wid in wallet_ids:
+        await core.hard_delete(wid, include_deleted=True)
+    await engine.dispose()
+    print("parity: ok")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())